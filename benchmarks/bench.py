@@ -0,0 +1,241 @@
+"""randofetch benchmarks.
+
+Runs without fastfetch, chafa, etc. installed: stub fetcher executables are written to
+a temporary PATH, with a configurable sleep, output size and failure rate, and
+synthetic image libraries of increasing size are generated in a temporary XDG home.
+
+    python benchmarks/bench.py --sizes 10 100 1000 10000 --out bench.json
+
+Results are written as JSON (one record per benchmark and library size) so that runs
+from different releases can be compared.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+STUB = """#!/bin/sh
+sleep {sleep}
+head -c {size} /dev/zero | tr '\\0' '#'
+r=$(od -An -N2 -tu2 /dev/urandom | tr -d ' ')
+[ $((r % 100)) -ge {fail_pct} ] || exit 1
+exit 0
+"""
+
+FETCHERS_YAML = """fetchers:
+  - !Fetcher
+    name: uwufetch_base
+    args:
+    extra_reqs: null
+    path: uwufetch
+    needs_image: False
+  - !Fetcher
+    name: hyfetch
+    args:
+      - -m rgb
+    extra_reqs: fastfetch
+    path: hyfetch
+    needs_image: False
+  - !Fetcher
+    name: fastfetch
+    args:
+      - --disable-linewrap false
+    path: fastfetch
+    needs_image: True
+image_methods:
+  chafa:
+    caller: fastfetch
+    args:
+      - --chafa
+      - {}
+  sixel:
+    caller: fastfetch
+    args:
+      - --sixel
+      - {}
+  iterm:
+    caller: fastfetch
+    args:
+      - --iterm
+      - {}
+"""
+
+
+def make_stubs(bin_dir: Path, sleep: float, size: int, fail_pct: int):
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("fastfetch", "uwufetch", "hyfetch"):
+        exe = bin_dir / name
+        exe.write_text(STUB.format(sleep=sleep, size=size, fail_pct=fail_pct))
+        exe.chmod(0o755)
+
+
+def make_home(root: Path, n_images: int) -> dict:
+    env = {
+        "HOME": str(root),
+        "XDG_CONFIG_HOME": str(root / "config"),
+        "XDG_DATA_HOME": str(root / "data"),
+    }
+    cfg = root / "config" / "randofetch"
+    data = root / "data" / "randofetch"
+    cfg.mkdir(parents=True)
+    data.mkdir(parents=True)
+    (cfg / "fetchers.yaml").write_text(FETCHERS_YAML)
+    for i in range(n_images):
+        (data / f"img{i:05d}.png").write_bytes(os.urandom(1024))
+    return env
+
+
+def timed(fn, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "max": max(runs),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
+
+
+def bench_size(n_images: int, args) -> list[dict]:
+    from randofetch.cli.config import BaseConfig
+    from randofetch.cli.fetcher import FetcherSet, init_fetcher_list, init_image_list
+    from randofetch.cli.index import load_index
+    from randofetch.cli.pick import pick_cmd
+
+    results = []
+
+    def add(name, stats, **extra):
+        results.append({"bench": name, "images": n_images, **extra, "seconds": stats})
+
+    with tempfile.TemporaryDirectory(prefix="randofetch-bench-") as tmp:
+        env = make_home(Path(tmp), n_images)
+        os.environ.update(env)
+        repeat = args.repeat
+
+        add("base_config", timed(BaseConfig, repeat))
+        config = BaseConfig()
+
+        with quiet():
+            fl_stats = timed(lambda: init_fetcher_list(config), repeat)
+            fetcher_list = init_fetcher_list(config)
+        add("init_fetcher_list", fl_stats)
+
+        # What a scan does with the library: search the image folders, hash the files
+        # the image index does not know yet, and make the thumbnails fetchers get.
+        def refresh_images():
+            with quiet():
+                config.images(refresh=True)
+                return init_image_list(config)
+
+        def cold_images():
+            (config.app_config_path() / config.image_index_name).unlink(missing_ok=True)
+            shutil.rmtree(config.thumb_cache_path(), ignore_errors=True)
+            return refresh_images()
+
+        add("images_cold", timed(cold_images, repeat))
+        images = refresh_images()
+        add("images_warm", timed(refresh_images, repeat))
+
+        def scan():
+            with quiet():
+                return FetcherSet(
+                    reset=True,
+                    save_file=config.fset_save_file,
+                    fetcher_list=fetcher_list,
+                    max_time=config.fetch_max_latency,
+                    sources=config.scan_sources,
+                    workers=args.workers,
+                    images=images,
+                )
+
+        add("scan", timed(scan, max(1, repeat // 3)), fetchers=len(fetcher_list))
+        fetcher_set = scan()
+
+        save_file = Path(tmp) / "bench.idx"
+        save = lambda: fetcher_set.save(save_file, config.scan_sources)
+        add("save", timed(save, repeat))
+        add("load", timed(lambda: load_index(save_file), repeat))
+        add("load_set", timed(lambda: load_index(config.fset_save_file), repeat))
+        add(
+            "pick",
+            timed(lambda: pick_cmd(str(config.fset_save_file)), repeat * 100),
+        )
+
+        cli_env = dict(os.environ, **env)
+        cli = [sys.executable, "-m", "randofetch"]
+        run_cli = lambda: subprocess.run(cli, env=cli_env, capture_output=True)
+        add("cli_startup", timed(run_cli, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sleep", type=float, default=0.01, help="Stub run time")
+    parser.add_argument("--output-size", type=int, default=2048, help="Stub bytes")
+    parser.add_argument("--fail-rate", type=int, default=0, help="Stub failure %%")
+    parser.add_argument("--out", type=Path, default=None, help="JSON output file")
+    args = parser.parse_args()
+
+    from randofetch.__about__ import __version__
+
+    with tempfile.TemporaryDirectory(prefix="randofetch-bin-") as bin_tmp:
+        bin_dir = Path(bin_tmp)
+        make_stubs(bin_dir, args.sleep, args.output_size, args.fail_rate)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+        results = []
+        for n in args.sizes:
+            size_results = bench_size(n, args)
+            results.extend(size_results)
+            for r in size_results:
+                print(
+                    f"{r['bench']:>18} {n:>6} images  "
+                    f"median {r['seconds']['median'] * 1000:9.3f} ms",
+                    file=sys.stderr,
+                )
+
+    report = {
+        "randofetch": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "stub": {
+            "sleep": args.sleep,
+            "output_size": args.output_size,
+            "fail_rate": args.fail_rate,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,6 @@
 import sys
 
 if __name__ == "__main__":
-    from randofetch.cli import randofetch
+    from randofetch.cli import main
 
-    sys.exit(randofetch())
+    sys.exit(main())
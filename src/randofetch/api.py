@@ -0,0 +1,258 @@
+# SPDX-FileCopyrightText: 2024-present Mark Plagge <mplagge@sandia.gov>
+#
+# SPDX-License-Identifier: MIT
+"""randofetch as a library, e.g. for a login banner or MOTD service.
+
+    from randofetch import api
+
+    entry = api.pick(term_size=(120, 40))
+    banner = await api.render(term_size=(120, 40), env={"TERM": "xterm-256color"})
+
+Nothing here prints, prompts, exits or scans. Both use the fetcher set saved by the
+last `randofetch --scan` (even if fetchers.yaml changed since) and return None or b""
+when there is none. The set is reopened when a scan replaces it. Terminal features
+are taken from the capabilities randofetch last detected for the terminal env
+describes, or guessed from env; the terminal is never queried.
+
+render() returns a fetcher's output as bytes, from the render cache when possible.
+Concurrent renders of the same command for the same terminal size and type share one
+fetcher process, and at most max_concurrency fetchers run at once, so a burst of
+logins does not fork a process per login. Run times are recorded in the latency stats
+and renders are stored in the render cache, as with `randofetch show`.
+
+The module functions use one shared Renderer with the default settings; create a
+Renderer for other settings.
+"""
+import asyncio
+import os
+import weakref
+from pathlib import Path
+
+from randofetch.cli import caps
+from randofetch.cli.config import BaseConfig
+from randofetch.cli.fetcher import Pick
+from randofetch.cli.index import CommandIndex, load_index
+from randofetch.cli.pick import config_dir, data_dir
+from randofetch.cli.procs import kill_group
+from randofetch.cli.render import KEY_ENV, RenderCache
+from randofetch.cli.stats import LatencyStats
+
+__all__ = ["Pick", "Renderer", "pick", "render"]
+
+
+class Renderer:
+    def __init__(
+        self,
+        save_file: str | Path | None = None,
+        max_concurrency: int | None = None,
+        deadline: float | None = None,
+        cache: RenderCache | None = None,
+        stats: LatencyStats | None = None,
+        max_latency: float | None = None,
+    ):
+        """
+        :param save_file: The saved fetcher set. Defaults to the one `randofetch` uses.
+        :param max_concurrency: Fetchers run at once. Defaults to
+        BaseConfig.scan_workers.
+        :param deadline: Seconds before a fetcher is killed and b"" is returned.
+        Defaults to BaseConfig.run_deadline.
+        :param cache: Render cache. Defaults to the one `randofetch show` uses.
+        :param stats: Latency stats, to skip fetchers that have been slow. Defaults to
+        the ones `randofetch` uses.
+        :param max_latency: Latency budget for stats. Defaults to
+        BaseConfig.fetch_max_latency.
+        """
+        config = config_dir()
+        save_file = save_file or os.path.join(config, BaseConfig.fetcher_save_name)
+        self.save_file = str(save_file)
+        self.max_concurrency = max(1, max_concurrency or BaseConfig.scan_workers)
+        self.deadline = BaseConfig.run_deadline if deadline is None else deadline
+        if cache is None:
+            cache = RenderCache(
+                os.path.join(data_dir(), BaseConfig.render_cache_name),
+                ttl=BaseConfig.render_cache_ttl,
+                max_bytes=BaseConfig.render_cache_max_bytes,
+                compress=BaseConfig.render_cache_compress,
+            )
+        if stats is None:
+            stats = LatencyStats(os.path.join(config, BaseConfig.latency_stats_name))
+        self.cache = cache
+        self.stats = stats
+        self.max_latency = max_latency or BaseConfig.fetch_max_latency
+        self.caps_file = os.path.join(config, BaseConfig.term_caps_name)
+        self._index: CommandIndex | None = None
+        self._save_id: tuple[int, int, int] | None = None
+        # Per event loop, so a Renderer can be used from several asyncio.run() calls.
+        self._limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._running: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def index(self) -> CommandIndex | None:
+        """The saved set, reopened if it was replaced since it was last opened."""
+        try:
+            st = os.stat(self.save_file)
+            save_id = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            save_id = None
+        if save_id != self._save_id:
+            self._index = load_index(self.save_file, check_sources=False)
+            self._save_id = save_id
+        return self._index
+
+    def features(self, env=None) -> frozenset[str]:
+        found = caps.cached(self.caps_file, env)
+        return found.features if found else frozenset(caps.env_features(env))
+
+    def pick(
+        self,
+        term_size: tuple[int, int] | None = None,
+        env: dict[str, str] | None = None,
+        features=None,
+    ) -> Pick | None:
+        """A random entry of the saved set for a terminal, or None if there is none.
+
+        :param term_size: (columns, lines). Fetchers whose output was measured to be
+        larger are skipped. With None, any size goes.
+        :param env: The terminal's environment (TERM, COLORTERM, ...). Defaults to
+        this process's.
+        :param features: Terminal features (see randofetch.cli.caps). Defaults to the
+        ones known for env.
+        """
+        index = self.index()
+        if index is None:
+            return None
+        if features is None:
+            features = self.features(env)
+        rows = index.fitting_rows(term_size or (0, 0), index.supported_rows(features))
+        accept = self.stats.acceptor(
+            index,
+            self.max_latency,
+            BaseConfig.latency_min_samples,
+            BaseConfig.latency_explore,
+        )
+        i = index.random_entry(accept, rows=rows)
+        if i is None:
+            return None
+        return Pick(index[i], index.get(i, "image"), index.argv(i), index.fetcher(i))
+
+    async def render(
+        self,
+        term_size: tuple[int, int] = (80, 24),
+        env: dict[str, str] | None = None,
+        entry: Pick | None = None,
+    ) -> bytes:
+        """The output of entry, or of a random pick for the terminal, as bytes. b"" if
+        there is nothing to pick or the fetcher failed or missed the deadline.
+
+        :param term_size: (columns, lines), given to the fetcher as COLUMNS and LINES.
+        :param env: The terminal's environment, added to this process's for the
+        fetcher.
+        """
+        env = dict(os.environ, **(env or {}))
+        if entry is None:
+            entry = self.pick(term_size, env)
+            if entry is None:
+                return b""
+        loop = asyncio.get_running_loop()
+        running = self._running.setdefault(loop, {})
+        key = (entry.cmd, tuple(term_size), *(env.get(k, "") for k in KEY_ENV))
+        task = running.get(key)
+        if task is None:
+            task = running[key] = loop.create_task(self._render(entry, term_size, env))
+            task.add_done_callback(lambda _: running.pop(key, None))
+        # A caller that is cancelled does not cancel the render for the others.
+        return await asyncio.shield(task)
+
+    async def _render(self, entry: Pick, term_size: tuple[int, int], env) -> bytes:
+        # The cache key hashes the image file; neither it nor the read belongs on the
+        # caller's event loop.
+        key = await asyncio.to_thread(
+            self.cache.key, entry.cmd, entry.image, term_size, env
+        )
+        data = await asyncio.to_thread(self.cache.get, key)
+        if data is not None:
+            return data
+        loop = asyncio.get_running_loop()
+        limit = self._limits.get(loop)
+        if limit is None:
+            limit = self._limits[loop] = asyncio.Semaphore(self.max_concurrency)
+        cols, rows = term_size
+        run_env = dict(env, COLUMNS=str(cols), LINES=str(rows))
+        async with limit:
+            start = loop.time()
+            data = await _run(entry, run_env, self.deadline)
+            seconds = loop.time() - start
+        fetcher = entry.fetcher or entry.cmd
+        await asyncio.to_thread(self._save, fetcher, key, data, seconds)
+        return data or b""
+
+    def _save(self, fetcher: str, key: str, data: bytes | None, seconds: float):
+        self.stats.record(fetcher, float("inf") if data is None else seconds)
+        self.stats.save()
+        if data:
+            self.cache.put(key, data)
+
+
+async def _run(entry: Pick, env: dict[str, str], deadline: float) -> bytes | None:
+    """stdout of entry, or None if it could not be run, failed, or missed deadline,
+    in which case it is killed with everything it started."""
+    devnull, pipe = asyncio.subprocess.DEVNULL, asyncio.subprocess.PIPE
+    try:
+        if entry.argv:
+            p = await asyncio.create_subprocess_exec(
+                *entry.argv,
+                stdin=devnull,
+                stdout=pipe,
+                stderr=devnull,
+                env=env,
+                start_new_session=True,
+            )
+        else:
+            p = await asyncio.create_subprocess_shell(
+                entry.cmd,
+                stdin=devnull,
+                stdout=pipe,
+                stderr=devnull,
+                env=env,
+                start_new_session=True,
+            )
+    except OSError:
+        return None
+    try:
+        out, _ = await asyncio.wait_for(p.communicate(), deadline)
+    except asyncio.TimeoutError:
+        kill_group(p)
+        await p.wait()
+        return None
+    except asyncio.CancelledError:
+        kill_group(p)
+        raise
+    return out if p.returncode == 0 else None
+
+
+_default: Renderer | None = None
+
+
+def _renderer() -> Renderer:
+    global _default
+    if _default is None:
+        _default = Renderer()
+    return _default
+
+
+def pick(
+    term_size: tuple[int, int] | None = None,
+    env: dict[str, str] | None = None,
+    features=None,
+) -> Pick | None:
+    """A random entry of the saved set for a terminal. See Renderer.pick."""
+    return _renderer().pick(term_size, env, features)
+
+
+async def render(
+    term_size: tuple[int, int] = (80, 24),
+    env: dict[str, str] | None = None,
+    entry: Pick | None = None,
+) -> bytes:
+    """A render for a terminal, sharing fetcher runs with concurrent calls. See
+    Renderer.render."""
+    return await _renderer().render(term_size, env, entry)
@@ -0,0 +1,88 @@
+"""Safe concurrent writes of randofetch's state files.
+
+Many shells can start randofetch at once (e.g. when tmux restores a session), while
+one of them is rescanning. Every state file (the saved fetcher set, the image index,
+the config copy and its compiled cache, render caches, stats) is therefore written to a
+temporary file in the same folder and renamed over the old one: readers see either the
+old or the new file, never a partial one, and never wait.
+
+Writers that rebuild a file (a scan) or read-modify-write it (stats) also hold an
+advisory lock on <file>.lock while they do, so only one of them writes at a time.
+Readers never take the lock.
+"""
+import os
+from _thread import get_ident
+
+
+def tmp_path(path: str | os.PathLike) -> str:
+    """A temporary file next to path, unique to this process and thread."""
+    head, name = os.path.split(os.fspath(path))
+    return os.path.join(head, f".{name}.{os.getpid()}.{get_ident()}.tmp")
+
+
+def write_atomic(path: str | os.PathLike, data: bytes):
+    tmp = tmp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class WriterLock:
+    """Advisory lock for the writers of path, held on path + ".lock".
+
+        with WriterLock(save_file, blocking=False) as lock:
+            if lock.acquired:
+                ...
+
+    Blocking locks wait for the current writer; non-blocking ones report whether the
+    lock was free in `acquired`."""
+
+    def __init__(self, path: str | os.PathLike, blocking: bool = True):
+        self.lock_file = os.fspath(path) + ".lock"
+        self.blocking = blocking
+        self.acquired = False
+        self._fd: int | None = None
+
+    def __enter__(self):
+        import fcntl
+
+        self._fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        flags = fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._fd, flags)
+            self.acquired = True
+        except BlockingIOError:
+            self.acquired = False
+        return self
+
+    def __exit__(self, *exc):
+        # Closing the descriptor releases the lock.
+        os.close(self._fd)
+        self._fd = None
+        self.acquired = False
+
+
+def is_locked(path: str | os.PathLike) -> bool:
+    """Whether a writer currently holds the lock of path. False if there is no lock
+    file (yet), e.g. before the first scan created the config folder."""
+    import fcntl
+
+    try:
+        fd = os.open(os.fspath(path) + ".lock", os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        # Closing the descriptor releases the lock, if it was taken here.
+        os.close(fd)
+    return False
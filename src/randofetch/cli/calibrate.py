@@ -0,0 +1,257 @@
+"""Latency calibration of fetcher commands during a scan.
+
+A scan first checks that each fetcher binary exists, then runs the real command of
+every fetcher x image method combination (with a library image for image methods) a
+few times: `warmups` untimed runs to fill disk and font caches, then `trials` timed
+ones. A combination is admitted when the `percentile` of its trials is within the
+latency budget, so one slow cold start or one lucky run does not decide it.
+
+Each run's wall time and CPU time (user + system, of the fetcher and the processes it
+waited for) are recorded. A fetcher whose wall time is far above its CPU time spends it
+waiting (on disk, the network, the terminal); one whose CPU time is close to it is slow
+because of work and gets slower on a loaded machine.
+
+The output of the first run is kept to measure how many columns and lines it takes on
+a terminal (see output_size), so picks can skip fetchers that do not fit the current
+one without running them. The logo an image method draws follows the image's aspect
+ratio, so those are also run once on `size_images` - 1 more library images, and the
+largest size is kept for all of the row's images (see measure_size).
+
+The resulting profiles are saved as columns of the command index (see
+Profile.columns), where the latency stats use them until enough real runs have been
+observed (see randofetch.cli.stats), and picks use the output size (see
+CommandIndex.fitting_rows).
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+import unicodedata
+from typing import NamedTuple
+
+from randofetch.cli.procs import kill_group
+from randofetch.cli.trace import percentile
+
+
+class Calibration(NamedTuple):
+    warmups: int = 1
+    trials: int = 5
+    percentile: float = 95
+    # Combinations measured at once. Runs compete for the CPU, so this defaults to
+    # half the cores rather than the number of probes.
+    workers: int | None = None
+    # Library images an image method's output size is measured on, spread over the
+    # library. Images that are not measured may still draw a larger logo.
+    size_images: int = 4
+
+    @property
+    def n_workers(self) -> int:
+        return self.workers or max(1, (os.cpu_count() or 2) // 2)
+
+
+# Index columns holding a Profile, one value per row.
+COLUMNS = ("trials", "min", "p50", "p95", "cpu", "width", "height")
+
+
+class Profile(NamedTuple):
+    """Latency of one combination over its timed trials, in seconds, and the size of
+    its output in terminal cells. p95 holds the calibration percentile, which is the
+    95th unless configured otherwise."""
+
+    trials: int
+    min: float
+    p50: float
+    p95: float
+    cpu: float
+    width: int = 0
+    height: int = 0
+
+    @staticmethod
+    def columns(profiles: list["Profile | None"]) -> dict[str, list[str | None]]:
+        """profiles as write_index columns."""
+        columns: dict[str, list[str | None]] = {name: [] for name in COLUMNS}
+        for p in profiles:
+            for name in COLUMNS:
+                columns[name].append(None if p is None else str(getattr(p, name)))
+        return columns
+
+    @classmethod
+    def from_row(cls, index, r: int) -> "Profile | None":
+        """The profile saved for row r of a CommandIndex, if it has one."""
+        values = [index.row_get(r, name) for name in COLUMNS]
+        if None in values:
+            return None
+        trials, width, height = int(values[0]), int(values[5]), int(values[6])
+        low, p50, p95, cpu = map(float, values[1:5])
+        return cls(trials, low, p50, p95, cpu, width, height)
+
+
+# Escape sequences and the text between them. Strings (DCS, OSC, APC and friends)
+# carry sixel and kitty images, titles and hyperlinks; they do not move the cursor.
+_TOKENS = re.compile(
+    r"\x1b\[(?P<params>[0-?]*)[ -/]*(?P<csi>[@-~])"
+    r"|\x1b[P\]X^_].*?(?:\x07|\x1b\\|\Z)"
+    r"|\x1b(?P<esc>[ -/]*[0-~])?"
+    r"|(?P<ctl>[\x00-\x1f\x7f])"
+    r"|(?P<text>[^\x00-\x1f\x7f\x1b]+)",
+    re.S,
+)
+
+
+def _cell_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    width = 0
+    for ch in text:
+        if unicodedata.combining(ch) or unicodedata.category(ch) in ("Mn", "Me", "Cf"):
+            continue
+        width += 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+    return width
+
+
+def output_size(output: bytes) -> tuple[int, int]:
+    """(columns, lines) that output covers on a terminal wide enough not to wrap it.
+
+    Cursor movements are followed, since fetchers draw their logo first and then move
+    back up beside it to write the system information. Images sent with a graphics
+    protocol (sixel, kitty, iTerm) are not counted; only text, including the blocks
+    chafa draws images with.
+    """
+    col = row = width = height = 0
+    saved = (0, 0)
+    for m in _TOKENS.finditer(output.decode("utf-8", "replace")):
+        text, csi, esc, ctl = m["text"], m["csi"], m["esc"], m["ctl"]
+        if text:
+            col += _cell_width(text)
+            width, height = max(width, col), max(height, row + 1)
+        elif csi:
+            params = m["params"]
+            if params.startswith(("?", ">", "<", "=")):
+                continue
+            nums = [int(p) if p.isdigit() else 0 for p in params.split(";")]
+            n = max(1, nums[0])
+            if csi == "A":
+                row = max(0, row - n)
+            elif csi in "BE":
+                row, col = row + n, col if csi == "B" else 0
+            elif csi == "F":
+                row, col = max(0, row - n), 0
+            elif csi == "C":
+                col += n
+            elif csi == "D":
+                col = max(0, col - n)
+            elif csi == "G":
+                col = n - 1
+            elif csi == "d":
+                row = n - 1
+            elif csi in "Hf":
+                row, col = n - 1, max(1, nums[1] if len(nums) > 1 else 1) - 1
+            elif csi == "s":
+                saved = (row, col)
+            elif csi == "u":
+                row, col = saved
+        elif esc == "7":
+            saved = (row, col)
+        elif esc == "8":
+            row, col = saved
+        elif ctl == "\n":
+            row, col = row + 1, 0
+        elif ctl == "\r":
+            col = 0
+        elif ctl == "\t":
+            col = (col // 8 + 1) * 8
+        elif ctl == "\b":
+            col = max(0, col - 1)
+    return width, height
+
+
+def run_timed(
+    args: list[str] | str,
+    shell: bool = False,
+    timeout: float | None = None,
+    output: bool = False,
+) -> tuple[float, float, bytes | None] | None:
+    """(wall, cpu, output) of one run of a command, or None if it could not be
+    started, failed, or was killed after timeout seconds. Times are in seconds. The
+    output is only kept with output, and discarded otherwise."""
+    start = time.perf_counter()
+    sink = subprocess.PIPE if output else subprocess.DEVNULL
+    try:
+        p = subprocess.Popen(
+            args,
+            shell=shell,
+            stdin=subprocess.DEVNULL,
+            stdout=sink,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        )
+    except OSError:
+        return None
+    expired = threading.Event()
+
+    def kill():
+        expired.set()
+        kill_group(p)
+
+    if timeout is not None:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    out = None
+    if p.stdout is not None:
+        with p.stdout:
+            out = p.stdout.read()
+    if timeout is not None:
+        if hasattr(os, "waitid"):
+            # Wait without reaping, so the timer cannot kill a reused process group.
+            os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOWAIT)
+        timer.cancel()
+        timer.join()
+    # wait4 rather than Popen.wait, for the rusage of this child alone.
+    _, status, usage = os.wait4(p.pid, 0)
+    wall = time.perf_counter() - start
+    p.returncode = os.waitstatus_to_exitcode(status)
+    if expired.is_set() or p.returncode != 0:
+        return None
+    return wall, usage.ru_utime + usage.ru_stime, out
+
+
+def measure_size(
+    args: list[str] | str, shell: bool = False, timeout: float | None = None
+) -> tuple[int, int] | None:
+    """output_size of one run of a command, or None if it failed or timed out."""
+    r = run_timed(args, shell, timeout, output=True)
+    return None if r is None else output_size(r[2] or b"")
+
+
+def measure(
+    args: list[str] | str,
+    shell: bool = False,
+    calibration: Calibration = Calibration(),
+    timeout: float | None = None,
+) -> Profile | None:
+    """Profile of a command, or None if any of its runs failed or timed out. The
+    output size is measured on the first run, a warm-up unless there are none."""
+    size = None
+    for _ in range(calibration.warmups):
+        r = run_timed(args, shell, timeout, output=size is None)
+        if r is None:
+            return None
+        size = size or output_size(r[2] or b"")
+    walls, cpus = [], []
+    for _ in range(max(1, calibration.trials)):
+        r = run_timed(args, shell, timeout, output=size is None)
+        if r is None:
+            return None
+        size = size or output_size(r[2] or b"")
+        walls.append(r[0])
+        cpus.append(r[1])
+    return Profile(
+        len(walls),
+        min(walls),
+        percentile(walls, 50),
+        percentile(walls, calibration.percentile),
+        percentile(cpus, 50),
+        *(size or (0, 0)),
+    )
@@ -0,0 +1,313 @@
+"""What the current terminal can display, and where programs are on PATH.
+
+Terminal features (sixel, kitty graphics, iTerm inline images, truecolor) are guessed
+from the environment, and when randofetch runs on a terminal, sixel support is also
+asked for with a DA1 query. Results are cached in BaseConfig.term_caps_name, one line
+per terminal identity (TERM, TERM_PROGRAM and friends), for CAPS_TTL seconds, so the
+query is sent about once a day per terminal. Image methods that need a feature the
+terminal lacks are skipped when picking (see CommandIndex.supported_rows), and so are
+fetchers whose output is larger than the terminal (see CommandIndex.fitting_rows).
+
+Programs are looked up with an in-process PATH resolver, which lists each PATH folder
+once instead of running `which` for every fetcher.
+"""
+import os
+import sys
+import time
+
+CAPS_TTL = 24 * 3600
+FEATURES = ("sixel", "kitty", "iterm", "truecolor")
+# What an image method needs, by method name, unless fetchers.yaml sets `requires`.
+METHOD_REQUIRES = {"sixel": "sixel", "kitty": "kitty", "iterm": "iterm"}
+# Entries kept in the cache file.
+_MAX_ENTRIES = 16
+_IDENTITY_VARS = (
+    "TERM",
+    "TERM_PROGRAM",
+    "TERM_PROGRAM_VERSION",
+    "LC_TERMINAL",
+    "COLORTERM",
+)
+
+
+class TermCaps:
+    __slots__ = ("features", "cell", "queried")
+
+    def __init__(self, features, cell: tuple[int, int] | None, queried: bool = False):
+        self.features = frozenset(features)
+        # Cell size in pixels, if the terminal reports it.
+        self.cell = cell
+        # Whether this was detected on the terminal itself, rather than only guessed
+        # from the environment. A terminal that was sent the query but did not
+        # answer counts as asked; it is not asked again until the entry expires.
+        self.queried = queried
+
+    def supports(self, feature: str | None) -> bool:
+        return not feature or feature in self.features
+
+
+def identity(env=None) -> str:
+    env = os.environ if env is None else env
+    parts = [env.get(k, "") for k in _IDENTITY_VARS]
+    parts.append("tmux" if env.get("TMUX") else "")
+    return "|".join(p.replace("\t", " ") for p in parts)
+
+
+def env_features(env=None) -> set[str]:
+    """Features the terminal is known to have, judging by the environment alone."""
+    env = os.environ if env is None else env
+    term = env.get("TERM", "")
+    prog = env.get("TERM_PROGRAM", "")
+    found = set()
+    if (
+        env.get("COLORTERM", "").lower() in ("truecolor", "24bit")
+        or term.endswith("-direct")
+        or prog in ("iTerm.app", "WezTerm", "vscode", "ghostty")
+    ):
+        found.add("truecolor")
+    if (
+        term in ("xterm-kitty", "xterm-ghostty")
+        or "KITTY_WINDOW_ID" in env
+        or prog in ("WezTerm", "ghostty")
+    ):
+        found.add("kitty")
+    if (
+        prog in ("iTerm.app", "WezTerm", "mintty")
+        or env.get("LC_TERMINAL") == "iTerm2"
+        or any("ITERM" in k for k in env)
+    ):
+        found.add("iterm")
+    if (
+        prog in ("WezTerm", "mintty", "iTerm.app", "contour")
+        or term.startswith(("foot", "mlterm", "yaft", "contour"))
+        or "sixel" in term
+    ):
+        found.add("sixel")
+    return found
+
+
+def _tty_fd() -> int | None:
+    for stream in (sys.stdout, sys.stdin, sys.stderr):
+        try:
+            if stream.isatty():
+                return stream.fileno()
+        except (AttributeError, ValueError, OSError):
+            continue
+    return None
+
+
+def terminal_size(default: tuple[int, int] = (80, 24)) -> tuple[int, int]:
+    """(columns, lines) of the terminal on stdout, or on stderr when stdout is
+    captured (as in `$(randofetch)`). Otherwise from COLUMNS and LINES, else default."""
+    for fd in (1, 2):
+        try:
+            cols, lines = os.get_terminal_size(fd)
+            return cols, lines
+        except (OSError, ValueError):
+            continue
+    try:
+        return int(os.environ["COLUMNS"]), int(os.environ["LINES"])
+    except (KeyError, ValueError):
+        return default
+
+
+def terminal_cell() -> tuple[int, int] | None:
+    """Cell size in pixels, from any standard stream that is a terminal."""
+    fd = _tty_fd()
+    if fd is None:
+        return None
+    try:
+        import fcntl
+        import struct
+        import termios
+
+        buf = fcntl.ioctl(fd, termios.TIOCGWINSZ, bytes(8))
+        rows, cols, xpix, ypix = struct.unpack("HHHH", buf)
+    except (ImportError, OSError):
+        return None
+    if not (rows and cols and xpix and ypix):
+        return None
+    return xpix // cols, ypix // rows
+
+
+def parse_da1(reply: str) -> bool:
+    """Whether a DA1 reply (ESC [ ? 62 ; 4 ; ... c) lists sixel graphics (4)."""
+    body = reply.rpartition("[?")[2].rstrip("c")
+    return "4" in body.split(";")[1:]
+
+
+def _can_query() -> bool:
+    """Whether a query can be sent to the terminal and its reply read: it needs
+    stdin and stdout on the terminal, which is not the case under `$(randofetch)`."""
+    try:
+        return sys.stdin.isatty() and sys.stdout.isatty()
+    except (AttributeError, ValueError, OSError):
+        return False
+
+
+def query_da1(timeout: float = 0.2) -> str | None:
+    """Send a DA1 query to the terminal and return its reply, "" if it does not answer
+    within timeout, or None if the query was not sent: randofetch is not running on a
+    terminal, or input (keys typed while the shell started) is pending on stdin.
+
+    Input is read one byte at a time and only up to the end of the reply."""
+    if not _can_query():
+        return None
+    try:
+        import select
+        import termios
+
+        fd = sys.stdin.fileno()
+        old = termios.tcgetattr(fd)
+        if select.select([fd], [], [], 0)[0]:
+            return None
+    except (AttributeError, ValueError, OSError, ImportError):
+        return None
+    new = termios.tcgetattr(fd)
+    new[3] &= ~(termios.ICANON | termios.ECHO)
+    buf = b""
+    answered = False
+    try:
+        termios.tcsetattr(fd, termios.TCSANOW, new)
+        os.write(sys.stdout.fileno(), b"\x1b[c")
+        end = time.monotonic() + timeout
+        while not answered:
+            ready, _, _ = select.select([fd], [], [], max(0.0, end - time.monotonic()))
+            if not ready:
+                break
+            buf += os.read(fd, 1)
+            answered = _ends_with_da1(buf)
+    except OSError:
+        return None
+    finally:
+        termios.tcsetattr(fd, termios.TCSANOW, old)
+    return buf[buf.rfind(b"\x1b[?") :].decode("ascii") if answered else ""
+
+
+def _ends_with_da1(buf: bytes) -> bool:
+    """Whether buf ends with a complete DA1 reply: ESC [ ? digits and ; then c."""
+    start = buf.rfind(b"\x1b[?")
+    if start < 0 or not buf.endswith(b"c"):
+        return False
+    body = buf[start + 3 : -1]
+    return not body.strip(b"0123456789;")
+
+
+def _read_cache(cache_file: str) -> dict[str, tuple[float, TermCaps]]:
+    entries: dict[str, tuple[float, TermCaps]] = {}
+    try:
+        with open(cache_file) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return entries
+    for line in lines:
+        try:
+            ident, expires, queried, features, cw, ch = line.split("\t")
+            cell = (int(cw), int(ch)) if cw and ch else None
+            caps = TermCaps(filter(None, features.split(",")), cell, queried == "1")
+            entries[ident] = (float(expires), caps)
+        except ValueError:
+            continue
+    return entries
+
+
+def _write_cache(cache_file: str, entries: dict[str, tuple[float, TermCaps]]):
+    recent = sorted(entries.items(), key=lambda e: e[1][0])[-_MAX_ENTRIES:]
+    lines = []
+    for ident, (expires, caps) in recent:
+        cw, ch = caps.cell or ("", "")
+        features = ",".join(sorted(caps.features))
+        queried = "1" if caps.queried else "0"
+        lines.append(f"{ident}\t{expires}\t{queried}\t{features}\t{cw}\t{ch}\n")
+    from randofetch.cli.atomic import write_atomic
+
+    try:
+        write_atomic(cache_file, "".join(lines).encode())
+    except OSError:
+        pass
+
+
+def cached(cache_file: str, env=None) -> TermCaps | None:
+    """The capabilities last detected for the terminal env describes, if any, even if
+    they have expired. For processes that do not run on that terminal themselves."""
+    return _read_cache(cache_file).get(identity(env), (0.0, None))[1]
+
+
+# Detected capabilities, by terminal identity, for this process.
+_detected: dict[str, TermCaps] = {}
+
+
+def detect(
+    cache_file: str | None = None, env=None, query: bool = True, ttl=CAPS_TTL
+) -> TermCaps:
+    """Capabilities of the current terminal. A cached result for the same terminal is
+    used until it expires, unless it was only guessed from the environment and the
+    terminal can be asked now."""
+    ident = identity(env)
+    caps = _detected.get(ident)
+    if caps is not None:
+        return caps
+    can_query = query and env is None and _can_query()
+    entries = _read_cache(cache_file) if cache_file else {}
+    expires, caps = entries.get(ident, (0.0, None))
+    now = time.time()
+    if caps is None or expires < now or (can_query and not caps.queried):
+        features = env_features(env)
+        queried = can_query
+        if can_query and "sixel" not in features:
+            reply = query_da1()
+            queried = reply is not None
+            if reply and parse_da1(reply):
+                features.add("sixel")
+        caps = TermCaps(features, terminal_cell(), queried)
+        if cache_file:
+            entries[ident] = (now + ttl, caps)
+            _write_cache(cache_file, entries)
+    _detected[ident] = caps
+    return caps
+
+
+class PathResolver:
+    """Finds programs on a PATH without running `which`. Each folder is listed once."""
+
+    def __init__(self, path: str):
+        self.dirs = [d for d in path.split(os.pathsep) if d]
+        self._listings: dict[str, frozenset[str]] = {}
+
+    def _listing(self, folder: str) -> frozenset[str]:
+        names = self._listings.get(folder)
+        if names is None:
+            try:
+                names = frozenset(os.listdir(folder))
+            except OSError:
+                names = frozenset()
+            self._listings[folder] = names
+        return names
+
+    @staticmethod
+    def _executable(path: str) -> bool:
+        return os.access(path, os.X_OK) and not os.path.isdir(path)
+
+    def which(self, name: str) -> str | None:
+        name = os.path.expanduser(name)
+        if os.sep in name:
+            return name if self._executable(name) else None
+        for folder in self.dirs:
+            if name in self._listing(folder):
+                path = os.path.join(folder, name)
+                if self._executable(path):
+                    return path
+        return None
+
+
+_resolvers: dict[str, PathResolver] = {}
+
+
+def which(name: str, path: str | None = None) -> str | None:
+    """Full path of program name on path (PATH by default), or None."""
+    if path is None:
+        path = os.environ.get("PATH", os.defpath)
+    resolver = _resolvers.get(path)
+    if resolver is None:
+        resolver = _resolvers[path] = PathResolver(path)
+    return resolver.which(name)
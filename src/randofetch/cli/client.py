@@ -0,0 +1,126 @@
+"""Client side of the `randofetch serve` daemon (see randofetch.cli.daemon).
+
+When the daemon's socket exists, the fast path asks it for a pick or a render instead
+of loading the saved set and running a fetcher itself. Anything going wrong (no
+daemon, a stale socket, a timeout, a daemon that has nothing to give) makes the client
+return None, and randofetch carries on in process as if there was no daemon.
+
+Protocol: the client sends one line of tab separated fields, the request ("pick" or
+"render"), the terminal's columns and rows, then NAME=VALUE for the variables in
+CLIENT_ENV that are set. The daemon answers "OK <length>" and that many bytes of
+output, or "NO".
+"""
+import os
+import sys
+
+from randofetch.cli import trace
+from randofetch.cli.caps import terminal_size
+
+# Variables the daemon needs to tell what the client's terminal can show (see
+# randofetch.cli.caps).
+CLIENT_ENV = (
+    "TERM",
+    "TERM_PROGRAM",
+    "TERM_PROGRAM_VERSION",
+    "LC_TERMINAL",
+    "COLORTERM",
+    "TMUX",
+    "KITTY_WINDOW_ID",
+    "ITERM_SESSION_ID",
+)
+SOCKET_NAME = "daemon.sock"
+
+
+def runtime_dir(env=None) -> str:
+    """$XDG_RUNTIME_DIR/randofetch, or a per-user folder in the temp folder. Its name
+    is predictable, so it is only used if private_dir() says so."""
+    env = os.environ if env is None else env
+    base = env.get("XDG_RUNTIME_DIR", "").strip()
+    if base:
+        return os.path.join(base, "randofetch")
+    tmp = env.get("TMPDIR", "").strip() or "/tmp"
+    return os.path.join(tmp, f"randofetch-{os.getuid()}")
+
+
+def private_dir(path: str) -> bool:
+    """Whether path is a folder (not a link to one) that only this user can get in.
+    Anyone can create /tmp/randofetch-<uid> first, and replies are written to the
+    terminal, so a socket in any other folder is not trusted."""
+    import stat
+
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and not st.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+    )
+
+
+def socket_path(env=None) -> str:
+    return os.path.join(runtime_dir(env), SOCKET_NAME)
+
+
+def encode_request(op: str, term_size: tuple[int, int], env=None) -> bytes:
+    env = os.environ if env is None else env
+    fields = [op, str(term_size[0]), str(term_size[1])]
+    for name in CLIENT_ENV:
+        value = env.get(name)
+        if value:
+            fields.append(f"{name}={value}".replace("\t", " ").replace("\n", " "))
+    return ("\t".join(fields) + "\n").encode()
+
+
+def request(
+    op: str,
+    term_size: tuple[int, int] = (0, 0),
+    timeout: float = 5.0,
+    path: str | None = None,
+) -> bytes | None:
+    """The daemon's answer to op, or None if there is no daemon or it has no answer,
+    or its socket is not in a private_dir()."""
+    path = path or socket_path()
+    if not os.path.exists(path) or not private_dir(os.path.dirname(path) or "."):
+        return None
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall(encode_request(op, term_size))
+            with s.makefile("rb") as f:
+                header = f.readline()
+                if not header.startswith(b"OK "):
+                    return None
+                size = int(header[3:])
+                data = f.read(size)
+    except (OSError, ValueError):
+        return None
+    return data if len(data) == size else None
+
+
+def serve_pick() -> bool:
+    """Print a pick from the daemon. Returns False if it cannot give one."""
+    with trace.phase("daemon"):
+        data = request("pick", terminal_size((0, 0)))
+    if data is None:
+        return False
+    with trace.phase("output"):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return True
+
+
+def serve_render(deadline: float) -> bool:
+    """Write a render from the daemon. Returns False if it cannot give one."""
+    with trace.phase("daemon"):
+        data = request("render", terminal_size(), timeout=deadline + 1.0)
+    if not data:
+        return False
+    with trace.phase("output"):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return True
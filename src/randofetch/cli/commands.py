@@ -0,0 +1,651 @@
+# SPDX-FileCopyrightText: 2024-present Mark Plagge <mplagge@sandia.gov>
+#
+# SPDX-License-Identifier: MIT
+import io
+import os
+import shlex
+import sys
+from pathlib import Path
+
+import click
+
+from randofetch.__about__ import __version__
+from randofetch.cli import shell, trace
+from randofetch.cli.atomic import WriterLock
+from randofetch.cli.caps import terminal_size
+from randofetch.cli.calibrate import Profile
+from randofetch.cli.config import BaseConfig
+from randofetch.cli.fetcher import (
+    FetcherSet,
+    Pick,
+    init_fetcher_list,
+    init_image_list,
+)
+from randofetch.cli.index import CommandIndex, load_index, load_saved
+from randofetch.cli.queue import RenderQueue
+from randofetch.cli.render import fallbacks
+from randofetch.cli.render import show as show_output
+
+# Constructing a BaseConfig globs the image directory and may copy the default
+# fetchers.yaml, so it is deferred until a command actually needs it.
+_config_obj: BaseConfig | None = None
+
+
+def get_config() -> BaseConfig:
+    global _config_obj
+    if _config_obj is None:
+        _config_obj = BaseConfig()
+    return _config_obj
+
+
+class RichGroup(click.Group):
+    def format_help(self, ctx, formatter):
+        super().format_help(ctx, formatter)
+        sio = io.StringIO()
+        # console = rich.Console(file=sio, force_terminal=True)
+        # console.print("Hello, [bold magenta]World[/bold magenta]!", ":vampire:")
+        caps = "Cache Path:\t"
+        cops = "Config Path:\t"
+        data_locs = click.style(
+            f"{click.style(cops,fg=(15,200,90),bg='black',bold=True)}{click.style(BaseConfig.app_config_path(),underline=True,bold=True)}\n",
+            underline=True,
+        )
+
+        cache_locs = f"{click.style(caps,fg=(128,10,208),bg='black',bold=True,underline=True)}{click.style(BaseConfig.app_data_path(),underline=True,bold=True)}\n"
+        help_epi = (
+            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+            + click.style(
+                "On this platform, data is saved to:", fg="bright_blue", bold=True
+            )
+            + f"\n{data_locs}{cache_locs} ͍⃗⃡͜"
+        )
+
+        sio.write(help_epi)
+        formatter.write(sio.getvalue())
+
+
+@click.group(
+    cls=RichGroup,
+    context_settings={"help_option_names": ["-h", "--help"]},
+    invoke_without_command=True,
+)
+@click.version_option(version=__version__, prog_name="randofetch")
+@click.option(
+    "--reset",
+    "-r",
+    is_flag=True,
+    default=False,
+    help="Reset config file with defaults. Implies --scan",
+)
+@click.option(
+    "--scan",
+    "-s",
+    is_flag=True,
+    default=False,
+    help="Re-Scan images and fetchers using config file.",
+)
+@click.option("--disp", "-d", is_flag=True, default=False)
+@click.option(
+    "--timeout",
+    "-t",
+    default=2.0,
+    help="When generating fetcher list, fetchers which take longer than this will not be used.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of fetchers to probe in parallel while scanning.",
+)
+@click.option(
+    "--deadline",
+    type=float,
+    default=None,
+    help="Seconds a fetcher may run when displaying output before falling back.",
+)
+@click.pass_context
+def randofetch(
+    ctx: click.Context,
+    reset: bool,
+    scan: bool,
+    disp: bool,
+    timeout: float,
+    workers: int | None,
+    deadline: float | None,
+):
+    """
+    RandoFetch - Randomly run a fetcher program with a randomly selected image.
+
+    RandoFetch stores data / cached information in the standard XDG
+    This function is the main entry point for the randofetch command-line interface.
+
+
+
+    If the reset flag is True, the function will regenerate the list of fetchers and images,
+    and notify the user. If the scan flag is True, the function will re-scan and
+    regenerate the list of fetchers.
+
+    If the disp flag is True, the function will display the output of the fetcher program.
+    The output is streamed to the terminal as the fetcher program writes it, or replayed from the render cache.
+
+    The function also prints the paths to the YAML configuration file,
+    the base configuration file, and the application configuration path.
+
+    With --profile anywhere on the command line, phase timings are printed to stderr
+    (same as RANDOFETCH_TRACE=1). It is handled before the command line is parsed, so
+    that the fast paths can be profiled too.
+    \f
+
+    :param reset: A boolean flag indicating whether to reset the configuration to defaults.
+    If this flag is True, the function will also set the scan flag to True.
+    :type reset: bool
+
+    :param scan: A boolean flag indicating whether to re-scan images and fetchers using the
+    configuration file.
+    :type scan: bool
+
+    :param disp: A boolean flag indicating whether to display the output of the fetcher program.
+    :type disp: bool
+
+    """
+
+    # Reset configuration to defaults. This is done in the BaseConfig object
+    config = BaseConfig(
+        reset_config=reset,
+    )
+
+    global _config_obj
+    _config_obj = config
+    _config_obj.app_data_path().mkdir(exist_ok=True)
+    _config_obj.app_config_path().mkdir(exist_ok=True)
+    if timeout != 2.0:
+        _config_obj.fetch_max_latency = timeout
+    if workers is not None:
+        _config_obj.scan_workers = workers
+    if deadline is not None:
+        _config_obj.run_deadline = deadline
+    if reset:
+        # When config is reset, we need to regenerate the list of fetchers + images. Also, notifiy user
+        click.secho("Regenerating config", fg="blue")
+        scan = True
+    if scan:
+        # Only re-scan and regenerate list of fetchers
+        click.secho("Scaning images", fg="green")
+        reset_fn()
+
+    if ctx.invoked_subcommand is not None:
+        return
+    stats = _config_obj.latency_stats()
+    fetcher_set, entry = gen(stats)
+    if disp and entry is not None:
+        click.secho("display")
+        show_entry(fetcher_set, entry, stats)
+
+    # print(config.yaml_config_file)
+    # print(config._base_config_file)
+    # print(config.app_config_path)
+
+
+def reset_fn(only_if_stale: bool = False):
+    """Rescan and save a new fetcher set. Only one process scans at a time; with
+    only_if_stale, the scan is skipped if another process saved a current set while
+    this one waited for its turn. Such implicit rescans report on stderr, as stdout
+    only carries the picked command."""
+    _config_obj = get_config()
+    save_file = _config_obj.fset_save_file
+    save_file.parent.mkdir(parents=True, exist_ok=True)
+    with WriterLock(save_file):
+        if only_if_stale and load_index(save_file) is not None:
+            return
+        _scan(_config_obj, err=only_if_stale)
+
+
+def _scan(_config_obj: BaseConfig, err: bool = False):
+    # Create cache folders inside the image directory before the scan records its
+    # mtime, so that creating them later does not make the new set look stale.
+    for p in _config_obj.state_paths():
+        p.mkdir(exist_ok=True)
+    _config_obj.images(refresh=True)
+    fl = init_fetcher_list(_config_obj)
+
+    fetcher_set = FetcherSet(
+        reset=True,
+        save_file=_config_obj.fset_save_file,
+        fetcher_list=fl,
+        max_time=_config_obj.fetch_max_latency,
+        sources=_config_obj.scan_sources,
+        workers=_config_obj.scan_workers,
+        probe_timeout=_config_obj.probe_timeout,
+        images=init_image_list(_config_obj),
+        calibration=_config_obj.calibration(),
+    )
+    click.echo(f"Found {len(fetcher_set.fetchers)}", err=err)
+    click.echo("\n".join(f.cmd for f in fetcher_set.fetchers), err=err)
+    # Queued renders and run times may belong to fetchers that are no longer in the set.
+    RenderQueue(_config_obj.render_queue_path()).clear()
+    index = fetcher_set.index
+    _config_obj.latency_stats().prune(index.template(r)[0] for r in range(index.n_rows))
+    shell.regenerate(
+        fetcher_set.index, _config_obj.fset_save_file, _config_obj.shell_snippet_path
+    )
+    click.echo("Found timing: \n" "cmd \t\t\t\t time \n" + "-" * 40, err=err)
+    for ts in fetcher_set.timing:
+        click.echo(f"{ts[0]} \t\t\t\t {ts[1]}", err=err)
+    _echo_profiles(fetcher_set.index, err=err)
+
+
+def _echo_profiles(index: CommandIndex, err: bool = False):
+    """The latency and output size measured for each fetcher of a saved set when it
+    was scanned, on stderr with err."""
+    profiles = [(r, Profile.from_row(index, r)) for r in range(index.n_rows)]
+    rows = [(r, p) for r, p in profiles if p is not None]
+    if not rows:
+        return
+    click.echo("\nLatency measured by the last scan:", err=err)
+    click.echo(
+        f"{'min ms':>8}{'p50 ms':>8}{'p95 ms':>8}{'cpu ms':>8}{'runs':>6}{'size':>9}"
+        "  command",
+        err=err,
+    )
+    for r, p in rows:
+        ms = "".join(f"{v * 1000:>8.1f}" for v in (p.min, p.p50, p.p95, p.cpu))
+        size = f"{p.width}x{p.height}"
+        click.echo(f"{ms}{p.trials:>6}{size:>9}  {index.template(r)[0]}", err=err)
+
+
+def load_set() -> FetcherSet:
+    _config_obj = get_config()
+    if load_saved(_config_obj.fset_save_file) is None:
+        # Missing, stale or from an older randofetch, and no other process is
+        # rescanning it (or there is no previous set to use meanwhile).
+        reset_fn(only_if_stale=True)
+    return FetcherSet(
+        reset=False,
+        save_file=_config_obj.fset_save_file,
+        max_time=_config_obj.fetch_max_latency,
+        check_sources=False,
+    )
+
+
+def gen(stats=None):
+    fetcher_set = load_set()
+    entry = fetcher_set.pick(
+        stats or get_config().latency_stats(), get_config().term_caps()
+    )
+    if entry is not None:
+        click.echo(entry.cmd)
+    return fetcher_set, entry
+
+
+def show_entry(fetcher_set: FetcherSet, entry: Pick, stats, no_cache: bool = False):
+    """Display a picked entry, within the configured run deadline."""
+    _config_obj = get_config()
+    cache = None if no_cache else _config_obj.render_cache()
+    deadline = _config_obj.run_deadline
+    show_output(
+        entry.cmd,
+        entry.image,
+        argv=entry.argv,
+        fetcher=entry.fetcher,
+        cache=cache,
+        stats=stats,
+        deadline=deadline,
+        fallback=fallbacks(fetcher_set.index, cache, deadline, stats),
+    )
+
+
+@randofetch.command
+@click.argument(
+    "images",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, resolve_path=True, path_type=Path),
+)
+@click.option(
+    "--recursive",
+    "-r",
+    is_flag=True,
+    default=False,
+    help="Search subfolders of the given folders too.",
+)
+@click.option(
+    "--link",
+    "-l",
+    is_flag=True,
+    default=False,
+    help="Hard link images instead of copying them, where possible.",
+)
+@click.option("--jobs", "-j", type=int, default=None, help="Files imported at once.")
+def add_images(images: list[Path], recursive: bool, link: bool, jobs: int | None):
+    """
+    Add images, or folders of images, to the library.
+
+    Images whose content is in the library already are skipped. Copies are reflinks
+    on filesystems that support them.
+    """
+    import tqdm
+
+    from randofetch.cli.images import ImageEntry, import_images, import_summary
+
+    _config_obj = get_config()
+    library = {e.digest for e in _config_obj.images()}
+    results = import_images(
+        images,
+        _config_obj.app_data_path(),
+        _config_obj.image_globs,
+        library,
+        recursive=recursive,
+        link=link,
+        workers=jobs or _config_obj.scan_workers,
+        progress=tqdm.tqdm,
+    )
+    known = []
+    for r in results:
+        if r.placed and r.dest is not None:
+            st = r.dest.stat()
+            known.append(ImageEntry(r.dest, st.st_size, st.st_mtime_ns, r.digest))
+    if known:
+        # The hashes are known, so the new files are not read again.
+        _config_obj.image_index().refresh(known=known)
+    for line in import_summary(results):
+        click.echo(line)
+    if any(r.how == "failed" for r in results):
+        sys.exit(1)
+
+
+@randofetch.command
+def pick():
+    """
+    Print a random command from the saved fetcher set.
+
+    This is the same as running randofetch without arguments. When called from a shell
+    the command is normally served by the fast path in randofetch.cli.pick, and this
+    click command only runs when that path cannot (e.g. no saved fetcher set yet).
+    """
+    gen()
+
+
+@randofetch.command
+@click.option(
+    "--no-cache", is_flag=True, default=False, help="Always run the fetcher."
+)
+def show(no_cache: bool):
+    """
+    Run a random fetcher from the saved set and print its output.
+
+    Output is replayed from the render cache when the same command, image, terminal
+    size and terminal type were rendered before.
+    """
+    stats = get_config().latency_stats()
+    fetcher_set = load_set()
+    entry = fetcher_set.pick(stats, get_config().term_caps())
+    if entry is not None:
+        show_entry(fetcher_set, entry, stats, no_cache)
+
+
+@randofetch.command("next")
+def next_cmd():
+    """
+    Print a pre-rendered pick, then refill the queue in the background.
+
+    The first call (or any call that finds the queue empty) renders in the foreground
+    like `randofetch show`.
+    """
+    _config_obj = get_config()
+    queue = RenderQueue(
+        _config_obj.render_queue_path(), _config_obj.render_queue_size
+    )
+    output = queue.pop()
+    if output is None:
+        stats = _config_obj.latency_stats()
+        fetcher_set = load_set()
+        entry = fetcher_set.pick(stats, _config_obj.term_caps())
+        if entry is not None:
+            show_entry(fetcher_set, entry, stats)
+    else:
+        sys.stdout.buffer.write(output)
+        sys.stdout.buffer.flush()
+    queue.spawn_refill()
+
+
+@randofetch.command(hidden=True)
+def refill_queue():
+    """Fill the render queue. Started in the background by `randofetch next`."""
+    os.nice(10)
+    _config_obj = get_config()
+    index = load_saved(_config_obj.fset_save_file)
+    if index is not None:
+        queue = RenderQueue(
+            _config_obj.render_queue_path(), _config_obj.render_queue_size
+        )
+        stats = _config_obj.latency_stats()
+        accept = stats.acceptor(
+            index,
+            _config_obj.fetch_max_latency,
+            _config_obj.latency_min_samples,
+            _config_obj.latency_explore,
+        )
+        queue.refill(
+            index,
+            timeout=_config_obj.probe_timeout,
+            stats=stats,
+            accept=accept,
+            rows=index.fitting_rows(
+                terminal_size(), index.supported_rows(_config_obj.term_caps().features)
+            ),
+        )
+
+
+@randofetch.command
+@click.option("--clear", is_flag=True, default=False, help="Delete the trace log.")
+def stats(clear: bool):
+    """
+    Summarise phase timings recorded with --profile / RANDOFETCH_TRACE.
+
+    Shows the p50 and p95 of each phase, in milliseconds, over the runs in the trace
+    log, then the latency of each fetcher measured by the last scan.
+    """
+    log = str(BaseConfig.app_config_path() / BaseConfig.trace_log_name)
+    if clear:
+        for p in (log, log + ".1"):
+            Path(p).unlink(missing_ok=True)
+        return
+    records = trace.read_log(log)
+    if not records:
+        click.echo("No traces recorded yet. Run randofetch with --profile.")
+    else:
+        click.echo(f"{len(records)} runs from {log}")
+        click.echo(f"{'phase':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, agg in trace.aggregate(records).items():
+            click.echo(
+                f"{name:<12}{agg['n']:>6}{agg['p50']:>10.2f}{agg['p95']:>10.2f}"
+            )
+    index = load_saved(BaseConfig.app_config_path() / BaseConfig.fetcher_save_name)
+    if index is not None:
+        _echo_profiles(index)
+
+
+@randofetch.command("render-all")
+@click.argument("out_dir", type=click.Path(file_okay=False, path_type=Path))
+@click.option(
+    "--sample",
+    "-n",
+    type=int,
+    default=None,
+    help="Render this many random combinations instead of all of them.",
+)
+@click.option("--seed", type=int, default=None, help="Seed for --sample.")
+@click.option(
+    "--size",
+    default=None,
+    help="Terminal size to render for, as COLSxROWS. Defaults to this terminal.",
+)
+@click.option(
+    "--jobs", "-j", type=int, default=None, help="Fetchers run at once."
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=None,
+    help="Seconds before a fetcher is killed. Defaults to the probe timeout.",
+)
+@click.option(
+    "--warm-cache",
+    is_flag=True,
+    default=False,
+    help="Store successful renders in the render cache.",
+)
+@click.option(
+    "--slowest", type=int, default=10, help="Number of slowest renders to list."
+)
+def render_all(
+    out_dir: Path,
+    sample: int | None,
+    seed: int | None,
+    size: str | None,
+    jobs: int | None,
+    timeout: float | None,
+    warm_cache: bool,
+    slowest: int,
+):
+    """
+    Render every fetcher and image combination of the saved set into OUT_DIR.
+
+    Each output is written to OUT_DIR/<entry>.out, and OUT_DIR/report.json has the
+    command, image, exit status, run time and output size of each. A summary of the
+    failed and the slowest combinations is printed at the end.
+    """
+    import tqdm
+
+    from randofetch.cli import gallery
+
+    _config_obj = get_config()
+    try:
+        term_size = gallery.parse_size(size) if size else terminal_size()
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--size")
+    index = load_set().index
+    picks = gallery.entries(index, sample, seed)
+    results = gallery.render_all(
+        index,
+        out_dir,
+        term_size,
+        picks,
+        workers=jobs or _config_obj.scan_workers,
+        timeout=timeout or _config_obj.probe_timeout,
+        cache=_config_obj.render_cache() if warm_cache else None,
+        progress=tqdm.tqdm,
+    )
+    for line in gallery.summary(results, slowest):
+        click.echo(line)
+
+
+@randofetch.command
+@click.option(
+    "--socket",
+    "socket_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Socket to listen on. Clients only look for the default one.",
+)
+def serve(socket_file: Path | None):
+    """
+    Run a daemon that serves picks and renders to new shells.
+
+    While it runs, `randofetch`, `randofetch show` and `randofetch next` get their
+    answer from it over a Unix socket instead of loading the saved set and running a
+    fetcher themselves. It reloads the set when fetchers.yaml or the image folders
+    change. Without the daemon, randofetch works as before.
+    """
+    import asyncio
+
+    from randofetch.cli.client import socket_path
+    from randofetch.cli.daemon import Daemon
+
+    _config_obj = get_config()
+    path = str(socket_file or socket_path())
+    daemon = Daemon(
+        _config_obj, lambda: load_set().index, _config_obj.fset_save_file
+    )
+    try:
+        asyncio.run(
+            daemon.serve(path, ready=lambda: click.echo(f"Serving on {path}"))
+        )
+    except (FileExistsError, PermissionError) as e:
+        raise click.ClickException(str(e))
+
+
+@randofetch.command("emit-shell")
+@click.option(
+    "--shell",
+    "shell_name",
+    type=click.Choice(shell.SHELLS),
+    required=True,
+    help="Shell to write the snippet for.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Where to write the snippet. Snippets in the default location are rewritten "
+    "after every scan.",
+)
+@click.option(
+    "--all-methods",
+    is_flag=True,
+    default=False,
+    help="Keep image methods this terminal cannot show.",
+)
+def emit_shell(shell_name: str, output: Path | None, all_methods: bool):
+    """
+    Write a snippet that picks fetchers without starting Python.
+
+    Source the snippet from your shell's rc file, then call randofetch_run to show a
+    random fetcher, or randofetch_pick to print one. When the saved set is out of date
+    the snippet calls randofetch instead.
+    """
+    _config_obj = get_config()
+    output = output or _config_obj.shell_snippet_path(shell_name)
+    features = None if all_methods else _config_obj.term_caps().features
+    shell.write_snippet(
+        load_set().index, shell_name, _config_obj.fset_save_file, output, features
+    )
+    click.echo(f"Wrote {output}. Add this to your rc file:")
+    click.echo(f"  source {shlex.quote(str(output))}")
+
+
+@randofetch.command
+def clear_cache():
+    """Remove all cached and queued fetcher output, and the image thumbnails."""
+    from randofetch.cli.thumbs import ThumbnailCache
+
+    get_config().render_cache().clear()
+    RenderQueue(BaseConfig.render_queue_path()).clear()
+    ThumbnailCache(BaseConfig.thumb_cache_path()).clear()
+
+
+@randofetch.command
+def list_images():
+    """
+    List all images in the application data directory and the configured image roots.
+
+    This function is a Click command that lists all images in the image index. It does not take any arguments and does not return anything.
+
+    The function iterates over the `image_list` attribute of the `CONFIG_OBJ` object, which is read from the image index (searching the image folders again only if they changed). It then prints each image path to the console.
+    """
+    for i in get_config().image_list:
+        print(i)
+
+
+@randofetch.command
+@click.argument("image_name")
+def remove_image(image_name):
+    im_path = Path(BaseConfig.app_data_path() / image_name)
+    click.confirm(f"Delete file {im_path}?", abort=True)
+    im_path.unlink()
+
+
+if __name__ == "__main__":
+    randofetch()
@@ -1,8 +1,14 @@
 from pathlib import Path
-from importlib import resources
-from platformdirs import user_config_dir, user_data_dir
 from randofetch import appname, appauthor
-from ruamel.yaml import YAML
+from randofetch.cli import trace
+from randofetch.cli.atomic import write_atomic
+
+# platformdirs, ruamel.yaml and importlib.resources are imported where they are used:
+# this module is loaded on every shell start and most runs never need them.
+
+CONFIG_CACHE_VERSION = 1
+# Configs loaded by this process, by path, with the (mtime, size) they were loaded at.
+_loaded: dict[str, tuple[tuple[int, int], dict]] = {}
 
 
 class BaseConfig:
@@ -17,13 +23,56 @@ class BaseConfig:
     _config_path_ovr = None
     _data_path_ovr = None
     _base_config_file = None
-    _config_dict = None
 
     fetch_max_latency = 2.1
-    fetcher_save_name = "fetch.pkl"
+    # Fetchers probed at once while scanning, and seconds before a hung probe is killed.
+    scan_workers = 8
+    probe_timeout = 10.0
+    # Untimed and timed runs of each fetcher's command during a scan. A fetcher is kept
+    # when the calibration_percentile of its timed runs is within fetch_max_latency.
+    # calibration_workers commands are timed at once; None is half the CPUs. The output
+    # size of image methods is measured on calibration_size_images library images.
+    calibration_warmups = 1
+    calibration_trials = 5
+    calibration_percentile = 95
+    calibration_workers: int | None = None
+    calibration_size_images = 4
+    # Rendered fetcher output, kept under app_data_path() / render_cache_name.
+    render_cache_name = "render"
+    render_cache_ttl = 7 * 24 * 3600
+    render_cache_max_bytes = 32 * 2**20
+    render_cache_compress = True
+    # Seconds a fetcher may take when showing its output before it is killed and
+    # randofetch falls back to a cached render or a text-only fetcher.
+    run_deadline = 3.0
+    # Observed fetcher run times, kept in app_config_path(). Fetchers whose recent p95
+    # is over fetch_max_latency are skipped once they have latency_min_samples runs.
+    latency_stats_name = "latency.bin"
+    latency_min_samples = 3
+    latency_explore = 0.05
+    # Phase traces from --profile / RANDOFETCH_TRACE, kept in app_config_path().
+    trace_log_name = "trace.jsonl"
+    # Detected terminal capabilities, kept in app_config_path().
+    term_caps_name = "termcaps"
+    # Pre-rendered picks kept for `randofetch next`, per terminal size.
+    render_queue_name = "queue"
+    render_queue_size = 3
+    # Downscaled copies of library images handed to image methods instead of the
+    # originals. Needs Pillow; the originals are used without it.
+    thumbnails = True
+    thumb_cache_name = "thumbs"
+    thumb_cache_max_bytes = 64 * 2**20
+    fetcher_save_name = "fetch.idx"
+    # Shell snippets from `randofetch emit-shell`, kept in app_config_path() /
+    # shell_snippet_name and rewritten after every scan.
+    shell_snippet_name = "shell"
     image_save_name = "image_cfg.pkl"
-    image_list = []
     image_globs = ["*.jpg", "*.png", "*.bmp"]
+    # Images are read from app_data_path() and from the `image_roots` of fetchers.yaml,
+    # and remembered in app_config_path() / image_index_name.
+    image_index_name = "images.idx"
+    _images = None
+    _image_dirs: list[str] = []
 
     def __init__(
         self,
@@ -43,17 +92,50 @@ class BaseConfig:
         if base_config_file_ovr:
             self._base_config_file = base_config_file_ovr
         else:
+            from importlib import resources
+
             self._base_config_file = Path(
                 str(resources.files("randofetch.config").joinpath("fetchers.yaml"))
             )
         if reset_config or not self.yaml_config_file.exists():
             self.yaml_config_file = self._base_config_file
-        ils = []
-        for glob in self.image_globs:
-            for file in self.app_data_path().glob(glob):
-                ils.append(str(file))
-        ils = list(set(ils))
-        self.image_list = [Path(i) for i in ils]
+
+    def image_roots(self):
+        """app_data_path(), then the image_roots of fetchers.yaml. Those are either a
+        path, or a mapping with a path and whether to search it recursively."""
+        from randofetch.cli.images import ImageRoot
+
+        roots = [ImageRoot(self.app_data_path())]
+        for root in self.config.get("image_roots") or []:
+            if isinstance(root, str):
+                root = {"path": root}
+            path = Path(root["path"]).expanduser()
+            roots.append(ImageRoot(path, bool(root.get("recursive", False))))
+        return roots
+
+    def image_index(self):
+        from randofetch.cli.images import ImageIndex
+
+        return ImageIndex(
+            self.app_config_path() / self.image_index_name,
+            self.image_roots(),
+            self.image_globs,
+            exclude=self.state_paths(),
+            workers=self.scan_workers,
+        )
+
+    def images(self, refresh: bool = False):
+        """The ImageEntry of each library image, from the image index. The image
+        folders are only searched again when they changed, or with refresh."""
+        if self._images is None or refresh:
+            index = self.image_index()
+            self._images = index.refresh(force=refresh)
+            self._image_dirs = index.dirs
+        return self._images
+
+    @property
+    def image_list(self) -> list[Path]:
+        return [e.path for e in self.images()]
 
     # States:
     # 1. app_config has no yaml:
@@ -73,17 +155,22 @@ class BaseConfig:
 
     @staticmethod
     def _load_xdg(xdgp: Path | str):
-        xdgp = Path(xdgp)
-        if not xdgp.exists():
-            xdgp.mkdir()
+        with trace.phase("xdg"):
+            xdgp = Path(xdgp)
+            if not xdgp.exists():
+                xdgp.mkdir(parents=True, exist_ok=True)
         return xdgp
 
     @classmethod
     def app_config_path(cls):
+        from platformdirs import user_config_dir
+
         return cls._load_xdg(user_config_dir(appname, appauthor=appauthor))
 
     @classmethod
     def app_data_path(self):
+        from platformdirs import user_data_dir
+
         return self._load_xdg(user_data_dir(appname, appauthor))
 
     @property
@@ -97,17 +184,13 @@ class BaseConfig:
     def yaml_config_file(self, yaml_file: Path):
         yam_c = yaml_file.read_text()
         yam_dest = self.yaml_config_file
-        yam_dest.write_text(yam_c)
+        write_atomic(yam_dest, yam_c.encode())
         self._fetcher_config = yam_dest
 
     @property
-    def config(self):
-        if self._config_dict:
-            return self._config_dict
-        yaml = YAML()
-        cg = yaml.load(self.yaml_config_file)
-        self._config_dict = cg
-        return cg
+    def config(self) -> dict:
+        """The parsed fetchers.yaml, as plain dicts and lists (see load_config)."""
+        return load_config(self.yaml_config_file)
 
     @property
     def config_string(self):
@@ -127,10 +210,149 @@ class BaseConfig:
     def fset_save_file(self):
         return self.app_config_path() / self.fetcher_save_name
 
+    @classmethod
+    def render_cache_path(cls):
+        return cls.app_data_path() / cls.render_cache_name
+
+    @classmethod
+    def render_queue_path(cls):
+        return cls.app_data_path() / cls.render_queue_name
+
+    @classmethod
+    def thumb_cache_path(cls):
+        return cls.app_data_path() / cls.thumb_cache_name
+
+    @classmethod
+    def shell_snippet_path(cls, shell: str):
+        return cls.app_config_path() / cls.shell_snippet_name / f"randofetch.{shell}"
+
+    @classmethod
+    def state_paths(cls) -> list[Path]:
+        """Folders randofetch keeps inside app_data_path() next to the images."""
+        return [
+            cls.render_cache_path(),
+            cls.render_queue_path(),
+            cls.thumb_cache_path(),
+        ]
+
+    def latency_stats(self):
+        from randofetch.cli.stats import LatencyStats
 
-def load_config(config_location: Path):
-    """Loads the configuration file for randofetch. This is a YAML file normally stored in"""
+        return LatencyStats(self.app_config_path() / self.latency_stats_name)
+
+    def calibration(self):
+        from randofetch.cli.calibrate import Calibration
+
+        return Calibration(
+            self.calibration_warmups,
+            self.calibration_trials,
+            self.calibration_percentile,
+            self.calibration_workers,
+            self.calibration_size_images,
+        )
+
+    def term_caps(self):
+        from randofetch.cli import caps
+
+        with trace.phase("caps"):
+            return caps.detect(str(self.app_config_path() / self.term_caps_name))
+
+    def render_cache(self):
+        from randofetch.cli.render import RenderCache
+
+        return RenderCache(
+            self.render_cache_path(),
+            ttl=self.render_cache_ttl,
+            max_bytes=self.render_cache_max_bytes,
+            compress=self.render_cache_compress,
+        )
+
+    def thumb_cache(self):
+        """The ThumbnailCache, or None if thumbnails are off or Pillow is missing."""
+        from randofetch.cli.thumbs import ThumbnailCache, default_resizer
+
+        resize = default_resizer() if self.thumbnails else None
+        if resize is None:
+            return None
+        return ThumbnailCache(
+            self.thumb_cache_path(), self.thumb_cache_max_bytes, resize=resize
+        )
+
+    @property
+    def scan_sources(self) -> list[Path]:
+        """Files and folders a saved fetcher set depends on. When one of these changes,
+        the set needs to be re-scanned. These are the config and the image folders."""
+        self.images()
+        return [self.yaml_config_file, *map(Path, self._image_dirs)]
+
+
+def _plain(node):
+    """node with ruamel's round-trip types replaced by plain dicts, lists and scalars,
+    which marshal can store. Tags such as !Fetcher are dropped."""
+    if isinstance(node, dict):
+        return {str(k): _plain(v) for k, v in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_plain(v) for v in node]
+    for t in (bool, int, float, str):
+        if isinstance(node, t):
+            return t(node)
+    return node
+
+
+def _config_key(config_location: Path) -> tuple[int, int]:
+    st = config_location.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def load_config(config_location: Path) -> dict:
+    """Loads the configuration file for randofetch. This is a YAML file normally stored in
+    app_config_path().
+
+    The parsed config is compiled to <config_location>.cache (marshal, keyed by the
+    mtime, size and sha1 of the YAML), so ruamel.yaml is only imported when the YAML has
+    changed. Within a process each file is loaded once."""
+    config_location = Path(config_location)
+    key = _config_key(config_location)
+    loaded = _loaded.get(str(config_location))
+    if loaded is not None and loaded[0] == key:
+        return loaded[1]
+    import marshal
+    import sys
+
+    cache_file = config_location.with_name(config_location.name + ".cache")
+    version = (CONFIG_CACHE_VERSION, *sys.version_info[:2])
+    cached = None
+    with trace.phase("config"):
+        try:
+            cached = marshal.loads(cache_file.read_bytes())
+            if cached[0] != version:
+                cached = None
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            cached = None
+    if cached is not None and cached[1] == key:
+        cfg = cached[3]
+    else:
+        import hashlib
+
+        text = config_location.read_bytes()
+        digest = hashlib.sha1(text).hexdigest()
+        if cached is not None and cached[2] == digest:
+            # Touched or rewritten, but the same config.
+            cfg = cached[3]
+        else:
+            with trace.phase("yaml"):
+                from ruamel.yaml import YAML
+
+                cfg = _plain(YAML().load(text))
+        try:
+            write_atomic(cache_file, marshal.dumps((version, key, digest, cfg)))
+        except (OSError, ValueError):
+            pass
+    _loaded[str(config_location)] = (key, cfg)
+    return cfg
 
 
 def t_files():
+    from importlib import resources
+
     print(resources.files("randofetch.config").joinpath("fetchers.yaml").read_text())
@@ -0,0 +1,285 @@
+"""Background daemon for `randofetch serve`.
+
+The daemon keeps the saved fetcher set open and answers pick and render requests from
+new shells on a Unix socket in randofetch.cli.client.runtime_dir(), so a shell start
+does not load anything or wait for a fetcher. For each terminal size and set of
+terminal features it has seen, a few renders are kept ready in memory and topped up in
+the background after every request, like the render queue of `randofetch next`.
+Renders also go through the render cache.
+
+The set is reloaded when the save file is replaced (e.g. by `randofetch --scan`), and
+reloaded with a rescan when fetchers.yaml or an image folder changes. Requests are
+served with asyncio, so bursts of shells (tmux restoring a session, many SSH logins)
+only wait for each other when fetchers have to run, at most `workers` at a time.
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import time
+from collections import OrderedDict, deque
+from typing import Callable, NamedTuple
+
+from randofetch.cli import caps
+from randofetch.cli.client import CLIENT_ENV, private_dir
+from randofetch.cli.fetcher import run_cmd
+from randofetch.cli.index import CommandIndex
+from randofetch.cli.render import KEY_ENV
+
+# Pools of ready renders kept at once, one per terminal size and feature set.
+MAX_POOLS = 8
+
+
+class Request(NamedTuple):
+    op: str
+    term_size: tuple[int, int]
+    env: dict[str, str]
+
+
+def parse_request(line: bytes) -> Request:
+    op, cols, rows, *pairs = line.decode().rstrip("\n").split("\t")
+    env = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if sep and name in CLIENT_ENV:
+            env[name] = value
+    return Request(op, (int(cols), int(rows)), env)
+
+
+class Daemon:
+    def __init__(
+        self,
+        config,
+        load: Callable[[], CommandIndex | None],
+        save_file,
+        interval: float = 2.0,
+    ):
+        """
+        :param config: A BaseConfig, for the latency budget, the run deadline, the
+        render cache, stats and cached terminal capabilities.
+        :param load: Opens the saved set, scanning first if it is missing or stale.
+        Called in a worker thread.
+        :param interval: Seconds between checks for a changed set or sources.
+        """
+        self.config = config
+        self.load = load
+        self.save_file = str(save_file)
+        self.interval = interval
+        self.index: CommandIndex | None = None
+        self.stats = config.latency_stats()
+        self.cache = config.render_cache()
+        self.caps_file = str(config.app_config_path() / config.term_caps_name)
+        self.pool_size = config.render_queue_size
+        self.pools: OrderedDict[tuple, deque[bytes]] = OrderedDict()
+        self._filling: dict[tuple, asyncio.Task] = {}
+        self._runs = asyncio.Semaphore(max(1, config.scan_workers))
+        self._save_id = None
+        self._stop: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _save_stat(self):
+        try:
+            st = os.stat(self.save_file)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    async def reload(self):
+        self.index = await asyncio.to_thread(self.load)
+        self._save_id = self._save_stat()
+        self.pools.clear()
+
+    def needs_reload(self) -> bool:
+        if self.index is None or self._save_stat() != self._save_id:
+            return True
+        return self.index.is_stale()
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.needs_reload():
+                try:
+                    await self.reload()
+                except Exception as e:
+                    print(f"randofetch serve: reload failed: {e!r}", flush=True)
+
+    def features(self, env: dict[str, str]) -> frozenset[str]:
+        found = caps.cached(self.caps_file, env)
+        return found.features if found else frozenset(caps.env_features(env))
+
+    def _pick(self, index: CommandIndex, features, term_size) -> int | None:
+        accept = self.stats.acceptor(
+            index,
+            self.config.fetch_max_latency,
+            self.config.latency_min_samples,
+            self.config.latency_explore,
+        )
+        rows = index.fitting_rows(term_size, index.supported_rows(features))
+        return index.random_entry(accept, rows=rows)
+
+    async def render_one(self, req: Request, features) -> bytes | None:
+        index = self.index
+        if index is None:
+            return None
+        i = self._pick(index, features, req.term_size)
+        if i is None:
+            return None
+        cmd, image, argv = index[i], index.get(i, "image"), index.argv(i)
+        # Hashing the image, cache reads and writes and the stats file lock all block,
+        # so they run in threads like the fetcher, not on the loop serving clients.
+        key = await asyncio.to_thread(
+            self.cache.key, cmd, image, req.term_size, req.env
+        )
+        data = await asyncio.to_thread(self.cache.get, key)
+        if data is not None:
+            return data
+        cols, rows = req.term_size
+        env = dict(os.environ, **req.env, COLUMNS=str(cols), LINES=str(rows))
+        deadline = self.config.run_deadline
+        async with self._runs:
+            start = time.perf_counter()
+            try:
+                r = await asyncio.to_thread(run_cmd, cmd, True, deadline, argv, env)
+            except (subprocess.TimeoutExpired, OSError):
+                r = None
+            seconds = time.perf_counter() - start
+        seconds = float("inf") if r is None else seconds
+        data = r.stdout if r is not None and r.returncode == 0 else None
+        await asyncio.to_thread(self._save, index.fetcher(i), key, data, seconds)
+        return data or None
+
+    def _save(self, fetcher: str, key: str, data: bytes | None, seconds: float):
+        self.stats.record(fetcher, seconds)
+        self.stats.save()
+        if data:
+            self.cache.put(key, data)
+
+    async def _fill(self, pool_key: tuple, req: Request, features):
+        attempts = self.pool_size * 3
+        while attempts > 0 and len(self.pools.get(pool_key, ())) < self.pool_size:
+            attempts -= 1
+            try:
+                data = await self.render_one(req, features)
+            except OSError:
+                # The cache or the stats could not be saved, e.g. on a full disk.
+                # Nobody waits for this task, so the error is dropped here.
+                return
+            pool = self.pools.get(pool_key)
+            if pool is None:
+                # Dropped by a reload meanwhile.
+                return
+            if data:
+                pool.append(data)
+
+    def _pool(self, pool_key: tuple) -> deque[bytes]:
+        pool = self.pools.get(pool_key)
+        if pool is None:
+            pool = self.pools[pool_key] = deque()
+            while len(self.pools) > MAX_POOLS:
+                self.pools.popitem(last=False)
+        self.pools.move_to_end(pool_key)
+        return pool
+
+    def refill(self, pool_key: tuple, req: Request, features):
+        """Top up a pool in the background, unless that is already happening."""
+        task = self._filling.get(pool_key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fill(pool_key, req, features))
+            self._filling[pool_key] = task
+
+    async def answer(self, req: Request) -> bytes | None:
+        index = self.index
+        if index is None:
+            return None
+        features = self.features(req.env)
+        if req.op == "pick":
+            i = self._pick(index, features, req.term_size)
+            return b"" if i is None else (index[i] + "\n").encode()
+        if req.op == "render":
+            term = tuple(req.env.get(k, "") for k in KEY_ENV)
+            pool_key = (req.term_size, features, term)
+            pool = self._pool(pool_key)
+            data = pool.popleft() if pool else await self.render_one(req, features)
+            self.refill(pool_key, req, features)
+            return data
+        return None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 5.0)
+            try:
+                data = await self.answer(parse_request(line))
+            except OSError:
+                # The client renders by itself instead.
+                data = None
+            if data is None:
+                writer.write(b"NO\n")
+            else:
+                writer.write(b"OK %d\n" % len(data))
+                writer.write(data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path: str, ready: Callable[[], None] | None = None):
+        """Answer requests on the socket at path until SIGINT or SIGTERM."""
+        await self.reload()
+        server = await start_server(self.handle, path)
+        self._stop = asyncio.Event()
+        self._loop = loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (ValueError, RuntimeError):
+                # Not the main thread.
+                pass
+        watcher = asyncio.create_task(self.watch())
+        if ready:
+            ready()
+        try:
+            async with server:
+                await self._stop.wait()
+        finally:
+            watcher.cancel()
+            for task in self._filling.values():
+                task.cancel()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """Stop serve(). Can be called from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+
+def in_use(path: str) -> bool:
+    """Whether a daemon is answering on the socket at path."""
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+async def start_server(handle, path: str) -> asyncio.AbstractServer:
+    """Listen on path, replacing a socket left behind by a daemon that died. Raises
+    FileExistsError if another daemon is running, and PermissionError if the folder of
+    path is not a private_dir(), e.g. one another user created first."""
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    if not private_dir(folder):
+        raise PermissionError(
+            f"{folder} must be a folder owned by you that others cannot access"
+        )
+    if os.path.exists(path):
+        if in_use(path):
+            raise FileExistsError(f"A randofetch daemon is running on {path}")
+        os.unlink(path)
+    return await asyncio.start_unix_server(handle, path, backlog=256)
@@ -1,28 +1,69 @@
 import logging
 import os
-import pickle
 import random
 import shlex
 import subprocess
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import TypeVar
-
-import ruamel.yaml
-import tqdm
+from typing import Callable, NamedTuple, TypeVar
 
+from randofetch.cli import caps, trace
+from randofetch.cli.calibrate import Calibration, Profile, measure, measure_size
 from randofetch.cli.config import BaseConfig
+from randofetch.cli.index import IMAGE_SLOT, CommandIndex, load_index, write_index
+from randofetch.cli.procs import kill_group
 
 logger = logging.getLogger(__name__)
 Fetchtp = TypeVar("Fetchtp", bound="Fetcher")
 
 
+def run_cmd(
+    cmd: str,
+    silent: bool = False,
+    timeout: float | None = None,
+    argv: list[str] | None = None,
+    env: dict[str, str] | None = None,
+):
+    """Run a fetcher. With argv the program is executed directly, without a shell and
+    without inheriting open file descriptors; cmd is then only used for reporting.
+    Without argv, cmd is run through the shell. env replaces the environment.
+    With a timeout, the fetcher runs in its own process group; if it is still running
+    when the timeout expires the whole group (fetcher and anything it spawned) is
+    killed and subprocess.TimeoutExpired is raised.
+    OSError is raised if an argv program cannot be executed."""
+    args = argv or cmd
+    shell = not argv
+    if timeout is None:
+        return subprocess.run(
+            args, capture_output=silent, shell=shell, close_fds=True, env=env
+        )
+    pipe = subprocess.PIPE if silent else None
+    with subprocess.Popen(
+        args,
+        shell=shell,
+        stdout=pipe,
+        stderr=pipe,
+        close_fds=True,
+        start_new_session=True,
+        env=env,
+    ) as p:
+        try:
+            out, err = p.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_group(p)
+            p.communicate()
+            raise
+    return subprocess.CompletedProcess(cmd, p.returncode, out, err)
+
+
 class Fetcher:
     """Fetcher
     Class that represents and maintains a combination of a Fetcher program's path, arguments, and image file.
-    This class is created once, and stored in a PKL file in the XDG_CONFIG_HOME path.
+    This class is created during a scan; only its rendered cmd is stored, in the command index
+    (see randofetch.cli.index) in the XDG_CONFIG_HOME path.
     """
 
     # name: str = "uwufetch"
@@ -35,12 +76,19 @@ class Fetcher:
     _cache = None
     #    needs_image: bool = False
     image_args = ""
+    image_argv: tuple[str, ...] = ()
+    image: Path | None = None
+    # Set on fetchers that stand for one command per library image; the image is
+    # filled in when an entry is picked (see randofetch.cli.index).
+    image_method: "ImageMethod | None" = None
+    # Fetchers are executed directly from argv unless their config sets `shell: true`.
+    shell: bool = False
 
     def __init__(
         self,
         name: str,
         path: str,
-        args: str,
+        args: str | list[str] | None,
         extra_reqs: str | None = None,
         needs_image: bool = False,
     ):
@@ -73,9 +121,34 @@ class Fetcher:
 
         return self._args
 
-    def exists(self) -> bool:
-        r = subprocess.run(self.path, shell=True, capture_output=True).returncode
-        print(f"Result for {self.name} / {self.path}: {r}")
+    @property
+    def main_argv(self) -> list[str]:
+        if self.args is None:
+            return []
+        args = self.args if isinstance(self.args, list) else [self.args]
+        return [
+            os.path.expandvars(os.path.expanduser(a))
+            for arg in args
+            for a in shlex.split(str(arg))
+        ]
+
+    @property
+    def argv(self) -> list[str]:
+        """The command as an argument vector. Raises ValueError if the args cannot be
+        split (e.g. unbalanced quotes)."""
+        return [self.path, *self.image_argv, *self.main_argv]
+
+    def exists(self, timeout: float | None = None) -> bool:
+        if self.shell:
+            r = run_cmd(self.path, silent=True, timeout=timeout).returncode
+        elif caps.which(self.path) is None:
+            r = 127
+        else:
+            try:
+                r = run_cmd(self.path, True, timeout, argv=[self.path]).returncode
+            except OSError:
+                r = 127
+        logger.info(f"Result for {self.name} / {self.path}: {r}")
         if self.path == "chafa":
             return r != 127
         else:
@@ -83,37 +156,58 @@ class Fetcher:
 
     def check_extras(self):
         match self.extra_reqs:
+            case None:
+                return True
             case "iterm":
-                return "ITERM" in "\n ".join(list(os.environ.keys()))
+                return caps.detect().supports("iterm")
             case _:
                 pass
 
-        r = subprocess.run(
-            f"which {self.extra_reqs}", capture_output=True, shell=True
-        ).returncode
+        found = caps.which(str(self.extra_reqs))
+        logger.info(f"Fetcher {self.name} needs {self.extra_reqs}: found {found}")
+        return found is not None
 
-        if r == 0:
-            logger.info(
-                f"Fetcher {self.name} ran `which {self.extra_reqs}` and got return code of {r}"
-            )
-        return r != 127
+    def check_image(self) -> bool:
+        """The image dependent part of a probe. The fetcher binary itself is probed once
+        for all of its image clones (see ProbeCache)."""
+        return self.image is None or os.access(self.image, os.R_OK)
 
-    def run(self, silent: bool = False):
-        return subprocess.run(self.cmd, capture_output=silent, shell=True)
+    def run(self, silent: bool = False, timeout: float | None = None):
+        """Run the fetcher. With a timeout the fetcher's process group is killed once
+        it expires, and subprocess.TimeoutExpired is raised."""
+        return run_cmd(self.cmd, silent, timeout, None if self.shell else self.argv)
 
-    def run_silent(self):
+    def run_silent(self, timeout: float | None = None):
         if not self._cache:
-            self._cache = self.run(True).stdout
+            self._cache = self.run(True, timeout).stdout
         return self._cache
 
     @property
     def cmd(self):
+        if not self.shell:
+            try:
+                return shlex.join(self.argv)
+            except ValueError:
+                pass
         st = f"{self.image_args if self.image_args else ''} {self.main_args}"
 
         # need to validate more shellx quote / paths.. I was trying this out too:
         # s1 = f"{self.path}  " + shlex.quote(st)
         return f"{self.path}  " + st
 
+    @classmethod
+    def from_config(cls, cfg: dict) -> "Fetcher":
+        """A fetcher from its entry in the fetchers list of fetchers.yaml."""
+        f = cls(
+            name=cfg["name"],
+            path=cfg["path"],
+            args=cfg.get("args"),
+            extra_reqs=cfg.get("extra_reqs"),
+            needs_image=bool(cfg.get("needs_image", False)),
+        )
+        f.shell = bool(cfg.get("shell", False))
+        return f
+
     @staticmethod
     def clone(other: Fetchtp):
         f = Fetcher(
@@ -123,6 +217,7 @@ class Fetcher:
             extra_reqs=other.extra_reqs,
             needs_image=other.needs_image,
         )
+        f.shell = other.shell
         return f
 
     def __str__(self):
@@ -135,15 +230,93 @@ class ImageMethod:
     caller: str = "fastfetch"
 
     args: str = " --chafa-color-space RGB --chafa-fg-only False"
+    # Terminal feature the output needs (see randofetch.cli.caps), e.g. "sixel".
+    requires: str | None = None
 
     def check_caller(self, other: Fetcher):
         return other.name == self.caller
 
+    def image_argv(self, image: Path | str) -> list[str]:
+        """args as an argument vector, with {} replaced by the image path (or by image
+        itself, if it is a str such as IMAGE_SLOT)."""
+        path = image if isinstance(image, str) else str(image.absolute())
+        argv = []
+        for m in self.args:
+            if isinstance(m, dict) or m == "{}":
+                # A bare `{}` in the YAML config loads as an empty mapping.
+                argv.append(path)
+            else:
+                argv.extend(a.replace("{}", path) for a in shlex.split(str(m)))
+        return argv
+
+    def image_args(self, image: Path | str) -> str:
+        """args as a shell string, with {} replaced by the quoted image path (or by
+        image itself, if it is a str such as IMAGE_SLOT)."""
+        path = image if isinstance(image, str) else shlex.quote(str(image.absolute()))
+        mags = ""
+        for m in self.args:
+            if " " in m:
+                m = shlex.quote(m)
+            mags = f"{mags} {m}"
+        return mags.replace("{}", path)
+
+
+class Pick(NamedTuple):
+    cmd: str
+    image: str | None = None
+    argv: list[str] | None = None
+    # What run times are recorded under, see CommandIndex.fetcher. cmd if None.
+    fetcher: str | None = None
+
+
+def env_fingerprint() -> tuple:
+    """The parts of the environment that can change whether a fetcher is usable."""
+    env = os.environ
+    return (
+        env.get("PATH"),
+        env.get("TERM"),
+        env.get("TERM_PROGRAM"),
+        env.get("COLORTERM"),
+        tuple(sorted(k for k in env if "ITERM" in k)),
+    )
+
+
+class ProbeCache:
+    """Results of probing fetcher binaries during one scan.
+    Every image clone of a fetcher shares the same path and extra_reqs, so the probe
+    for each distinct (path, extra_reqs, environment) runs once, even when several
+    workers ask for it at the same time."""
+
+    def __init__(self, probe: Callable[[Fetcher], tuple[bool, float | bool]]):
+        self._probe = probe
+        self._env = env_fingerprint()
+        self._lock = threading.Lock()
+        self._results: dict[tuple, Future] = {}
+
+    def get(self, fetcher: Fetcher) -> tuple[bool, float | bool]:
+        key = (fetcher.path, fetcher.extra_reqs, self._env)
+        with self._lock:
+            fut = self._results.get(key)
+            owner = fut is None
+            if fut is None:
+                fut = self._results[key] = Future()
+        if owner:
+            try:
+                fut.set_result(self._probe(fetcher))
+            except BaseException as e:
+                fut.set_exception(e)
+        return fut.result()
+
+    def __len__(self):
+        return len(self._results)
+
 
 class FetcherSet:
     _fetchers: list[Fetcher] = []
     _timing: list[float] = []
     _max_latency: float = 2.2
+    workers: int = 8
+    probe_timeout: float | None = None
 
     def __init__(
         self,
@@ -151,23 +324,71 @@ class FetcherSet:
         save_file: Path,
         fetcher_list: list[Fetcher] | None = None,
         max_time: float = 1.1,
+        sources: list[Path] | None = None,
+        workers: int | None = None,
+        probe_timeout: float | None = None,
+        images: list[tuple[Path, Path]] | None = None,
+        check_sources: bool = True,
+        calibration: Calibration | None = None,
     ):
+        """
+        :param reset: Probe fetcher_list and write a new index to save_file. Implied
+        when save_file is missing, from an older version, or stale.
+        :param images: (image, file given to fetchers) pairs, see init_image_list.
+        Fetchers with an image_method are expanded over the readable ones.
+        :param sources: Files the fetcher list was built from. If any of them changes
+        after the scan, the saved index is treated as stale.
+        :param workers: Number of fetchers probed at once during a scan.
+        :param probe_timeout: Seconds before a hung probe is killed.
+        :param check_sources: Treat a stale save_file as missing. Callers that hold or
+        wait for the scan lock (see randofetch.cli.atomic) turn this off.
+        :param calibration: How the commands of the fetchers are timed during a scan
+        (see randofetch.cli.calibrate).
+        """
         super().__init__()  # Why does my linter complain if I don't call this?
         self._mutable_fetchers: list[Fetcher] = []
         self.max_latency: float = max_time
         self.timing: list[tuple[str, float | bool]] = []
-        reset = reset or not (save_file.exists())
-        if not reset:
-            with open(save_file, "rb") as pf:
-                fetchers: list[Fetcher] = pickle.load(pf)
-                self.fetchers = fetchers
-        else:
+        self.profiles: list[Profile | None] = []
+        self.images: list[tuple[Path, Path]] = []
+        index = None if reset else load_index(save_file, check_sources)
+        if index is None:
             if fetcher_list is not None:
-                self.init_fetchers(fetcher_list)
-                with open(save_file, "wb") as f:
-                    pickle.dump(self.fetchers, f)
+                with trace.phase("scan"):
+                    self.images = [
+                        (img, src)
+                        for img, src in images or []
+                        if os.access(src, os.R_OK)
+                    ]
+                    self.init_fetchers(
+                        fetcher_list, workers, probe_timeout, calibration
+                    )
+                self.save(save_file, sources)
+                index = load_index(save_file, check_sources=False)
+                if index is None:
+                    raise OSError(f"Could not read back {save_file} after the scan")
             else:
                 raise ValueError("If reset need a list of fetchers")
+        self.index: CommandIndex = index
+
+    def save(self, save_file: Path, sources: list[Path] | None = None):
+        """Write the scanned set to save_file as a command index (see
+        randofetch.cli.index), with its images and the fetchers' profiles."""
+        write_index(
+            save_file,
+            [f.cmd for f in self.fetchers],
+            sources,
+            images=[
+                (str(img), None if src == img else str(src)) for img, src in self.images
+            ],
+            image=[f.image and str(f.image) for f in self.fetchers],
+            argv=[None if f.shell else "\0".join(f.argv) for f in self.fetchers],
+            each_image=["1" if f.image_method else None for f in self.fetchers],
+            requires=[
+                f.image_method and f.image_method.requires for f in self.fetchers
+            ],
+            **Profile.columns(self.profiles),
+        )
 
     @classmethod
     def _fetcher_list(cls, fl: list[Fetcher]):
@@ -182,98 +403,219 @@ class FetcherSet:
         FetcherSet._fetcher_list(fl)
         self._mutable_fetchers = fl
 
-    def init_fetchers(self, fetchers: list[Fetcher]):
-        def check_f(fetcher: Fetcher):
-            start = time.perf_counter()
-            if fetcher.exists():
-                end = time.perf_counter()
-                if fetcher.check_extras():
-                    return fetcher, end - start
-                else:
-                    return False, end - start
+    def check_f(self, fetcher: Fetcher):
+        """Probe one fetcher. Returns (fetcher or False, seconds or False). A probe that
+        runs past probe_timeout is killed and reported as (False, probe_timeout)."""
+        start = time.perf_counter()
+        try:
+            found = fetcher.exists(timeout=self.probe_timeout)
+        except subprocess.TimeoutExpired as e:
+            logger.info(f"Fetcher {fetcher.name} killed after {e.timeout}s")
+            return False, float(e.timeout)
+        if found:
+            end = time.perf_counter()
+            if fetcher.check_extras():
+                return fetcher, end - start
             else:
+                return False, end - start
+        else:
+            return False, False
+
+    def _probe_binary(self, fetcher: Fetcher):
+        res, t = self.check_f(fetcher)
+        return isinstance(res, Fetcher), t
+
+    def _admit(self, fetcher: Fetcher):
+        if not fetcher.shell:
+            try:
+                fetcher.argv
+            except ValueError as e:
+                logger.warning(f"Fetcher {fetcher.name} has invalid args: {e}")
                 return False, False
-
+        found, t = self._probes.get(fetcher)
+        if found and fetcher.check_image():
+            return fetcher, t
+        return False, t
+
+    def _timed_args(
+        self, fetcher: Fetcher, image: int = 0
+    ) -> tuple[str, ...] | str | None:
+        """What calibration runs for fetcher: its command, with library image `image`
+        for an image method. None if there is no image to try an image method on."""
+        if fetcher.image_method is None:
+            return fetcher.cmd if fetcher.shell else tuple(fetcher.argv)
+        if not self.images:
+            return None
+        src = str(self.images[image][1])
+        if fetcher.shell:
+            return fetcher.cmd.replace(IMAGE_SLOT, shlex.quote(src))
+        return tuple(a.replace(IMAGE_SLOT, src) for a in fetcher.argv)
+
+    def init_fetchers(
+        self,
+        fetchers: list[Fetcher],
+        workers: int | None = None,
+        probe_timeout: float | None = None,
+        calibration: Calibration | None = None,
+    ):
+        """Probe fetchers concurrently, time the commands of the ones that exist, and
+        keep those whose calibrated percentile is within max_latency. Results
+        (self.fetchers, self.timing, self.profiles) are in the order of fetchers,
+        regardless of which probe finishes first. self.timing holds the calibrated
+        percentile, or the probe time of fetchers that were not timed.
+
+        Image methods are timed on self.images[0], and their output size is the
+        largest measured on calibration.size_images images spread over the library.
+        While there are no images they are kept, untimed, since they stand for no
+        entries anyway.
+
+        :param workers: Maximum number of probes running at once.
+        :param probe_timeout: Seconds before a hung probe or command is killed.
+        """
+        import tqdm
+
+        if probe_timeout is not None:
+            self.probe_timeout = probe_timeout
+        calibration = calibration or Calibration()
+        self._probes = ProbeCache(self._probe_binary)
+        with ThreadPoolExecutor(max(1, workers or self.workers)) as e:
+            futures = [e.submit(self._admit, f) for f in fetchers]
+            for _ in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                pass
+        results = [fu.result() for fu in futures]
+
+        # Fetchers with the same command (e.g. image clones whose image is not in
+        # their argv) are timed once.
+        timed_args = [
+            self._timed_args(res) if isinstance(res, Fetcher) else None
+            for res, _ in results
+        ]
+        # The logo of an image method follows the image's aspect ratio, so its size is
+        # also measured on a few more images.
+        n, m = len(self.images), calibration.size_images
+        more_images = sorted({k * n // m for k in range(1, m)} - {0}) if n > 1 else []
+        with trace.phase("calibrate"):
+            with ThreadPoolExecutor(calibration.n_workers) as e:
+                timed = {
+                    args: e.submit(
+                        measure,
+                        args if isinstance(args, str) else list(args),
+                        isinstance(args, str),
+                        calibration,
+                        self.probe_timeout,
+                    )
+                    for args in dict.fromkeys(timed_args)
+                    if args is not None
+                }
+                sized: dict[tuple[str, ...] | str | None, list[Future]] = {}
+                for (res, _), args in zip(results, timed_args):
+                    if args is None or args in sized or res.image_method is None:
+                        continue
+                    more = (self._timed_args(res, k) for k in more_images)
+                    sized[args] = [
+                        e.submit(
+                            measure_size,
+                            a if isinstance(a, str) else list(a),
+                            isinstance(a, str),
+                            self.probe_timeout,
+                        )
+                        for a in more
+                        if a is not None
+                    ]
+                runs = [*timed.values(), *(f for fs in sized.values() for f in fs)]
+                for _ in tqdm.tqdm(as_completed(runs), total=len(runs)):
+                    pass
+
+        admitted: list[Fetcher] = []
+        profiles: list[Profile | None] = []
         times: list[tuple[str, float | bool]] = []
-        for f in tqdm.tqdm(fetchers):
-            res, t = check_f(f)
-            print(f)
+        for (res, t), args in zip(results, timed_args):
             c: str = ""
             if isinstance(res, Fetcher):
-                if t <= self.max_latency:
-                    self.fetchers.append(res)
-                else:
-                    _, t = check_f(f)  # Run twice?
-                    if t <= self.max_latency:
-                        self.fetchers.append(res)
                 c = res.cmd
+                profile = None if args is None else timed[args].result()
+                if profile is not None:
+                    t = profile.p95
+                    sizes = [f.result() for f in sized.get(args, ())]
+                    sizes = [(profile.width, profile.height), *filter(None, sizes)]
+                    profile = profile._replace(
+                        width=max(w for w, _ in sizes), height=max(h for _, h in sizes)
+                    )
+                elif res.image_method is None or self.images:
+                    # Its command failed or timed out.
+                    t = False
+                if t is not False and t <= self.max_latency:
+                    admitted.append(res)
+                    profiles.append(profile)
             timing: float | bool = t if isinstance(t, float) else False
             times.append((c, timing))
 
+        self.fetchers = admitted
+        self.profiles = profiles
         self.timing = times
-        # Old threaded mode here.... not really needed...
-        #        workers = []
-
-        # with ThreadPoolExecutor(20) as e:
-        #     for fetcher in fetchers:
-        #         fa = e.submit(check_f, fetcher)
-        #         workers.append(fa)
-
-        #     for fr in tqdm.tqdm(as_completed(workers)):
-        #         results = fr.result()
-        #         fetch_ok = results[0]
-        #         fetch_time = results[1]
-
-        #         if isinstance(fetch_ok, Fetcher):
-        #             if fetch_time <= self.max_latency:
-        #                 self.fetchers.append(fetcher)
-
-        # if fetcher.exists() and fetcher.check_extras():
-
-        # self.fetchers.append(fetcher)
-        # else:
-        #    print(f"{fetcher.name}{fetcher.path=} Not found!?")
-
-        print(f"Found {len(self.fetchers)}")
-        # Py 3.11 compatibility:
-        fm = "\n".join([f.cmd for f in self.fetchers])
-        print(fm)
+        logger.info(f"Probed {len(self._probes)} binaries for {len(fetchers)} fetchers")
 
     @property
     def fetcher(self):
-        f = self.fetchers[random.randint(0, len(self.fetchers) - 1)]
-        if f is None:
-            # Fail silently since this is a startup / shell program
-            # @TODO: Raise an exception, and have the CLI manage error conditions
-            exit(0)
-        return f
-
-    def run_fetcher(self):
-        self.fetcher.run
-
-    def get_cmd(self):
-        return self.fetcher.cmd
+        """A random fetcher found by the scan. Raises IndexError if there is none."""
+        return random.choice(self.fetchers)
+
+    def run_fetcher(self, timeout: float | None = None):
+        p = self.pick()
+        if p is not None:
+            return run_cmd(p.cmd, timeout=timeout, argv=p.argv)
+
+    def pick(self, stats=None, term_caps=None, term_size=None) -> Pick | None:
+        """A random entry from the saved set, or None if the set is empty.
+        With stats (a LatencyStats), fetchers that have recently been slower than
+        max_latency are skipped. With term_caps (a TermCaps), so are image methods the
+        terminal cannot display. Fetchers whose output was measured to be larger than
+        term_size (columns, lines; the current terminal by default) are skipped too,
+        without running them."""
+        accept = None
+        if stats is not None:
+            accept = stats.acceptor(
+                self.index,
+                self.max_latency,
+                BaseConfig.latency_min_samples,
+                BaseConfig.latency_explore,
+            )
+        rows = None
+        if term_caps is not None:
+            rows = self.index.supported_rows(term_caps.features)
+        rows = self.index.fitting_rows(term_size or caps.terminal_size((0, 0)), rows)
+        i = self.index.random_entry(accept, rows=rows)
+        if i is None:
+            return None
+        index = self.index
+        return Pick(index[i], index.get(i, "image"), index.argv(i), index.fetcher(i))
+
+    def get_cmd(self) -> str | None:
+        return self.index.pick()
 
     def print_cmd(self):
-        print(self.fetcher.cmd)
+        cmd = self.get_cmd()
+        if cmd is not None:
+            print(cmd)
 
 
 def init_imagem_list(base_config: BaseConfig) -> list[ImageMethod]:
     im_dict = base_config.image_configs
     im_list: list[ImageMethod] = []
     for im_name, params in im_dict.items():
-        method = ImageMethod(name=im_name, caller=params["caller"], args=params["args"])
+        method = ImageMethod(
+            name=im_name,
+            caller=params["caller"],
+            args=params["args"],
+            requires=params.get("requires", caps.METHOD_REQUIRES.get(im_name)),
+        )
         im_list.append(method)
     return im_list
 
 
 def init_fetcher_list(base_config: BaseConfig):
     fetchers = []
-
-    yaml = ruamel.yaml.YAML()
-    yaml.register_class(Fetcher)
-    ycfg = yaml.load(base_config.yaml_config_file)
-    fetcher_configs = ycfg["fetchers"]
+    fetcher_configs = [Fetcher.from_config(f) for f in base_config.fetcher_configs]
 
     image_methods = init_imagem_list(base_config)
 
@@ -288,26 +630,37 @@ def init_fetcher_list(base_config: BaseConfig):
         if fetcher.needs_image and check_fim(fetcher):
             for im in image_methods:
                 if im.check_caller(fetcher):
-                    for image in base_config.image_list:
-                        fx = Fetcher.clone(fetcher)
-                        mags = ""
-                        for m in im.args:
-                            if " " in m:
-                                m = shlex.quote(m)
-                            mags = f"{mags} {m}"
-                            print(mags)
-
-                        # mags = " ".join(im.args)
-                        fx.image_args = mags.replace(
-                            "{}", shlex.quote(str(image.absolute()))
-                        )
-
-                        fetchers.append(fx)
+                    # One fetcher per image method; images are combined with it only
+                    # when an entry is picked.
+                    fx = Fetcher.clone(fetcher)
+                    fx.image_method = im
+                    fx.image_argv = tuple(im.image_argv(IMAGE_SLOT))
+                    fx.image_args = im.image_args(IMAGE_SLOT)
+                    fetchers.append(fx)
         else:
             fetchers.append(fetcher)
     return fetchers
 
 
+def init_image_list(base_config: BaseConfig) -> list[tuple[Path, Path]]:
+    """(image, file given to fetchers) for each library image. The file is a
+    downscaled thumbnail when there is a thumbnail cache, else the image itself."""
+    entries = base_config.images()
+    images = {e.path: e.path for e in entries}
+    thumbs = base_config.thumb_cache()
+    if thumbs is not None:
+        from randofetch.cli.thumbs import target_edge
+
+        edge = target_edge()
+        with trace.phase("thumbs"):
+            with ThreadPoolExecutor(base_config.scan_workers) as ex:
+                scaled = ex.map(lambda e: thumbs.get(e.path, edge, e.digest), entries)
+                images = dict(zip(images, scaled))
+        thumbs.prune(e.digest for e in entries)
+        thumbs.evict(keep=images.values())
+    return list(images.items())
+
+
 if __name__ == "__main__":
     c = BaseConfig(reset_config=True)
     l = init_fetcher_list(c)
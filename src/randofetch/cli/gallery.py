@@ -0,0 +1,133 @@
+"""Batch rendering of the saved fetcher set, for `randofetch render-all`.
+
+Every entry of the set (or a random sample of them) is rendered under a fixed terminal
+size, with a bounded number of fetchers running at once. Each output is written to
+<out_dir>/<entry>.out, and report.json lists the command, image, exit status, run time
+and output size of every render. Successful renders can also be stored in the render
+cache, so the first `randofetch show` for each of them is a cache hit.
+"""
+import json
+import os
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
+from randofetch.cli.fetcher import run_cmd
+from randofetch.cli.index import CommandIndex
+from randofetch.cli.render import RenderCache
+
+
+class RenderResult(NamedTuple):
+    entry: int
+    cmd: str
+    image: str | None
+    # None if the fetcher could not be started or ran past the timeout.
+    returncode: int | None
+    seconds: float
+    size: int
+    output: str
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and self.size > 0
+
+
+def parse_size(size: str) -> tuple[int, int]:
+    """(cols, rows) from "COLSxROWS"."""
+    cols, _, rows = size.lower().partition("x")
+    try:
+        return int(cols), int(rows)
+    except ValueError:
+        raise ValueError(f"Terminal size {size!r} is not COLSxROWS") from None
+
+
+def entries(index: CommandIndex, sample: int | None = None, seed=None) -> list[int]:
+    """Every entry of index, or a random sample of them in index order."""
+    if sample is None or sample >= len(index):
+        return list(range(len(index)))
+    return sorted(random.Random(seed).sample(range(len(index)), sample))
+
+
+def render_entry(
+    index: CommandIndex,
+    i: int,
+    out_dir: Path,
+    term_size: tuple[int, int],
+    timeout: float | None = None,
+    cache: RenderCache | None = None,
+) -> RenderResult:
+    cmd = index[i]
+    image = index.get(i, "image")
+    cols, rows = term_size
+    env = dict(os.environ, COLUMNS=str(cols), LINES=str(rows))
+    start = time.perf_counter()
+    try:
+        r = run_cmd(cmd, True, timeout, index.argv(i), env=env)
+    except (subprocess.TimeoutExpired, OSError):
+        r = None
+    seconds = time.perf_counter() - start
+    output = f"{i:06d}.out"
+    data = r.stdout if r is not None else b""
+    (out_dir / output).write_bytes(data)
+    returncode = None if r is None else r.returncode
+    result = RenderResult(i, cmd, image, returncode, seconds, len(data), output)
+    if cache is not None and result.ok:
+        cache.put(cache.key(cmd, image, term_size), data)
+    return result
+
+
+def render_all(
+    index: CommandIndex,
+    out_dir: str | Path,
+    term_size: tuple[int, int],
+    picks: list[int],
+    workers: int = 4,
+    timeout: float | None = None,
+    cache: RenderCache | None = None,
+    progress=None,
+) -> list[RenderResult]:
+    """Render the picked entries of index into out_dir, at most workers at a time, and
+    write report.json. Results are in the order of picks.
+
+    :param progress: Wraps the iterator of finished renders (e.g. tqdm.tqdm).
+    :param cache: Successful renders are stored here, keyed for term_size.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max(1, workers)) as ex:
+        futures = [
+            ex.submit(render_entry, index, i, out_dir, term_size, timeout, cache)
+            for i in picks
+        ]
+        done = as_completed(futures)
+        for _ in progress(done, total=len(futures)) if progress else done:
+            pass
+    results = [f.result() for f in futures]
+    report = {
+        "term_size": list(term_size),
+        "entries": len(index),
+        "results": [r._asdict() for r in results],
+    }
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2))
+    return results
+
+
+def summary(results: list[RenderResult], slowest: int = 10) -> list[str]:
+    """Lines describing the failed and the slowest renders."""
+    failed = [r for r in results if not r.ok]
+    lines = [f"{len(results) - len(failed)} of {len(results)} rendered"]
+    if failed:
+        lines.append(f"{len(failed)} failed:")
+        for r in failed:
+            status = "timed out" if r.returncode is None else f"exit {r.returncode}"
+            if r.returncode == 0:
+                status = "no output"
+            lines.append(f"  {r.output}  {status:<10} {r.cmd}")
+    if slowest > 0 and results:
+        lines.append("Slowest:")
+        for r in sorted(results, key=lambda r: r.seconds, reverse=True)[:slowest]:
+            lines.append(f"  {r.output}  {r.seconds * 1000:8.1f} ms  {r.cmd}")
+    return lines
@@ -0,0 +1,355 @@
+"""Persistent index of the image library.
+
+Images used to be found by globbing app_data_path() once per pattern every time a
+BaseConfig was made. The index remembers the path, size, mtime and content hash of
+each image, and is stored in the command index format (see randofetch.cli.index) with
+the scanned folders as its sources. It is only rebuilt when one of those folders has
+changed, with a single os.scandir pass per folder, and only new or changed files are
+hashed again. Concurrent refreshes take turns, and the later ones reuse the index the
+first one wrote.
+
+import_images adds images to the library for `randofetch add-images`, skipping files
+whose content is in it already.
+"""
+import errno
+import itertools
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import NamedTuple
+
+from randofetch.cli import trace
+from randofetch.cli.atomic import WriterLock, tmp_path
+from randofetch.cli.index import CommandIndex, load_index, write_index
+from randofetch.cli.render import file_hash
+
+
+class ImageRoot(NamedTuple):
+    path: Path
+    recursive: bool = False
+
+
+class ImageEntry(NamedTuple):
+    path: Path
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+def matches(name: str, globs: list[str]) -> bool:
+    return any(fnmatchcase(name, g) for g in globs)
+
+
+def walk(
+    roots: list[ImageRoot], globs: list[str], exclude=()
+) -> tuple[dict[str, os.stat_result], list[str]]:
+    """Files under roots whose names match globs, and the folders that were searched.
+    Hidden files and folders are skipped, and so are the folders in exclude."""
+    files: dict[str, os.stat_result] = {}
+    dirs: dict[str, None] = {}
+    stack = [(str(r.path), r.recursive) for r in reversed(roots)]
+    while stack:
+        folder, recursive = stack.pop()
+        if folder in dirs:
+            continue
+        # Missing roots are kept as sources, so creating them makes the index stale.
+        dirs[folder] = None
+        try:
+            it = os.scandir(folder)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.name.startswith("."):
+                    continue
+                try:
+                    if e.is_dir():
+                        if recursive and e.path not in exclude:
+                            stack.append((e.path, True))
+                    elif e.is_file() and matches(e.name, globs):
+                        files[e.path] = e.stat()
+                except OSError:
+                    continue
+    return files, list(dirs)
+
+
+class ImageIndex:
+    def __init__(
+        self,
+        save_file: str | Path,
+        roots: list[ImageRoot],
+        globs: list[str],
+        exclude: list[Path] | None = None,
+        workers: int = 8,
+    ):
+        """
+        :param roots: Folders to look for images in. Subfolders are searched too for
+        recursive roots, except for hidden ones and those in exclude.
+        :param globs: File name patterns of images, e.g. "*.png".
+        :param workers: Number of files hashed at once.
+        """
+        self.save_file = Path(save_file)
+        self.roots = roots
+        self.globs = globs
+        self.exclude = {str(p) for p in exclude or []}
+        self.workers = workers
+        # Folders searched by the last refresh.
+        self.dirs: list[str] = []
+
+    def is_stale(self, index: CommandIndex) -> bool:
+        sources = {p for p, _ in index.sources}
+        roots = {str(r.path) for r in self.roots}
+        return not roots <= sources or index.is_stale()
+
+    @staticmethod
+    def _entries(index: CommandIndex) -> list[ImageEntry]:
+        return [
+            ImageEntry(
+                Path(index[i]),
+                int(index.get(i, "size") or 0),
+                int(index.get(i, "mtime") or 0),
+                index.get(i, "hash") or "",
+            )
+            for i in range(len(index))
+        ]
+
+    def refresh(self, force: bool = False, known=()) -> list[ImageEntry]:
+        """The images under the roots. The folders are only searched again if one of
+        them changed since the last refresh, or with force.
+
+        :param known: ImageEntry of files whose hash is known already (see
+        import_images), which are not read again if their size and mtime match.
+        """
+        old = load_index(self.save_file, check_sources=False)
+        if old is not None and not force and not self.is_stale(old):
+            self.dirs = [p for p, _ in old.sources]
+            return self._entries(old)
+        self.save_file.parent.mkdir(parents=True, exist_ok=True)
+        with WriterLock(self.save_file):
+            if not force:
+                # Another process may have refreshed it while this one waited.
+                old = load_index(self.save_file, check_sources=False)
+                if old is not None and not self.is_stale(old):
+                    self.dirs = [p for p, _ in old.sources]
+                    return self._entries(old)
+            return self._rebuild(old, known)
+
+    def _rebuild(self, old: CommandIndex | None, known=()) -> list[ImageEntry]:
+        prev = {} if old is None else {str(e.path): e for e in self._entries(old)}
+        prev.update((str(e.path), e) for e in known)
+
+        def entry(item: tuple[str, os.stat_result]) -> ImageEntry | None:
+            path, st = item
+            e = prev.get(path)
+            if e and e.size == st.st_size and e.mtime_ns == st.st_mtime_ns:
+                return e
+            try:
+                digest = file_hash(path)
+            except OSError:
+                return None
+            return ImageEntry(Path(path), st.st_size, st.st_mtime_ns, digest)
+
+        with trace.phase("images"):
+            files, self.dirs = walk(self.roots, self.globs, self.exclude)
+            with ThreadPoolExecutor(max(1, self.workers)) as ex:
+                found = ex.map(entry, sorted(files.items()))
+                entries = [e for e in found if e is not None]
+        write_index(
+            self.save_file,
+            [str(e.path) for e in entries],
+            self.dirs,
+            size=[str(e.size) for e in entries],
+            mtime=[str(e.mtime_ns) for e in entries],
+            hash=[e.digest for e in entries],
+        )
+        return entries
+
+
+class Imported(NamedTuple):
+    source: Path
+    dest: Path | None
+    # "reflink", "link" or "copy" for placed files, else "duplicate", "skipped" or
+    # "failed".
+    how: str
+    digest: str = ""
+    error: str = ""
+
+    @property
+    def placed(self) -> bool:
+        return self.how in ("reflink", "link", "copy")
+
+
+# FICLONE from linux/fs.h: share the extents of one file with another.
+_FICLONE = 0x40049409
+
+
+def _reflink(src: Path, dst: str):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+
+
+def place(src: Path, dest: Path, link: bool = False) -> str:
+    """Put the content of src at dest, which should not exist yet, and return how: as
+    a hard link (with link, on the same filesystem), as a reflink where the filesystem
+    supports it, or else as a copy made by the kernel without reading src into memory.
+    Copies only appear at dest once they are complete. Raises FileExistsError rather
+    than replace a file at dest."""
+    if link:
+        try:
+            os.link(src, dest)
+            return "link"
+        except FileExistsError:
+            raise
+        except OSError:
+            pass
+    tmp = tmp_path(dest)
+    try:
+        try:
+            _reflink(src, tmp)
+            how = "reflink"
+        except (OSError, ImportError):
+            shutil.copyfile(src, tmp)
+            how = "copy"
+        _publish(tmp, dest)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return how
+
+
+def _publish(tmp: str, dest: Path):
+    """Move tmp to dest unless dest exists. link() fails if it does, where rename()
+    would replace it; filesystems without hard links fall back to a check first."""
+    try:
+        os.link(tmp, dest)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, "File exists", str(dest))
+        os.replace(tmp, dest)
+        return
+    os.unlink(tmp)
+
+
+def find_images(
+    paths: list[Path], globs: list[str], recursive: bool = False
+) -> tuple[list[Path], list[Path]]:
+    """(images, others): the files in paths and in the folders in paths (and their
+    subfolders, with recursive) whose names match globs, and the given files that do
+    not."""
+    found: dict[str, None] = {}
+    others = []
+    roots = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            roots.append(ImageRoot(p, recursive))
+        elif matches(p.name, globs):
+            found[str(p)] = None
+        else:
+            others.append(p)
+    files, _ = walk(roots, globs)
+    found.update(dict.fromkeys(sorted(files)))
+    return [Path(f) for f in found], others
+
+
+def _dest(src: Path, digest: str, dest_dir: Path, taken: set[str]) -> Path:
+    """A name in dest_dir for src that is neither taken nor in use: its own name, else
+    with the hash appended, else with a counter after that."""
+    hashed = f"{src.stem}-{digest[:12]}"
+    names = itertools.chain(
+        (src.name, f"{hashed}{src.suffix}"),
+        (f"{hashed}-{n}{src.suffix}" for n in itertools.count(2)),
+    )
+    name = next(n for n in names if n not in taken and not (dest_dir / n).exists())
+    taken.add(name)
+    return dest_dir / name
+
+
+def import_images(
+    paths: list[Path],
+    dest_dir: str | Path,
+    globs: list[str],
+    library=(),
+    recursive: bool = False,
+    link: bool = False,
+    workers: int = 8,
+    progress=None,
+) -> list[Imported]:
+    """Copy the images in paths into dest_dir, skipping any whose content is in library
+    (content hashes, e.g. of BaseConfig.images()) or was imported already. Files are
+    hashed and placed (see place) workers at a time, reading at most one chunk per
+    worker into memory. A name taken in dest_dir gets the hash appended.
+
+    :param progress: Wraps the iterator of hashed files (e.g. tqdm.tqdm).
+    """
+    dest_dir = Path(dest_dir)
+    files, others = find_images(paths, globs, recursive)
+    results = [Imported(p, None, "skipped", error="not an image") for p in others]
+
+    def digest(src: Path) -> str | OSError:
+        try:
+            return file_hash(src)
+        except OSError as e:
+            return e
+
+    def put(job: tuple[Path, Path, str]) -> Imported:
+        src, dest, h = job
+        try:
+            return Imported(src, dest, place(src, dest, link), h)
+        except OSError as e:
+            return Imported(src, None, "failed", h, str(e))
+
+    seen = set(library)
+    taken: set[str] = set()
+    jobs = []
+    with ThreadPoolExecutor(max(1, workers)) as ex:
+        hashed = ex.map(digest, files)
+        if progress:
+            hashed = progress(hashed, total=len(files))
+        for src, h in zip(files, hashed):
+            if isinstance(h, OSError):
+                results.append(Imported(src, None, "failed", error=str(h)))
+            elif h in seen:
+                results.append(Imported(src, None, "duplicate", h))
+            else:
+                seen.add(h)
+                jobs.append((src, _dest(src, h, dest_dir, taken), h))
+        results.extend(ex.map(put, jobs))
+    return results
+
+
+_PLACED_WORDS = (("reflink", "reflinked"), ("link", "linked"), ("copy", "copied"))
+
+
+def import_summary(results: list[Imported]) -> list[str]:
+    """A line counting the results by outcome, then one per failed file."""
+    counts: dict[str, int] = {}
+    for r in results:
+        counts[r.how] = counts.get(r.how, 0) + 1
+    placed = sum(r.placed for r in results)
+    ways = ", ".join(
+        f"{counts[how]} {word}"
+        for how, word in _PLACED_WORDS
+        if counts.get(how)
+    )
+    line = f"Imported {placed} image{'s' if placed != 1 else ''}"
+    if ways:
+        line += f" ({ways})"
+    for how, word in (
+        ("duplicate", "already in the library"),
+        ("skipped", "not images"),
+        ("failed", "failed"),
+    ):
+        if counts.get(how):
+            line += f", {counts[how]} {word}"
+    lines = [line]
+    lines.extend(f"  {r.source}: {r.error}" for r in results if r.how == "failed")
+    return lines
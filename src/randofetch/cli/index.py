@@ -0,0 +1,331 @@
+"""Compact on-disk command index for the saved fetcher set.
+
+The index replaces the old pickled list of Fetcher objects. It is read with a single
+mmap, and picking a command is one random offset lookup; no Fetcher objects are built,
+so changes to the Fetcher class can never break a saved set.
+
+Layout (all integers little endian)::
+
+    header    magic b"RFIX", u16 version, u16 flags, u32 n_sources, u32 n_rows,
+              u32 n_fields, u32 n_images
+    mtimes    n_sources x i64   st_mtime_ns of each source when the index was written
+    offsets   (n_sources + n_fields + n_rows * n_fields + 2 * n_images + 1) x u32,
+              into the blob
+    blob      utf-8 strings: the source paths, the field names, the fields of each row
+              in order, then each image as (path, file given to fetchers). The first
+              field is always "cmd".
+
+Sources are the files and directories the set was built from (fetchers.yaml, the image
+directory). If any of their mtimes changed, the index is stale and should be rebuilt.
+The file is replaced atomically (see randofetch.cli.atomic), never rewritten in place,
+so a rebuild does not disturb processes that have the old one mapped.
+
+A row with its "each_image" field set is a template for one entry per image, with
+IMAGE_SLOT in its cmd and argv standing for the image. The entries are numbered after
+each other, so a fetcher x image method pair is as likely to be picked as it would be
+with one stored row per image, but the file only grows by one path per image and
+nothing proportional to the image count is read when it is opened.
+"""
+import mmap
+import os
+import random
+import struct
+from bisect import bisect_right
+from pathlib import Path
+
+from randofetch.cli import trace
+from randofetch.cli.atomic import is_locked, write_atomic
+
+INDEX_MAGIC = b"RFIX"
+INDEX_VERSION = 3
+IMAGE_SLOT = "%IMAGE%"
+
+_HEADER = struct.Struct("<4sHHIIII")
+_MTIME = struct.Struct("<q")
+_OFFSET = struct.Struct("<I")
+
+
+def _mtime_ns(path: str | Path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def _quote(s: str) -> str:
+    # shlex.quote, without importing shlex (and re) on the fast path.
+    if s and all(c.isalnum() or c in "@%+=:,./-_" for c in s):
+        return s
+    return "'" + s.replace("'", "'\"'\"'") + "'"
+
+
+def write_index(
+    save_file: Path,
+    cmds: list[str],
+    sources: list[Path] | list[str] | None = None,
+    images: list[tuple[str, str | None]] | None = None,
+    **columns: list[str | None],
+):
+    """Write cmds to save_file, recording the current mtime of each source.
+    Extra per-row fields (e.g. image=[...]) are given as keyword arguments, one value
+    per cmd; None is stored as an empty string. images are (path, file given to
+    fetchers) pairs that rows with each_image set are expanded over; the second item
+    may be None when it is the image itself."""
+    src = [str(s) for s in sources or []]
+    fields = ["cmd", *columns]
+    for name, col in columns.items():
+        if len(col) != len(cmds):
+            raise ValueError(f"Column {name} has {len(col)} values for {len(cmds)} cmds")
+    rows = zip(cmds, *columns.values())
+    entries = [v or "" for row in rows for v in row]
+    imgs = [str(v or "") for pair in images or [] for v in pair]
+    strings = [s.encode() for s in src + fields + entries + imgs]
+    offsets = [0]
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+
+    header = _HEADER.pack(
+        INDEX_MAGIC,
+        INDEX_VERSION,
+        0,
+        len(src),
+        len(cmds),
+        len(fields),
+        len(imgs) // 2,
+    )
+    mtimes = [_MTIME.pack(_mtime_ns(s)) for s in src]
+    table = struct.pack(f"<{len(offsets)}I", *offsets)
+    # Readers that have the old file mapped keep it; new readers see the whole new one.
+    write_atomic(save_file, b"".join([header, *mtimes, table, *strings]))
+
+
+class CommandIndex:
+    """Read-only view of an index file. Use load_index() to open one."""
+
+    def __init__(self, buf: mmap.mmap | bytes):
+        self._buf = buf
+        (
+            magic,
+            self.version,
+            _,
+            self.n_sources,
+            self.n_rows,
+            self.n_fields,
+            self.n_images,
+        ) = _HEADER.unpack_from(buf)
+        if magic != INDEX_MAGIC:
+            raise ValueError("Not a randofetch index file")
+        if self.version != INDEX_VERSION:
+            raise ValueError(f"Index version {self.version} != {INDEX_VERSION}")
+        if self.n_fields < 1:
+            raise ValueError("Index has no cmd field")
+        n_strings = (
+            self.n_sources
+            + self.n_fields
+            + self.n_rows * self.n_fields
+            + 2 * self.n_images
+        )
+        self._mtimes = _HEADER.size
+        self._offsets = self._mtimes + self.n_sources * _MTIME.size
+        self._blob = self._offsets + (n_strings + 1) * _OFFSET.size
+        end = self._blob + self._offset(n_strings)
+        if end > len(buf):
+            raise ValueError("Truncated randofetch index file")
+        self.fields = [self._string(self.n_sources + i) for i in range(self.n_fields)]
+        self._entries = self.n_sources + self.n_fields
+        self._images = self._entries + self.n_rows * self.n_fields
+        # First entry number of each row, and whether it expands over the images.
+        self._starts: list[int] = []
+        self._each_image: list[bool] = []
+        self.count = 0
+        for r in range(self.n_rows):
+            each = bool(self._field(r, "each_image"))
+            self._starts.append(self.count)
+            self._each_image.append(each)
+            self.count += self.n_images if each else 1
+
+    def _offset(self, i: int) -> int:
+        return _OFFSET.unpack_from(self._buf, self._offsets + i * _OFFSET.size)[0]
+
+    def _string(self, i: int) -> str:
+        start = self._blob + self._offset(i)
+        end = self._blob + self._offset(i + 1)
+        return self._buf[start:end].decode()
+
+    @property
+    def sources(self) -> list[tuple[str, int]]:
+        mtimes = struct.unpack_from(f"<{self.n_sources}q", self._buf, self._mtimes)
+        return [(self._string(i), mtimes[i]) for i in range(self.n_sources)]
+
+    def is_stale(self) -> bool:
+        return any(_mtime_ns(p) != mt for p, mt in self.sources)
+
+    def __len__(self):
+        return self.count
+
+    def _field(self, r: int, field: str) -> str:
+        try:
+            j = self.fields.index(field)
+        except ValueError:
+            return ""
+        return self._string(self._entries + r * self.n_fields + j)
+
+    def _locate(self, i: int) -> tuple[int, int | None]:
+        """(row, image) of entry i; image is None for rows that do not expand."""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        r = bisect_right(self._starts, i) - 1
+        return r, (i - self._starts[r]) if self._each_image[r] else None
+
+    def get(self, i: int, field: str = "cmd") -> str | None:
+        """Field of entry i. Returns None for fields that are empty or not stored."""
+        r, k = self._locate(i)
+        if k is None:
+            return self._field(r, field) or None
+        image = self._string(self._images + 2 * k)
+        if field == "image":
+            return image
+        v = self._field(r, field)
+        if field in ("cmd", "argv"):
+            src = self._string(self._images + 2 * k + 1) or image
+            v = v.replace(IMAGE_SLOT, _quote(src) if field == "cmd" else src)
+        return v or None
+
+    def template(self, r: int) -> tuple[str, bool]:
+        """(cmd, each_image) of row r. The cmd of a row that expands over the images
+        still has IMAGE_SLOT in it."""
+        return self._field(r, "cmd"), self._each_image[r]
+
+    def fetcher(self, i: int) -> str:
+        """The cmd of the row entry i belongs to: the same for every image of a row
+        that expands over the images. Latency stats are kept per row (see
+        randofetch.cli.stats)."""
+        return self._field(self._locate(i)[0], "cmd")
+
+    def row_get(self, r: int, field: str) -> str | None:
+        """Field of row r as stored, or None if it is empty or not stored."""
+        return self._field(r, field) or None
+
+    def image_words(self) -> list[str]:
+        """What IMAGE_SLOT is replaced with in the cmd of each image's entries."""
+        words = []
+        for k in range(self.n_images):
+            src = self._string(self._images + 2 * k + 1)
+            words.append(_quote(src or self._string(self._images + 2 * k)))
+        return words
+
+    def _weight(self, r: int) -> int:
+        return self.n_images if self._each_image[r] else 1
+
+    def supported_rows(self, features) -> list[int] | None:
+        """Rows whose "requires" field is empty or in features, or None if that is all
+        of them."""
+        rows = [
+            r
+            for r in range(self.n_rows)
+            if self._field(r, "requires") in ("", *features)
+        ]
+        return None if len(rows) == self.n_rows else rows
+
+    def fitting_rows(self, size: tuple[int, int], rows=None) -> list[int] | None:
+        """Of rows (all rows if None), the ones whose output measured during the scan
+        fits a terminal of size (columns, lines), leaving a line for the prompt. Rows
+        without a measurement are kept. For a row that expands over the images, that is
+        the largest output measured on a few of them (see Calibration.size_images).
+        rows is returned as is when the size is not known (0), or when nothing fits."""
+        cols, lines = size
+        if not (cols and lines) or "width" not in self.fields:
+            return rows
+        fit = []
+        for r in range(self.n_rows) if rows is None else rows:
+            width, height = self._field(r, "width"), self._field(r, "height")
+            if not width or (int(width) <= cols and int(height) < lines):
+                fit.append(r)
+        if not fit:
+            return rows
+        return None if len(fit) == self.n_rows else fit
+
+    def _draw(self, rows: list[int] | None) -> int | None:
+        if rows is None:
+            return random.randrange(self.count) if self.count else None
+        total = sum(self._weight(r) for r in rows)
+        if not total:
+            return None
+        k = random.randrange(total)
+        for r in rows:
+            w = self._weight(r)
+            if k < w:
+                return self._starts[r] + k
+            k -= w
+        return None
+
+    def plain_entries(self) -> list[int]:
+        """Entries that do not draw an image."""
+        return [
+            self._starts[r]
+            for r in range(self.n_rows)
+            if not self._each_image[r] and not self._field(r, "image")
+        ]
+
+    def argv(self, i: int) -> list[str] | None:
+        """The stored argument vector of entry i, or None for entries that have to be
+        run through the shell."""
+        v = self.get(i, "argv")
+        return v.split("\0") if v else None
+
+    def __getitem__(self, i: int) -> str:
+        return self.get(i) or ""
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def random_entry(self, accept=None, tries: int = 8, rows=None) -> int | None:
+        """A uniformly random entry, of the given rows only if rows is not None (see
+        supported_rows). With accept, entries for which accept(i) is False are redrawn,
+        up to tries times. After that, the entry is drawn from the rows accept takes
+        (on their first entry, as stats are kept per row), or None if it takes none."""
+        i = self._draw(rows)
+        while i is not None and accept is not None and not accept(i):
+            if tries <= 0:
+                rows = range(self.n_rows) if rows is None else rows
+                return self._draw([r for r in rows if accept(self._starts[r])])
+            i = self._draw(rows)
+            tries -= 1
+        return i
+
+    def pick(self) -> str | None:
+        i = self.random_entry()
+        return None if i is None else self[i]
+
+
+def load_index(save_file: str | Path, check_sources: bool = True) -> CommandIndex | None:
+    """Open save_file. Returns None if it is missing, unreadable, from another index
+    version, or (with check_sources) older than the files it was built from."""
+    with trace.phase("index"):
+        return _load_index(save_file, check_sources)
+
+
+def load_saved(save_file: str | Path) -> CommandIndex | None:
+    """Open save_file like load_index. While another process is rebuilding it, a stale
+    save_file is used instead of waiting for the new one."""
+    index = load_index(save_file)
+    if index is None:
+        # Either the rebuild is still running and the old file is in place, or it
+        # finished since the first look and the new one is.
+        index = load_index(save_file, check_sources=not is_locked(save_file))
+    return index
+
+
+def _load_index(save_file: str | Path, check_sources: bool) -> CommandIndex | None:
+    try:
+        with open(save_file, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        index = CommandIndex(buf)
+    except (ValueError, struct.error):
+        return None
+    if check_sources and index.is_stale():
+        return None
+    return index
@@ -0,0 +1,162 @@
+"""Fast path for picking a fetcher command at shell startup.
+
+Everything here is meant to run before a prompt is drawn, so only the standard library
+modules needed to read the saved fetcher set are imported. click, ruamel.yaml, tqdm and
+platformdirs are left to the full CLI in randofetch.cli.commands. When a `randofetch
+serve` daemon is running, picks and renders are asked from it first (see
+randofetch.cli.client).
+"""
+import os
+import sys
+
+from randofetch import appname
+from randofetch.cli import client, trace
+from randofetch.cli.config import BaseConfig
+from randofetch.cli.index import load_saved
+
+
+def _xdg_dir(env: str, default: str) -> str | None:
+    # On XDG platforms the path is resolved from the environment directly, which is
+    # what platformdirs does as well. Elsewhere we defer to platformdirs.
+    if sys.platform.startswith(("linux", "freebsd", "openbsd", "netbsd")):
+        base = os.environ.get(env, "").strip()
+        if not base:
+            base = os.path.expanduser(default)
+        return os.path.join(base, appname)
+    return None
+
+
+def config_dir() -> str:
+    """Return the same directory as BaseConfig.app_config_path()."""
+    with trace.phase("xdg"):
+        path = _xdg_dir("XDG_CONFIG_HOME", "~/.config")
+    return path or str(BaseConfig.app_config_path())
+
+
+def data_dir() -> str:
+    """Return the same directory as BaseConfig.app_data_path()."""
+    with trace.phase("xdg"):
+        path = _xdg_dir("XDG_DATA_HOME", "~/.local/share")
+    return path or str(BaseConfig.app_data_path())
+
+
+def save_file_path() -> str:
+    return os.path.join(config_dir(), BaseConfig.fetcher_save_name)
+
+
+def latency_stats():
+    from randofetch.cli.stats import LatencyStats
+
+    path = os.path.join(config_dir(), BaseConfig.latency_stats_name)
+    with trace.phase("stats"):
+        return LatencyStats(path)
+
+
+def term_caps():
+    from randofetch.cli import caps
+
+    with trace.phase("caps"):
+        return caps.detect(os.path.join(config_dir(), BaseConfig.term_caps_name))
+
+
+def pick_entry(index, stats) -> int | None:
+    """A random entry of index, skipping fetchers that recently ran over budget, image
+    methods this terminal cannot display, and output larger than the terminal."""
+    from randofetch.cli.caps import terminal_size
+
+    rows = index.supported_rows(term_caps().features)
+    with trace.phase("select"):
+        rows = index.fitting_rows(terminal_size((0, 0)), rows)
+        accept = stats.acceptor(
+            index,
+            BaseConfig.fetch_max_latency,
+            BaseConfig.latency_min_samples,
+            BaseConfig.latency_explore,
+        )
+        return index.random_entry(accept, rows=rows)
+
+
+def pick_cmd(save_file: str) -> str | None:
+    """Pick a random command from the saved fetcher set.
+    Returns None if there is no usable saved set, and an empty string if the saved set
+    is current but no fetchers were found."""
+    index = load_saved(save_file)
+    if index is None:
+        return None
+    i = pick_entry(index, latency_stats())
+    return "" if i is None else index[i]
+
+
+def fast_pick() -> bool:
+    """Print a random fetcher command. Returns False when the full CLI is needed
+    (for instance, no fetcher set has been saved yet, or it is stale)."""
+    if client.serve_pick():
+        return True
+    cmd = pick_cmd(save_file_path())
+    if cmd is None:
+        return False
+    if cmd:
+        with trace.phase("output"):
+            sys.stdout.write(cmd + "\n")
+            sys.stdout.flush()
+    return True
+
+
+def fast_show() -> bool:
+    """Render a random fetcher, replaying its output from the render cache when
+    possible. Returns False when the full CLI is needed."""
+    if client.serve_render(BaseConfig.run_deadline):
+        return True
+    index = load_saved(save_file_path())
+    if index is None:
+        return False
+    stats = latency_stats()
+    i = pick_entry(index, stats)
+    if i is None:
+        return True
+    from randofetch.cli.render import RenderCache, fallbacks, show
+
+    cache = RenderCache(
+        os.path.join(data_dir(), BaseConfig.render_cache_name),
+        ttl=BaseConfig.render_cache_ttl,
+        max_bytes=BaseConfig.render_cache_max_bytes,
+        compress=BaseConfig.render_cache_compress,
+    )
+    deadline = BaseConfig.run_deadline
+    show(
+        index[i],
+        index.get(i, "image"),
+        cache,
+        stats=stats,
+        deadline=deadline,
+        fallback=fallbacks(index, cache, deadline, stats),
+        argv=index.argv(i),
+        fetcher=index.fetcher(i),
+    )
+    return True
+
+
+def fast_next() -> bool:
+    """Print a queued render (or render one now), then refill the queue in the
+    background. Returns False when the full CLI is needed. A running daemon keeps
+    its own queue, so its renders are used first."""
+    if client.serve_render(BaseConfig.run_deadline):
+        return True
+    from randofetch.cli.queue import RenderQueue
+
+    queue = RenderQueue(
+        os.path.join(data_dir(), BaseConfig.render_queue_name),
+        BaseConfig.render_queue_size,
+    )
+    with trace.phase("queue"):
+        output = queue.pop()
+    if output is None:
+        if not fast_show():
+            return False
+    else:
+        with trace.phase("output"):
+            sys.stdout.buffer.write(output)
+            sys.stdout.buffer.flush()
+    with trace.phase("spawn"):
+        queue.spawn_refill()
+    return True
@@ -0,0 +1,19 @@
+"""Fetcher process handling shared by scans, renders and the embedding API.
+
+Fetchers that may have to be stopped are started in a session of their own
+(start_new_session=True), so the fetcher and everything it started share one process
+group, which kill_group ends. It only needs os and signal, so the fast path can use it.
+"""
+import os
+import signal
+
+
+def kill_group(p):
+    """Kill p (a subprocess.Popen or asyncio Process) with everything it started."""
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        try:
+            p.kill()
+        except ProcessLookupError:
+            pass
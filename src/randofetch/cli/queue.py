@@ -0,0 +1,137 @@
+"""Queue of pre-rendered picks for `randofetch next`.
+
+Each entry is the captured output of one randomly picked fetcher, rendered ahead of time
+by a detached, niced `randofetch refill-queue` process. Shell start up only has to pop
+an entry and write it out.
+
+Entries are published by writing to a dot-file and renaming it into place, and claimed
+by renaming them to a per-process name before reading. rename() is atomic, so two shells
+can never get the same entry, or one that is still being written. Renders depend on the
+terminal size, so there is one queue folder per size.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+from randofetch.cli.index import CommandIndex
+from randofetch.cli.render import terminal_size
+
+
+class RenderQueue:
+    def __init__(self, root: str | Path, size: int = 3, term_size=None):
+        cols, rows = term_size or terminal_size()
+        self.base = Path(root)
+        self.root = self.base / f"{cols}x{rows}"
+        self.size = size
+
+    def _ready(self) -> list[str]:
+        try:
+            return sorted(n for n in os.listdir(self.root) if not n.startswith("."))
+        except OSError:
+            return []
+
+    def __len__(self):
+        return len(self._ready())
+
+    def push(self, output: bytes):
+        self.root.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}"
+        tmp = self.root / f".{name}.tmp"
+        tmp.write_bytes(output)
+        os.rename(tmp, self.root / name)
+
+    def pop(self) -> bytes | None:
+        """Claim and return the oldest entry, or None if the queue is empty."""
+        for name in self._ready():
+            claimed = self.root / f".claim-{os.getpid()}-{name}"
+            try:
+                os.rename(self.root / name, claimed)
+            except OSError:
+                # Another shell got it first.
+                continue
+            try:
+                return claimed.read_bytes()
+            finally:
+                claimed.unlink(missing_ok=True)
+        return None
+
+    def clear(self):
+        """Drop every queued render, for all terminal sizes."""
+        if not self.base.exists():
+            return
+        for bucket in self.base.iterdir():
+            if bucket.is_dir():
+                for entry in bucket.iterdir():
+                    entry.unlink(missing_ok=True)
+
+    def refill(
+        self,
+        index: CommandIndex,
+        timeout: float | None = None,
+        stats=None,
+        accept=None,
+        rows=None,
+    ):
+        """Render random picks from index until the queue is full. Only one refill
+        runs per queue at a time; others return immediately.
+        Run times are recorded in stats, and picks are filtered with accept and rows
+        (see CommandIndex.random_entry)."""
+        import fcntl
+        import subprocess
+
+        from randofetch.cli.fetcher import run_cmd
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".refill.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            attempts = self.size * 3
+            while len(self) < self.size and attempts > 0:
+                attempts -= 1
+                i = index.random_entry(accept, rows=rows)
+                if i is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    r = run_cmd(index[i], True, timeout, index.argv(i))
+                except (subprocess.TimeoutExpired, OSError):
+                    r = None
+                if stats is not None:
+                    # A fetcher that hung or is missing counts as too slow, as in
+                    # render.render().
+                    seconds = time.perf_counter() - start
+                    seconds = float("inf") if r is None else seconds
+                    stats.record(index.fetcher(i), seconds)
+                    stats.save()
+                if r is not None and r.returncode == 0 and r.stdout:
+                    self.push(r.stdout)
+
+    def spawn_refill(self):
+        """Start a detached `randofetch refill-queue` for this terminal size, unless
+        the queue is already full."""
+        if len(self) >= self.size:
+            return
+        cols, rows = self.root.name.split("x")
+        env = dict(os.environ, COLUMNS=cols, LINES=rows)
+        argv = [sys.executable, "-m", "randofetch", "refill-queue"]
+        try:
+            devnull = [
+                (os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_RDWR, 0) for fd in (0, 1, 2)
+            ]
+            os.posix_spawn(
+                sys.executable, argv, env, file_actions=devnull, setsid=True
+            )
+        except (AttributeError, NotImplementedError, OSError):
+            import subprocess
+
+            subprocess.Popen(
+                argv,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
@@ -0,0 +1,405 @@
+"""Persistent cache of rendered fetcher output.
+
+Rendering a fetcher with an image takes hundreds of milliseconds, and the output only
+depends on the command, the image, the terminal size and a couple of terminal
+environment variables. The bytes of each render are stored under
+BaseConfig.render_cache_path(), so showing a cached pick is a file read and a write to
+stdout, without starting any process. A key starts with a hash of the terminal size
+and variables, so renders made for the current terminal can be told apart from the
+others (see RenderCache.recent).
+
+Entry layout: magic b"RFRC", u8 flags (1 = zlib), 3 pad bytes, f64 creation time,
+then the (optionally compressed) output. Entries can be written incrementally (see
+RenderCache.writer), so show() tees a fetcher's output into the cache while it is
+being written to the terminal. The file mtime is bumped on every hit and is
+used for LRU eviction once the cache grows past max_bytes; entries older than ttl
+seconds (by creation time) are treated as misses.
+"""
+import hashlib
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+from randofetch.cli import trace
+from randofetch.cli.atomic import tmp_path, write_atomic
+from randofetch.cli.caps import terminal_size
+
+_ENTRY = struct.Struct("<4sB3xd")
+_MAGIC = b"RFRC"
+_ZLIB = 1
+_CHUNK = 1 << 20
+_STREAM_CHUNK = 1 << 16
+# Written after output that was cut off at the deadline: ends an unterminated sixel or
+# other escape string, and resets colours.
+_CUT_OFF = b"\x1b\\\x1b[0m\n"
+# Variables output depends on besides the terminal size.
+KEY_ENV = ("TERM", "COLORTERM")
+
+
+def file_hash(path: str | Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_hash(path: str | Path, memo_dir: Path) -> str:
+    """Content hash of the file at path. The hash is remembered in memo_dir, one file
+    per path holding the size and mtime it was taken at, so a file is only read again
+    after it changes, and the memo is then overwritten."""
+    st = os.stat(path)
+    stamp = f"{st.st_size}\0{st.st_mtime_ns}\0"
+    memo = memo_dir / hashlib.sha1(os.fsencode(path)).hexdigest()
+    try:
+        memoized = memo.read_text()
+    except OSError:
+        memoized = ""
+    if memoized.startswith(stamp):
+        return memoized[len(stamp) :]
+    digest = file_hash(path)
+    memo.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(memo, (stamp + digest).encode())
+    return digest
+
+
+class EntryWriter:
+    """An entry written chunk by chunk. It only becomes visible in the cache once
+    commit() is called; abort() drops it."""
+
+    def __init__(self, cache: "RenderCache", key: str):
+        self.cache = cache
+        self.path = cache._path(key)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = Path(tmp_path(self.path))
+        self._z = None
+        flags = 0
+        if cache.compress:
+            import zlib
+
+            self._z = zlib.compressobj(6)
+            flags |= _ZLIB
+        self._f = open(self.tmp, "wb")
+        self._f.write(_ENTRY.pack(_MAGIC, flags, time.time()))
+
+    def write(self, chunk: bytes):
+        self._f.write(self._z.compress(chunk) if self._z else chunk)
+
+    def commit(self):
+        if self._z:
+            self._f.write(self._z.flush())
+        self._f.close()
+        os.replace(self.tmp, self.path)
+        self.cache.evict()
+
+    def abort(self):
+        self._f.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+class RenderCache:
+    def __init__(
+        self,
+        root: str | Path,
+        ttl: float = 7 * 24 * 3600,
+        max_bytes: int = 32 * 2**20,
+        compress: bool = True,
+    ):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress = compress
+
+    def image_hash(self, image: str | Path) -> str:
+        return content_hash(image, self.root / "images")
+
+    @staticmethod
+    def terminal(term_size: tuple[int, int] | None = None, env=None) -> str:
+        """What the keys of renders made for this terminal, or one of term_size and
+        the environment env, start with."""
+        cols, rows = term_size or terminal_size()
+        env = os.environ if env is None else env
+        parts = [f"{cols}x{rows}", *(env.get(k, "") for k in KEY_ENV)]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16] + "-"
+
+    def key(
+        self,
+        cmd: str,
+        image: str | Path | None = None,
+        term_size: tuple[int, int] | None = None,
+        env=None,
+    ) -> str:
+        """Cache key of cmd rendered in this terminal, or one of term_size and the
+        environment env."""
+        img = ""
+        if image:
+            try:
+                img = self.image_hash(image)
+            except OSError:
+                img = str(image)
+        render = hashlib.sha256(f"{cmd}\0{img}".encode()).hexdigest()
+        return self.terminal(term_size, env) + render
+
+    def _path(self, key: str) -> Path:
+        # Keys of one terminal share their start, so buckets go by the end.
+        return self.root / key[-2:] / key
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            magic, flags, created = _ENTRY.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if magic != _MAGIC or time.time() - created > self.ttl:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        body = data[_ENTRY.size :]
+        if flags & _ZLIB:
+            import zlib
+
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                return None
+        return body
+
+    def put(self, key: str, output: bytes):
+        w = self.writer(key)
+        w.write(output)
+        w.commit()
+
+    def writer(self, key: str) -> "EntryWriter":
+        return EntryWriter(self, key)
+
+    def entries(self) -> list[tuple[Path, os.stat_result]]:
+        found: list[tuple[Path, os.stat_result]] = []
+        try:
+            buckets = [d for d in os.scandir(self.root) if len(d.name) == 2]
+        except OSError:
+            return found
+        for bucket in buckets:
+            for e in os.scandir(bucket.path):
+                if not e.name.startswith("."):
+                    try:
+                        found.append((Path(e.path), e.stat()))
+                    except OSError:
+                        # Evicted by another process meanwhile.
+                        continue
+        return found
+
+    def evict(self):
+        """Drop the least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self.entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        for path, st in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= st.st_size
+
+    def recent(
+        self, term_size: tuple[int, int] | None = None, env=None
+    ) -> bytes | None:
+        """The most recently used entry that is still valid, of any cmd and image but
+        made for this terminal (or one of term_size and env): output made for another
+        size or TERM may not fit, or use escape sequences this one does not know."""
+        terminal = self.terminal(term_size, env)
+        entries = sorted(self.entries(), key=lambda e: e[1].st_mtime, reverse=True)
+        for path, _ in entries:
+            if not path.name.startswith(terminal):
+                continue
+            data = self.get(path.name)
+            if data is not None:
+                return data
+        return None
+
+    def clear(self):
+        import shutil
+
+        for path, _ in self.entries():
+            path.unlink(missing_ok=True)
+        shutil.rmtree(self.root / "images", ignore_errors=True)
+
+
+def render(
+    cmd: str, deadline: float | None = None, stats=None, argv=None, fetcher=None
+):
+    """Run cmd, capturing its output. If it runs past deadline seconds it is killed
+    (with anything it started) and None is returned. The run time, or inf for a
+    timeout, is recorded in stats (a LatencyStats) under fetcher (cmd by default, see
+    CommandIndex.fetcher) so slow fetchers get demoted."""
+    import subprocess
+
+    from randofetch.cli.fetcher import run_cmd
+
+    start = time.perf_counter()
+    try:
+        with trace.phase("spawn"):
+            r = run_cmd(cmd, silent=True, timeout=deadline, argv=argv)
+    except (subprocess.TimeoutExpired, OSError):
+        r = None
+    if stats is not None:
+        seconds = float("inf") if r is None else time.perf_counter() - start
+        stats.record(fetcher or cmd, seconds)
+        stats.save()
+    return r
+
+
+class Streamed:
+    """Result of stream(). returncode is None if the fetcher could not be started or
+    was killed at the deadline."""
+
+    __slots__ = ("returncode", "size", "ttfb", "seconds")
+
+    def __init__(self, returncode, size, ttfb, seconds):
+        self.returncode: int | None = returncode
+        self.size: int = size
+        self.ttfb: float | None = ttfb
+        self.seconds: float = seconds
+
+
+def stream(
+    cmd: str,
+    out,
+    deadline: float | None = None,
+    argv: list[str] | None = None,
+    tee: EntryWriter | None = None,
+) -> Streamed:
+    """Run cmd, writing its stdout to out as raw bytes, chunk by chunk as they arrive,
+    and to tee if given. If it runs past deadline seconds it is killed (with anything it
+    started); if it had already written something, that is terminated with _CUT_OFF.
+    The time to first byte is recorded in the trace as "ttfb"."""
+    import select
+    import subprocess
+
+    from randofetch.cli.procs import kill_group
+
+    start = time.perf_counter()
+    end = None if deadline is None else start + deadline
+    size = 0
+    ttfb = None
+    try:
+        p = subprocess.Popen(
+            argv or cmd,
+            shell=not argv,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+        )
+    except OSError:
+        return Streamed(None, 0, None, time.perf_counter() - start)
+    assert p.stdout is not None
+    with p:
+        fd = p.stdout.fileno()
+        killed = False
+        while True:
+            timeout = None if end is None else end - time.perf_counter()
+            if timeout is not None and timeout <= 0:
+                killed = True
+                break
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                continue
+            chunk = os.read(fd, _STREAM_CHUNK)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+                trace.add("ttfb", ttfb)
+            out.write(chunk)
+            out.flush()
+            if tee is not None:
+                tee.write(chunk)
+            size += len(chunk)
+        if not killed:
+            try:
+                # stdout is closed, but the fetcher may still be running.
+                p.wait(None if end is None else max(0.0, end - time.perf_counter()))
+            except subprocess.TimeoutExpired:
+                killed = True
+        if killed:
+            kill_group(p)
+            p.wait()
+            if size:
+                out.write(_CUT_OFF)
+                out.flush()
+    returncode = None if killed else p.returncode
+    return Streamed(returncode, size, ttfb, time.perf_counter() - start)
+
+
+def fallbacks(index, cache: RenderCache | None, deadline: float | None, stats=None):
+    """Cheaper things to show when a fetcher misses its deadline: the most recent
+    cached render for this terminal, then a fetcher that does not draw an image."""
+
+    def cached():
+        return cache.recent() if cache else None
+
+    def text_only():
+        plain = index.plain_entries()
+        if not plain:
+            return None
+        import random
+
+        i = random.choice(plain)
+        r = render(index[i], deadline, stats, index.argv(i), index.fetcher(i))
+        return r and r.stdout
+
+    return [cached, text_only]
+
+
+def show(
+    cmd: str,
+    image: str | Path | None = None,
+    cache: RenderCache | None = None,
+    out=None,
+    stats=None,
+    deadline: float | None = None,
+    fallback=(),
+    argv: list[str] | None = None,
+    fetcher: str | None = None,
+):
+    """Write the output of cmd to out (stdout by default), from the cache if possible.
+    Otherwise the fetcher's output is streamed to out as it runs (see stream()), and
+    teed into the cache; only successful, non-empty renders are kept. Its run time is
+    recorded in stats (a LatencyStats) under fetcher, as with render(). If it misses
+    deadline without writing
+    anything, each of the fallback callables is tried in turn, and if none has output
+    nothing is written."""
+    out = out or sys.stdout.buffer
+    with trace.phase("cache"):
+        key = cache.key(cmd, image) if cache else None
+        data = cache.get(key) if cache and key else None
+    if data is None:
+        tee = cache.writer(key) if cache and key else None
+        with trace.phase("spawn"):
+            r = stream(cmd, out, deadline, argv, tee)
+        if stats is not None:
+            seconds = float("inf") if r.returncode is None else r.seconds
+            stats.record(fetcher or cmd, seconds)
+            stats.save()
+        if tee is not None:
+            with trace.phase("cache"):
+                if r.returncode == 0 and r.size:
+                    tee.commit()
+                else:
+                    tee.abort()
+        if r.size or r.returncode is not None:
+            return
+        for fb in fallback:
+            data = fb()
+            if data:
+                break
+    if data:
+        with trace.phase("output"):
+            out.write(data)
+            out.flush()
@@ -0,0 +1,247 @@
+"""Shell snippets that pick a fetcher without starting Python.
+
+`randofetch emit-shell` writes the saved fetcher set as a bash, zsh or fish script.
+Sourcing it from an rc file defines:
+
+    randofetch_pick   print a random fetcher command, like `randofetch`
+    randofetch_run    run a random fetcher, like `randofetch show`
+
+The snippet holds the command of every row of the set, the images that rows with an
+image method are expanded over, and the number of entries each row stands for, so a
+pick is as likely as with `randofetch` (minus the latency budget, which needs the
+stats file). Image methods the terminal cannot show are left out, judged by the
+features of the terminal emit-shell ran in, which are kept in the snippet's header.
+
+Snippets in the default location (BaseConfig.shell_snippet_path) are rewritten after
+every scan. Any snippet also checks whether the save file or one of the files the set
+was built from is newer than itself, and then calls randofetch instead, which rescans.
+"""
+import re
+import shlex
+from pathlib import Path
+
+from randofetch.cli.atomic import write_atomic
+from randofetch.cli.index import IMAGE_SLOT, CommandIndex
+
+SHELLS = ("bash", "zsh", "fish")
+_FEATURES = "# features: "
+
+_HEADER = """\
+# randofetch snippet for @SHELL@, generated from @SAVE_FILE@.
+# Source it from your shell's rc file, then call randofetch_pick or randofetch_run.
+# Rewritten by every `randofetch --scan`; do not edit.
+@FEATURES@
+"""
+
+_POSIX = """\
+_randofetch_save=@SAVE@
+_randofetch_self=@SELF@
+_randofetch_sources=(@SOURCES@)
+_randofetch_cmds=(@CMDS@)
+_randofetch_weights=(@WEIGHTS@)
+_randofetch_each=(@EACH@)
+_randofetch_images=(@IMAGES@)
+_randofetch_total=@TOTAL@
+
+# Sets _randofetch_cmd. Returns 2 if the snippet is out of date, 1 if there is nothing
+# to pick.
+_randofetch_choose() {
+    @EMULATE@local f k r=@FIRST@
+    _randofetch_cmd=
+    [[ -e $_randofetch_save && ! $_randofetch_save -nt $_randofetch_self ]] || return 2
+    for f in "${_randofetch_sources[@]}"; do
+        [[ $f -nt $_randofetch_self ]] && return 2
+    done
+    (( _randofetch_total > 0 )) || return 1
+    k=$(( ((RANDOM << 15) | RANDOM) % _randofetch_total ))
+    while (( k >= _randofetch_weights[r] )); do
+        (( k -= _randofetch_weights[r], r += 1 ))
+    done
+    _randofetch_cmd=${_randofetch_cmds[r]}
+    if (( _randofetch_each[r] )); then
+        _randofetch_cmd=${_randofetch_cmd//"@SLOT@"/"${_randofetch_images[k + @FIRST@]}"}
+    fi
+    return 0
+}
+
+randofetch_pick() {
+    _randofetch_choose
+    case $? in
+        0) printf '%s\\n' "$_randofetch_cmd" ;;
+        2) command randofetch ;;
+    esac
+}
+
+randofetch_run() {
+    _randofetch_choose
+    case $? in
+        0) eval "$_randofetch_cmd" ;;
+        2) command randofetch show ;;
+    esac
+}
+"""
+
+# Needs fish 3.5 or later, for `path mtime`. mtimes are in whole seconds there.
+_FISH = """\
+set -g _randofetch_save @SAVE@
+set -g _randofetch_self @SELF@
+set -g _randofetch_sources @SOURCES@
+set -g _randofetch_cmds @CMDS@
+set -g _randofetch_weights @WEIGHTS@
+set -g _randofetch_each @EACH@
+set -g _randofetch_images @IMAGES@
+set -g _randofetch_total @TOTAL@
+
+# Sets _randofetch_cmd. Returns 2 if the snippet is out of date, 1 if there is nothing
+# to pick.
+function _randofetch_choose
+    set -g _randofetch_cmd
+    set -l self (path mtime -- $_randofetch_self); or return 2
+    set -l m (path mtime -- $_randofetch_save); or return 2
+    test $m -gt $self; and return 2
+    for f in $_randofetch_sources
+        set m (path mtime -- $f); and test $m -gt $self; and return 2
+    end
+    test $_randofetch_total -gt 0; or return 1
+    set -l k (random 0 (math $_randofetch_total - 1))
+    set -l r 1
+    while test $k -ge $_randofetch_weights[$r]
+        set k (math $k - $_randofetch_weights[$r])
+        set r (math $r + 1)
+    end
+    set -g _randofetch_cmd $_randofetch_cmds[$r]
+    if test $_randofetch_each[$r] = 1
+        set -l image $_randofetch_images[(math $k + 1)]
+        set -g _randofetch_cmd (string replace -a -- '@SLOT@' $image $_randofetch_cmd)
+    end
+    return 0
+end
+
+function randofetch_pick --description 'Print a random fetcher command'
+    _randofetch_choose
+    switch $status
+        case 0
+            printf '%s\\n' $_randofetch_cmd
+        case 2
+            command randofetch
+    end
+end
+
+# Fetcher commands are written for sh.
+function randofetch_run --description 'Run a random fetcher'
+    _randofetch_choose
+    switch $status
+        case 0
+            sh -c $_randofetch_cmd
+        case 2
+            command randofetch show
+    end
+end
+"""
+
+
+def _fish_quote(s: str) -> str:
+    return "'" + s.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _words(values, quote) -> str:
+    """values as the items of an array, one per line if there are several."""
+    values = [quote(str(v)) for v in values]
+    if len(values) <= 1:
+        return "".join(values)
+    if quote is _fish_quote:
+        return "".join(f" \\\n    {v}" for v in values).lstrip(" ")
+    return "".join(f"\n    {v}" for v in values) + "\n"
+
+
+def snippet(
+    index: CommandIndex,
+    shell: str,
+    save_file: str | Path,
+    snippet_file: str | Path,
+    features=None,
+) -> str:
+    """The snippet for shell, picking from index.
+
+    :param snippet_file: Where the snippet will be written. It compares its own mtime
+    with save_file and the sources of index to tell whether it is out of date.
+    :param features: Terminal features (see randofetch.cli.caps). Rows whose image
+    method needs another feature are left out. With None, every row is kept.
+    """
+    if shell not in SHELLS:
+        raise ValueError(f"Unknown shell {shell!r}, expected one of {', '.join(SHELLS)}")
+    rows = None if features is None else index.supported_rows(features)
+    cmds, weights, each = [], [], []
+    for r in range(index.n_rows) if rows is None else rows:
+        cmd, each_image = index.template(r)
+        weight = index.n_images if each_image else 1
+        if weight:
+            cmds.append(cmd)
+            weights.append(weight)
+            each.append(1 if each_image else 0)
+    uses_images = any(each)
+    quote = _fish_quote if shell == "fish" else shlex.quote
+    values = {
+        "@SHELL@": shell,
+        "@SAVE_FILE@": str(save_file),
+        "@FEATURES@": _FEATURES
+        + ("all" if features is None else ",".join(sorted(features))),
+        "@SAVE@": quote(str(save_file)),
+        "@SELF@": quote(str(snippet_file)),
+        "@SOURCES@": _words([p for p, _ in index.sources], quote),
+        "@CMDS@": _words(cmds, quote),
+        "@WEIGHTS@": " ".join(map(str, weights)),
+        "@EACH@": " ".join(map(str, each)),
+        "@IMAGES@": _words(index.image_words() if uses_images else [], quote),
+        "@TOTAL@": str(sum(weights)),
+        "@SLOT@": IMAGE_SLOT,
+        "@EMULATE@": "emulate -L zsh\n    " if shell == "zsh" else "",
+        "@FIRST@": "1" if shell == "zsh" else "0",
+    }
+    body = _HEADER + "\n" + (_FISH if shell == "fish" else _POSIX)
+    # One pass, so placeholders inside the inserted commands are left alone.
+    return re.sub(r"@[A-Z_]+@", lambda m: values.get(m[0], m[0]), body)
+
+
+def snippet_features(snippet_file: str | Path) -> frozenset[str] | None:
+    """The features a snippet was written for, from its header. None if it kept every
+    row or cannot be read."""
+    try:
+        with open(snippet_file) as f:
+            for line in f:
+                if line.startswith(_FEATURES):
+                    value = line[len(_FEATURES) :].strip()
+                    if value == "all":
+                        return None
+                    return frozenset(filter(None, value.split(",")))
+                if not line.startswith("#"):
+                    break
+    except OSError:
+        pass
+    return None
+
+
+def write_snippet(
+    index: CommandIndex,
+    shell: str,
+    save_file: str | Path,
+    snippet_file: str | Path,
+    features=None,
+):
+    snippet_file = Path(snippet_file)
+    text = snippet(index, shell, save_file, snippet_file, features)
+    snippet_file.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(snippet_file, text.encode())
+
+
+def regenerate(index: CommandIndex, save_file: str | Path, path_of) -> list[Path]:
+    """Rewrite the snippets that exist at path_of(shell), for the features each was
+    written for. Returns the rewritten files."""
+    written = []
+    for shell in SHELLS:
+        snippet_file = Path(path_of(shell))
+        if snippet_file.exists():
+            features = snippet_features(snippet_file)
+            write_snippet(index, shell, save_file, snippet_file, features)
+            written.append(snippet_file)
+    return written
@@ -0,0 +1,152 @@
+"""Observed run times of fetcher commands.
+
+Every real run of a fetcher (a render cache miss, a queue refill) is timed and appended
+to a small ring buffer for that fetcher. Selection then skips fetchers whose recent p95
+is over the latency budget, so a fetcher that gets slow after an upgrade drops out of
+rotation without a --scan. A small fraction of picks ignore the budget, which lets a
+fetcher that got fast again back in. Until a fetcher has enough runs, the latency
+measured for it when the set was scanned (see randofetch.cli.calibrate) is used.
+
+Runs are kept per row of the saved set (see CommandIndex.fetcher), not per command: a
+row that expands over the images shares one ring buffer across all of them, so a
+regression is noticed after a few runs whatever images they used.
+
+File layout: a sequence of records, u64 key, u16 count, u16 next slot, RING x f32.
+Keys are derived from the cmd string with crc32, which is stable across processes.
+Runs are merged into the file on save, under its writer lock, so shells saving at the
+same time do not drop each other's samples; within a process, record and save may be
+called from several threads. The file keeps the MAX_RECORDS most
+recently run fetchers, and a scan drops the ones no longer in the set (see prune).
+"""
+import _thread
+import random
+import struct
+import zlib
+from pathlib import Path
+
+from randofetch.cli.atomic import WriterLock, write_atomic
+from randofetch.cli.trace import percentile
+
+RING = 16
+# Fetchers kept in the file, the most recently run ones.
+MAX_RECORDS = 256
+_RECORD = struct.Struct(f"<QHH{RING}f")
+
+
+def cmd_key(cmd: str) -> int:
+    b = cmd.encode()
+    return (zlib.crc32(b) << 32) | (len(b) & 0xFFFFFFFF)
+
+
+class LatencyStats:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._records = self._read()
+        # Runs recorded since the file was read, merged into it again on save.
+        self._pending: list[tuple[int, float]] = []
+        # _thread rather than threading, which would slow the fast path's imports.
+        self._lock = _thread.allocate_lock()
+
+    def _read(self) -> dict[int, tuple[int, int, list[float]]]:
+        records: dict[int, tuple[int, int, list[float]]] = {}
+        try:
+            data = self.path.read_bytes()
+        except OSError:
+            return records
+        for off in range(0, len(data) - _RECORD.size + 1, _RECORD.size):
+            key, count, slot, *ring = _RECORD.unpack_from(data, off)
+            records[key] = (count, slot, ring)
+        return records
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _add(records, key: int, seconds: float):
+        # Popped and added again, so records stays ordered by last run.
+        count, slot, ring = records.pop(key, (0, 0, [0.0] * RING))
+        ring[slot] = seconds
+        records[key] = (min(count + 1, RING), (slot + 1) % RING, ring)
+
+    def _write(self, records):
+        records = dict(list(records.items())[-MAX_RECORDS:])
+        data = b"".join(
+            _RECORD.pack(key, count, slot, *ring)
+            for key, (count, slot, ring) in records.items()
+        )
+        write_atomic(self.path, data)
+        return records
+
+    def record(self, cmd: str, seconds: float):
+        key = cmd_key(cmd)
+        with self._lock:
+            self._add(self._records, key, seconds)
+            self._pending.append((key, seconds))
+
+    def save(self):
+        """Add the runs recorded here to the file. Other processes may have saved
+        their own runs since it was read, so it is read again under the writer lock."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, WriterLock(self.path):
+            records = self._read()
+            for key, seconds in self._pending:
+                self._add(records, key, seconds)
+            self._records = self._write(records)
+            self._pending.clear()
+
+    def prune(self, cmds):
+        """Drop the runs of every fetcher but cmds from the file, e.g. the fetchers of
+        a new set (see CommandIndex.template)."""
+        if not self.path.exists():
+            return
+        keep = {cmd_key(cmd) for cmd in cmds}
+        with self._lock, WriterLock(self.path):
+            records = self._read()
+            records = {k: v for k, v in records.items() if k in keep}
+            self._records = self._write(records)
+
+    def samples(self, cmd: str) -> list[float]:
+        count, _, ring = self._records.get(cmd_key(cmd), (0, 0, []))
+        return ring[:count]
+
+    def summary(self, cmd: str) -> tuple[int, float, float] | None:
+        """(samples, mean, p95) of the recent runs of cmd, or None if it never ran."""
+        s = self.samples(cmd)
+        if not s:
+            return None
+        return len(s), sum(s) / len(s), percentile(s, 95)
+
+    def within_budget(
+        self,
+        cmd: str,
+        budget: float,
+        min_samples: int = 3,
+        calibrated: float | None = None,
+    ) -> bool:
+        """Whether the recent p95 of cmd is within budget. With fewer than min_samples
+        runs, the calibrated p95 decides, or cmd is given the benefit of the doubt."""
+        summary = self.summary(cmd)
+        if summary is None or summary[0] < min_samples:
+            return calibrated is None or calibrated <= budget
+        return summary[2] <= budget
+
+    def acceptor(self, index, budget: float, min_samples: int = 3, explore=0.05):
+        """An accept(i) callable for CommandIndex.random_entry, or None if every
+        entry would be accepted."""
+        calibrated = [index.row_get(r, "p95") for r in range(index.n_rows)]
+        over = any(p is not None and float(p) > budget for p in calibrated)
+        if not self._records and not over:
+            return None
+
+        def accept(i: int) -> bool:
+            if random.random() < explore:
+                return True
+            p95 = index.get(i, "p95") if over else None
+            return self.within_budget(
+                index.fetcher(i),
+                budget,
+                min_samples,
+                None if p95 is None else float(p95),
+            )
+
+        return accept
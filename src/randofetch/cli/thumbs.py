@@ -0,0 +1,181 @@
+"""Downscaled copies of library images.
+
+Image methods used to hand the original file to the fetcher, so every run decoded a
+full resolution photo to draw a logo a few dozen cells wide. Each image is now scaled
+down once per size bucket (the longest side in pixels, a power of two) and the fetcher
+is given the thumbnail instead.
+
+Thumbnails are keyed by the content hash of the original and stored under
+BaseConfig.thumb_cache_path() as <bucket>/<hash>.png. Images that are already small
+enough, or that cannot be decoded, get an empty <hash>.orig marker instead, so they
+are not opened again on the next scan. Scaling needs Pillow (the `thumbs` extra);
+without it the original images are used.
+"""
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Callable
+
+from randofetch.cli.atomic import tmp_path, write_atomic
+from randofetch.cli.render import content_hash, terminal_size
+
+MIN_EDGE = 128
+MAX_EDGE = 2048
+# Assumed cell size in pixels when the terminal does not report its pixel size.
+CELL_PX = (10, 20)
+
+Resizer = Callable[[Path, Path, int], bool]
+
+
+def terminal_pixels() -> tuple[int, int]:
+    try:
+        import fcntl
+        import termios
+
+        buf = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, bytes(8))
+        _, _, xpix, ypix = struct.unpack("HHHH", buf)
+        if xpix and ypix:
+            return xpix, ypix
+    except (ImportError, OSError, ValueError, AttributeError):
+        pass
+    from randofetch.cli.caps import terminal_cell
+
+    cols, rows = terminal_size()
+    cw, ch = terminal_cell() or CELL_PX
+    return cols * cw, rows * ch
+
+
+def edge_bucket(px: int) -> int:
+    edge = MIN_EDGE
+    while edge < px and edge < MAX_EDGE:
+        edge *= 2
+    return edge
+
+
+def target_edge() -> int:
+    """Size bucket for this terminal. A logo takes at most half the terminal width and
+    its full height, so no fetcher needs a larger image than that."""
+    w, h = terminal_pixels()
+    return edge_bucket(max(w // 2, h))
+
+
+def resize_pillow(src: Path, dst: Path, edge: int) -> bool:
+    """Write src scaled to fit edge x edge pixels to dst as PNG. Returns False, without
+    writing, if src already fits, is animated or cannot be decoded."""
+    from PIL import Image
+
+    try:
+        with Image.open(src) as im:
+            if max(im.size) <= edge or getattr(im, "is_animated", False):
+                return False
+            # Lets JPEG decode at a reduced scale instead of full resolution.
+            im.draft(None, (edge, edge))
+            im.thumbnail((edge, edge))
+            im.save(dst, "PNG")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def default_resizer() -> Resizer | None:
+    from importlib.util import find_spec
+
+    return resize_pillow if find_spec("PIL") else None
+
+
+class ThumbnailCache:
+    def __init__(
+        self,
+        root: str | Path,
+        max_bytes: int = 64 * 2**20,
+        resize: Resizer | None = None,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.resize = resize
+
+    def get(self, image: str | Path, edge: int, digest: str | None = None) -> Path:
+        """Path of a copy of image no larger than edge pixels, or image itself if it is
+        small enough already or cannot be scaled. digest is the content hash of image,
+        if it is known already (see randofetch.cli.images)."""
+        image = Path(image)
+        if self.resize is None:
+            return image
+        try:
+            h = digest or content_hash(image, self.root / "images")
+        except OSError:
+            return image
+        bucket = self.root / str(edge)
+        thumb = bucket / f"{h}.png"
+        if thumb.exists():
+            try:
+                os.utime(thumb)
+            except OSError:
+                pass
+            return thumb
+        marker = bucket / f"{h}.orig"
+        if marker.exists():
+            return image
+        bucket.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tmp_path(thumb))
+        try:
+            made = self.resize(image, tmp, edge)
+            if made:
+                os.replace(tmp, thumb)
+        finally:
+            tmp.unlink(missing_ok=True)
+        if not made:
+            write_atomic(marker, b"")
+            return image
+        return thumb
+
+    def _buckets(self) -> list[os.DirEntry]:
+        try:
+            return [d for d in os.scandir(self.root) if d.name.isdigit()]
+        except OSError:
+            return []
+
+    def entries(self) -> list[tuple[Path, os.stat_result]]:
+        found: list[tuple[Path, os.stat_result]] = []
+        for bucket in self._buckets():
+            for e in os.scandir(bucket.path):
+                if e.name.endswith(".png") and not e.name.startswith("."):
+                    found.append((Path(e.path), e.stat()))
+        return found
+
+    def prune(self, digests):
+        """Drop the thumbnails and markers of images whose content hash is not in
+        digests, such as images that were removed from the library."""
+        keep = set(digests)
+        for bucket in self._buckets():
+            for e in os.scandir(bucket.path):
+                h, _, ext = e.name.partition(".")
+                if h and ext in ("png", "orig") and h not in keep:
+                    try:
+                        os.unlink(e.path)
+                    except OSError:
+                        continue
+
+    def clear(self):
+        """Drop all thumbnails, markers and remembered image hashes."""
+        import shutil
+
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def evict(self, keep=()):
+        """Drop the least recently used thumbnails until the cache fits in max_bytes.
+        Thumbnails in keep, the ones a saved fetcher set refers to, are never dropped."""
+        keep = {Path(p) for p in keep}
+        entries = sorted(self.entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        for path, st in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= st.st_size
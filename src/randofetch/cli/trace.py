@@ -0,0 +1,160 @@
+"""Phase timing for randofetch runs.
+
+Code that may be slow at shell start up is wrapped in `with trace.phase("name"):`.
+Tracing is off unless `--profile` is passed or RANDOFETCH_TRACE is set. While it is
+off, phase() is a shared no-op context manager and costs one global lookup.
+
+RANDOFETCH_TRACE=1 (or --profile) prints a one-line summary to stderr at exit,
+RANDOFETCH_TRACE=json prints the whole trace as JSON. Either way the trace is also
+appended to a log file, which `randofetch stats` aggregates into p50/p95 per phase.
+"""
+import math
+import os
+import time
+
+# Log files are rotated (to <name>.1) once they reach this size.
+LOG_MAX_BYTES = 256 * 1024
+
+_mode: str | None = None
+_t0 = 0
+_phases: dict[str, int] = {}
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        _phases[self.name] = _phases.get(self.name, 0) + elapsed
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL = _NullPhase()
+
+
+def phase(name: str):
+    if _mode is None:
+        return _NULL
+    return _Phase(name)
+
+
+def add(name: str, seconds: float):
+    """Record a time that is not measured with phase(), such as time to first byte."""
+    if _mode is not None:
+        _phases[name] = _phases.get(name, 0) + int(seconds * 1e9)
+
+
+def enabled() -> bool:
+    return _mode is not None
+
+
+def enable(mode: str | None = "summary"):
+    global _mode, _t0
+    _mode = mode
+    _t0 = time.perf_counter_ns()
+    _phases.clear()
+
+
+def enable_from_env():
+    mode = os.environ.get("RANDOFETCH_TRACE", "").strip().lower()
+    if mode and mode not in ("0", "false", "no", "off"):
+        enable("json" if mode == "json" else "summary")
+
+
+def record(argv: list[str]) -> dict:
+    total = time.perf_counter_ns() - _t0
+    return {
+        "time": time.time(),
+        "argv": argv,
+        "total_ms": total / 1e6,
+        "phases": {k: v / 1e6 for k, v in _phases.items()},
+    }
+
+
+def summary_line(rec: dict) -> str:
+    parts = [f"{k} {v:.2f}ms" for k, v in rec["phases"].items()]
+    return f"randofetch: {' '.join(parts)} | total {rec['total_ms']:.2f}ms"
+
+
+def append_log(log_file: str, rec: dict):
+    import json
+
+    try:
+        if os.path.getsize(log_file) >= LOG_MAX_BYTES:
+            os.replace(log_file, log_file + ".1")
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    with open(log_file, "a") as f:
+        f.write(json.dumps(rec) + "\n")
+
+
+def finish(argv: list[str], log_file: str | None = None):
+    """Report the trace of this run to stderr and append it to log_file."""
+    if _mode is None:
+        return
+    import json
+    import sys
+
+    rec = record(argv)
+    if _mode == "json":
+        sys.stderr.write(json.dumps(rec) + "\n")
+    else:
+        sys.stderr.write(summary_line(rec) + "\n")
+    if log_file:
+        try:
+            append_log(log_file, rec)
+        except OSError:
+            pass
+
+
+def read_log(log_file: str) -> list[dict]:
+    import json
+
+    records = []
+    for path in (log_file + ".1", log_file):
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of values, which need not be sorted."""
+    s = sorted(values)
+    return s[max(0, math.ceil(len(s) * pct / 100) - 1)]
+
+
+def aggregate(records: list[dict]) -> dict[str, dict[str, float]]:
+    """p50/p95 (and count) of each phase, and of the total, over records."""
+    by_phase: dict[str, list[float]] = {}
+    for rec in records:
+        for k, v in rec.get("phases", {}).items():
+            by_phase.setdefault(k, []).append(v)
+        by_phase.setdefault("total", []).append(rec.get("total_ms", 0.0))
+    return {
+        k: {"n": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95)}
+        for k, v in by_phase.items()
+    }
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from randofetch import api
+from randofetch.cli.index import write_index
+from randofetch.cli.render import RenderCache
+from randofetch.cli.stats import LatencyStats
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    def make(cmds, **kwargs):
+        save_file = tmp_path / "fetch.idx"
+        write_index(save_file, cmds)
+        return api.Renderer(
+            save_file,
+            cache=RenderCache(tmp_path / "render"),
+            stats=LatencyStats(tmp_path / "latency.bin"),
+            **kwargs,
+        )
+
+    return make
+
+
+def test_pick_without_side_effects(tmp_path, renderer, capsys):
+    r = renderer(["echo one", "echo two"])
+    assert {r.pick().cmd for _ in range(50)} == {"echo one", "echo two"}
+    assert api.Renderer(tmp_path / "missing.idx").pick() is None
+    assert capsys.readouterr() == ("", "")
+    assert not (tmp_path / "render").exists()
+
+
+def test_concurrent_renders_share_one_run(tmp_path, renderer):
+    calls = tmp_path / "calls"
+    r = renderer([f"echo x >> {calls}; sleep 0.2; echo $COLUMNS"])
+
+    async def burst():
+        return await asyncio.gather(*(r.render((90, 30)) for _ in range(20)))
+
+    assert asyncio.run(burst()) == [b"90\n"] * 20
+    assert calls.read_text() == "x\n"
+    # Later renders come from the cache.
+    assert asyncio.run(r.render((90, 30))) == b"90\n"
+    assert calls.read_text() == "x\n"
+
+
+def test_concurrency_limit_and_deadline(renderer):
+    r = renderer(
+        [f"sleep 0.2; echo {i}" for i in range(6)] + ["sleep 30"],
+        max_concurrency=2,
+        deadline=0.5,
+    )
+
+    async def burst(n):
+        entries = [api.Pick(r.index()[i]) for i in n]
+        return await asyncio.gather(*(r.render(entry=e) for e in entries))
+
+    start = time.perf_counter()
+    assert asyncio.run(burst(range(6))) == [f"{i}\n".encode() for i in range(6)]
+    # Three rounds of two fetchers.
+    assert time.perf_counter() - start >= 0.6
+
+    start = time.perf_counter()
+    assert asyncio.run(burst([6])) == [b""]
+    assert time.perf_counter() - start < 5.0
+    assert r.stats.summary("sleep 30")[2] == float("inf")
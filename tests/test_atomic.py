@@ -0,0 +1,138 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from randofetch.cli.atomic import WriterLock, is_locked, write_atomic
+from randofetch.cli.index import load_index, load_saved, write_index
+from randofetch.cli.stats import LatencyStats
+
+PICKERS = 16
+PICKS = 100
+
+
+def test_write_atomic_leaves_no_temp_files(tmp_path):
+    write_atomic(tmp_path / "state", b"one")
+    write_atomic(tmp_path / "state", b"two")
+    assert (tmp_path / "state").read_bytes() == b"two"
+    assert os.listdir(tmp_path) == ["state"]
+
+
+def test_writer_lock_is_exclusive(tmp_path):
+    path = tmp_path / "fetch.idx"
+    assert not is_locked(path)
+    with WriterLock(path) as first:
+        assert first.acquired
+        with WriterLock(path, blocking=False) as second:
+            assert not second.acquired
+        assert is_locked(path)
+    assert not is_locked(path)
+    assert not is_locked(tmp_path / "missing" / "fetch.idx")
+
+
+def test_concurrent_stats_saves_are_merged(tmp_path):
+    a = LatencyStats(tmp_path / "latency.bin")
+    b = LatencyStats(tmp_path / "latency.bin")
+    a.record("fastfetch", 0.1)
+    b.record("uwufetch", 0.2)
+    a.save()
+    b.save()
+    loaded = LatencyStats(tmp_path / "latency.bin")
+    assert loaded.samples("fastfetch") == [pytest.approx(0.1)]
+    assert loaded.samples("uwufetch") == [pytest.approx(0.2)]
+
+
+def test_stale_set_is_used_while_rescanning(tmp_path):
+    cfg = tmp_path / "fetchers.yaml"
+    cfg.write_text("fetchers: []")
+    save_file = tmp_path / "fetch.idx"
+    write_index(save_file, ["uwufetch"], sources=[cfg])
+    st = cfg.stat()
+    os.utime(cfg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert load_saved(save_file) is None
+    with WriterLock(save_file):
+        index = load_saved(save_file)
+        assert index is not None and list(index) == ["uwufetch"]
+
+
+STUB = """#!/bin/sh
+echo {name}
+[ {fail_pct} -eq 0 ] || [ $(($(od -An -N2 -tu2 /dev/urandom) % 100)) -ge {fail_pct} ]
+"""
+
+FETCHERS_YAML = """fetchers:
+  - !Fetcher
+    name: uwufetch
+    args:
+    extra_reqs: null
+    path: uwufetch
+    needs_image: False
+  - !Fetcher
+    name: pfetch
+    args:
+    extra_reqs: null
+    path: pfetch
+    needs_image: False
+image_methods: {}
+"""
+
+
+def test_pickers_during_rescan(tmp_path, monkeypatch):
+    """Many shells pick while another one keeps rescanning: every pick must come from
+    a saved set, never from a torn or missing file. pfetch fails about half of its
+    scans, so the sets saved by the rescans differ."""
+    from randofetch.cli import commands
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, fail_pct in (("uwufetch", 0), ("pfetch", 13)):
+        exe = bin_dir / name
+        exe.write_text(STUB.format(name=name, fail_pct=fail_pct))
+        exe.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    cfg_dir = tmp_path / "config" / "randofetch"
+    cfg_dir.mkdir(parents=True)
+    (cfg_dir / "fetchers.yaml").write_text(FETCHERS_YAML)
+    monkeypatch.setattr(commands, "_config_obj", None)
+    save_file = cfg_dir / "fetch.idx"
+
+    def rescan() -> set[str]:
+        commands.reset_fn(only_if_stale=False)
+        index = load_index(save_file)
+        assert index is not None
+        return set(index)
+
+    saved = rescan()
+    code = (
+        "import sys\n"
+        "from randofetch.cli.pick import pick_cmd\n"
+        "for _ in range(int(sys.argv[2])):\n"
+        "    cmd = pick_cmd(sys.argv[1])\n"
+        "    assert cmd, cmd\n"
+        "    print(cmd)\n"
+    )
+    pickers = [
+        subprocess.Popen(
+            [sys.executable, "-c", code, str(save_file), str(PICKS)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(PICKERS)
+    ]
+    rescans = 0
+    while any(p.poll() is None for p in pickers):
+        saved |= rescan()
+        rescans += 1
+    for p in pickers:
+        out, err = p.communicate()
+        assert p.returncode == 0, err
+        picks = out.splitlines()
+        assert len(picks) == PICKS
+        assert set(picks) <= saved
+    assert rescans > 1
+    assert [n for n in os.listdir(cfg_dir) if n.endswith(".tmp")] == []
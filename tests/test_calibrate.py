@@ -0,0 +1,140 @@
+import time
+
+from randofetch.cli.calibrate import (
+    Calibration,
+    Profile,
+    measure,
+    output_size,
+    run_timed,
+)
+from randofetch.cli.fetcher import FetcherSet
+from randofetch.cli.index import load_index, write_index
+from randofetch.cli.stats import LatencyStats
+
+from tests.test_fetcher import make_fetcher
+
+
+def test_measure_wall_and_cpu_time():
+    sleeper = measure(["sleep", "0.1"], calibration=Calibration(warmups=0, trials=3))
+    assert sleeper.trials == 3
+    assert 0.1 <= sleeper.min <= sleeper.p50 <= sleeper.p95
+    assert sleeper.cpu < 0.05
+
+    busy = measure(
+        "i=0; while [ $i -lt 100000 ]; do i=$((i + 1)); done",
+        shell=True,
+        calibration=Calibration(warmups=0, trials=1),
+    )
+    assert busy.cpu > busy.p50 / 2
+
+
+def test_failed_and_hung_runs():
+    assert run_timed(["false"]) is None
+    assert run_timed(["/no/such/fetcher"]) is None
+    start = time.perf_counter()
+    assert measure(["sleep", "30"], timeout=0.2) is None
+    assert time.perf_counter() - start < 5
+
+
+def test_admission_uses_the_percentile_after_warmup(tmp_path):
+    # Slow on its first run only, like a fetcher with cold caches.
+    cold = make_fetcher(
+        tmp_path,
+        "cold",
+        f'[ -e {tmp_path}/warm ] || {{ touch {tmp_path}/warm; sleep 0.5; }}',
+    )
+    # Slow on every second run.
+    flaky = make_fetcher(
+        tmp_path,
+        "flaky",
+        f'if [ -e {tmp_path}/odd ]; then rm {tmp_path}/odd; sleep 0.5; '
+        f"else touch {tmp_path}/odd; fi",
+    )
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=[cold, flaky],
+        max_time=0.3,
+    )
+    assert [f.name for f in fs.fetchers] == ["cold"]
+    assert fs.timing[1][0] == flaky.cmd and fs.timing[1][1] >= 0.5
+
+    profile = Profile.from_row(fs.index, 0)
+    assert profile == fs.profiles[0]
+    assert profile.trials == 5 and profile.p95 < 0.3
+
+
+def test_calibrated_latency_is_used_until_runs_are_observed(tmp_path):
+    profiles = [Profile(5, 0.01, 0.02, 0.03, 0.01), Profile(5, 2.0, 2.5, 3.0, 0.1)]
+    write_index(tmp_path / "fetch.idx", ["fast", "slow"], **Profile.columns(profiles))
+    index = load_index(tmp_path / "fetch.idx")
+    stats = LatencyStats(tmp_path / "latency.bin")
+
+    accept = stats.acceptor(index, budget=1.0, explore=0.0)
+    assert {index[index.random_entry(accept, tries=64)] for _ in range(100)} == {
+        "fast"
+    }
+    assert stats.acceptor(index, budget=5.0) is None
+
+    # Enough observed runs override the calibration.
+    for _ in range(3):
+        stats.record("slow", 0.1)
+    accept = stats.acceptor(index, budget=1.0, explore=0.0)
+    assert accept(1)
+
+
+def test_output_size_follows_the_cursor():
+    # A logo, then information written beside it after moving back up.
+    logo = b"\x1b[38;2;255;0;0m####\x1b[0m\n" * 3
+    info = b"\x1b[3A" + b"\x1b[6Cuser@host\n" + b"\x1b[6C\xe6\xbc\xa2\xe5\xad\x97\n"
+    assert output_size(logo + info) == (15, 3)
+    # Image data in escape strings does not count, wide characters take two cells.
+    assert output_size(b"\x1bPq#0;2;0;0;0~~~~\x1b\\ok\r\n\n\tx\n") == (9, 3)
+    assert output_size(b"") == (0, 0)
+
+
+def test_picks_skip_output_larger_than_the_terminal(tmp_path):
+    wide = make_fetcher(tmp_path, "wide", "printf '%0120d\\n' 0")
+    tall = make_fetcher(tmp_path, "tall", "seq 40")
+    small = make_fetcher(tmp_path, "small", "echo hi")
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=[wide, tall, small],
+        calibration=Calibration(warmups=1, trials=1),
+    )
+    assert [(p.width, p.height) for p in fs.profiles] == [(120, 1), (2, 40), (2, 1)]
+    assert {fs.pick(term_size=(80, 24)).cmd for _ in range(30)} == {small.cmd}
+    assert {fs.pick(term_size=(80, 50)).cmd for _ in range(60)} == {tall.cmd, small.cmd}
+    # Nothing fits: pick from everything rather than nothing.
+    assert fs.index.fitting_rows((1, 1)) is None
+    assert fs.index.fitting_rows((0, 0), [1]) == [1]
+
+
+def test_image_output_size_is_the_largest_over_images(tmp_path):
+    from randofetch.cli.fetcher import Fetcher, ImageMethod
+    from randofetch.cli.index import IMAGE_SLOT
+
+    # Draws as many lines as the image file says, like a logo of its aspect ratio.
+    base = make_fetcher(tmp_path, "logo", '[ -z "$2" ] || seq "$(cat "$2")"')
+    im = ImageMethod(caller="logo", args=["--image", {}])
+    fx = Fetcher.clone(base)
+    fx.image_method = im
+    fx.image_argv = tuple(im.image_argv(IMAGE_SLOT))
+    images = []
+    for i in range(8):
+        img = tmp_path / f"img{i}.png"
+        img.write_text("30" if i == 6 else "3")
+        images.append((img, img))
+
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=[fx, make_fetcher(tmp_path, "small", "echo hi")],
+        images=images,
+        calibration=Calibration(warmups=0, trials=1, size_images=4),
+    )
+    assert (fs.profiles[0].width, fs.profiles[0].height) == (2, 30)
+    assert fs.index.fitting_rows((80, 40)) is None
+    # Skipped, although its output on the first image would fit.
+    assert fs.index.fitting_rows((80, 24)) == [1]
@@ -0,0 +1,159 @@
+import os
+import select
+import threading
+
+import pytest
+
+from randofetch.cli import caps
+from randofetch.cli.index import IMAGE_SLOT, load_index, write_index
+
+
+def test_env_features():
+    assert caps.env_features({"TERM": "xterm-kitty"}) == {"kitty"}
+    assert caps.env_features({"TERM": "foot", "COLORTERM": "truecolor"}) == {
+        "sixel",
+        "truecolor",
+    }
+    assert "iterm" in caps.env_features({"ITERM_SESSION_ID": "w0t0p0"})
+    assert caps.env_features({"TERM": "xterm-256color"}) == set()
+
+
+def test_parse_da1():
+    assert caps.parse_da1("\x1b[?62;4;6;22c")
+    assert not caps.parse_da1("\x1b[?62;22c")
+    assert not caps.parse_da1("\x1b[?4c")  # 4 is the device class here
+
+
+def test_detect_is_cached_per_terminal(tmp_path, monkeypatch):
+    cache = str(tmp_path / "termcaps")
+    foot = {"TERM": "foot"}
+    assert caps.detect(cache, env=foot).features == {"sixel"}
+
+    # A new process reads the cached result instead of detecting again.
+    monkeypatch.setattr(caps, "_detected", {})
+    monkeypatch.setattr(caps, "env_features", lambda env=None: set())
+    assert caps.detect(cache, env=foot).features == {"sixel"}
+    assert caps.detect(cache, env={"TERM": "xterm"}).features == set()
+    assert len(open(cache).read().splitlines()) == 2
+
+    # Once expired, it is detected again.
+    later = caps.time.time() + caps.CAPS_TTL + 1
+    monkeypatch.setattr(caps.time, "time", lambda: later)
+    monkeypatch.setattr(caps, "_detected", {})
+    assert caps.detect(cache, env=foot).features == set()
+
+
+def test_silent_terminal_is_asked_once(tmp_path, monkeypatch):
+    cache = str(tmp_path / "termcaps")
+    asked = []
+    monkeypatch.setattr(caps, "_can_query", lambda: True)
+    monkeypatch.setattr(caps, "terminal_cell", lambda: None)
+    monkeypatch.setattr(caps, "query_da1", lambda: asked.append(1) or "")
+    monkeypatch.setenv("TERM", "xterm-256color")
+    for _ in range(3):
+        # One shell start each.
+        monkeypatch.setattr(caps, "_detected", {})
+        assert caps.detect(cache).queried
+    assert len(asked) == 1
+
+
+def test_captured_stdout_is_not_queried(tmp_path, monkeypatch):
+    # Under `$(randofetch)` stdin and stderr are the terminal, but replies to a query
+    # on stdout cannot come back, so the guess must not be cached as asked.
+    cache = str(tmp_path / "termcaps")
+    monkeypatch.setattr(caps, "_tty_fd", lambda: 0)
+    monkeypatch.setattr(caps.sys, "stdin", FakeTTY(True))
+    monkeypatch.setattr(caps.sys, "stdout", FakeTTY(False))
+    monkeypatch.setenv("TERM", "xterm-256color")
+    assert caps.query_da1() is None
+    assert not caps.detect(cache).queried
+
+
+class FakeTTY:
+    def __init__(self, tty: bool):
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+
+@pytest.fixture
+def pty_stdio(monkeypatch):
+    """(master, slave) of a pseudo terminal for stdin and stdout. Tests call the
+    returned use() first, as output capture swaps sys.stdout back after setup."""
+    pty = pytest.importorskip("pty")
+    master, slave = pty.openpty()
+    stdio = os.fdopen(slave, "r+b", buffering=0)
+
+    def use():
+        monkeypatch.setattr(caps.sys, "stdin", stdio)
+        monkeypatch.setattr(caps.sys, "stdout", stdio)
+        return master, slave
+
+    yield use
+    monkeypatch.undo()
+    stdio.close()
+    os.close(master)
+
+
+def _pending(fd: int) -> bytes:
+    return os.read(fd, 64) if select.select([fd], [], [], 0.5)[0] else b""
+
+
+def test_da1_keeps_typed_ahead_input(pty_stdio):
+    master, slave = pty_stdio()
+    os.write(master, b"ls\n")
+    _pending(master)  # its echo
+    assert caps.query_da1() is None
+    assert not select.select([master], [], [], 0)[0]  # nothing was sent
+    assert _pending(slave) == b"ls\n"
+
+
+def test_da1_reads_only_the_reply(pty_stdio):
+    master, slave = pty_stdio()
+
+    def terminal():
+        assert _pending(master) == b"\x1b[c"
+        os.write(master, b"\x1b[?62;4;22cls")
+
+    t = threading.Thread(target=terminal)
+    t.start()
+    reply = caps.query_da1(timeout=2)
+    t.join()
+    assert reply == "\x1b[?62;4;22c" and caps.parse_da1(reply)
+    assert _pending(slave) == b"ls"
+
+
+def test_path_resolver(tmp_path):
+    exe = tmp_path / "bin" / "fetchme"
+    exe.parent.mkdir()
+    exe.write_text("#!/bin/sh\n")
+    exe.chmod(0o755)
+    (tmp_path / "bin" / "notexec").write_text("")
+    path = os.pathsep.join([str(tmp_path / "missing"), str(exe.parent)])
+    assert caps.which("fetchme", path) == str(exe)
+    assert caps.which("notexec", path) is None
+    assert caps.which("nope", path) is None
+    assert caps.which(str(exe), path) == str(exe)
+
+
+def test_unsupported_image_methods_are_not_picked(tmp_path):
+    idx = tmp_path / "fetch.idx"
+    write_index(
+        idx,
+        [
+            "uwufetch",
+            f"fastfetch --sixel {IMAGE_SLOT}",
+            f"fastfetch --chafa {IMAGE_SLOT}",
+        ],
+        images=[(f"/img{i}.png", None) for i in range(10)],
+        each_image=[None, "1", "1"],
+        requires=[None, "sixel", None],
+    )
+    index = load_index(idx)
+    assert index.supported_rows({"sixel", "truecolor"}) is None
+    rows = index.supported_rows(set())
+    assert rows == [0, 2]
+    picked = {index[index.random_entry(rows=rows)] for _ in range(300)}
+    assert len(picked) == 11
+    assert not any("--sixel" in cmd for cmd in picked)
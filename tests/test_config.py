@@ -0,0 +1,53 @@
+import os
+import sys
+
+from randofetch.cli import config
+from randofetch.cli.config import load_config
+
+YAML = """fetchers:
+  - !Fetcher
+    name: fastfetch
+    args:
+      - --disable-linewrap false
+    path: fastfetch
+    needs_image: True
+image_methods:
+  chafa:
+    caller: fastfetch
+    args:
+      - --chafa
+      - {}
+"""
+
+
+def test_compiled_config_skips_yaml_parser(tmp_path, monkeypatch):
+    cfg = tmp_path / "fetchers.yaml"
+    cfg.write_text(YAML)
+    parsed = load_config(cfg)
+    assert parsed["fetchers"][0]["needs_image"] is True
+    assert parsed["image_methods"]["chafa"]["args"] == ["--chafa", {}]
+    assert (tmp_path / "fetchers.yaml.cache").exists()
+
+    # A fresh process, with the YAML unchanged or only touched, never imports ruamel.
+    monkeypatch.setattr(config, "_loaded", {})
+    monkeypatch.setitem(sys.modules, "ruamel.yaml", None)
+    assert load_config(cfg) == parsed
+    st = cfg.stat()
+    os.utime(cfg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    monkeypatch.setattr(config, "_loaded", {})
+    assert load_config(cfg) == parsed
+    assert load_config(cfg) is load_config(cfg)
+
+
+def test_changed_config_is_parsed_again(tmp_path):
+    cfg = tmp_path / "fetchers.yaml"
+    cfg.write_text(YAML)
+    load_config(cfg)
+    cfg.write_text(YAML.replace("fastfetch", "uwufetch"))
+    st = cfg.stat()
+    os.utime(cfg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert load_config(cfg)["fetchers"][0]["path"] == "uwufetch"
+
+    (tmp_path / "fetchers.yaml.cache").write_bytes(b"garbage")
+    config._loaded.clear()
+    assert load_config(cfg)["fetchers"][0]["path"] == "uwufetch"
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from randofetch.cli import client
+from randofetch.cli.daemon import Daemon, parse_request, start_server
+from randofetch.cli.index import load_index, write_index
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    from randofetch.cli.config import BaseConfig
+
+    return BaseConfig()
+
+
+@pytest.fixture
+def served(tmp_path, config):
+    save_file = tmp_path / "fetch.idx"
+    write_index(
+        save_file,
+        ["echo one", "echo cols=$COLUMNS"],
+        argv=["echo\0one", None],
+    )
+    path = str(tmp_path / "run" / "daemon.sock")
+    daemon = Daemon(
+        config, lambda: load_index(save_file, check_sources=False), save_file, 0.05
+    )
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=lambda: asyncio.run(daemon.serve(path, ready.set)), daemon=True
+    )
+    thread.start()
+    assert ready.wait(10)
+    yield save_file, path
+    daemon.shutdown()
+    thread.join(10)
+
+
+def test_parse_request_keeps_terminal_variables():
+    line = client.encode_request(
+        "render", (80, 24), {"TERM": "xterm-kitty", "SECRET": "x", "TMUX": "1"}
+    )
+    req = parse_request(line)
+    assert req.op == "render" and req.term_size == (80, 24)
+    assert req.env == {"TERM": "xterm-kitty", "TMUX": "1"}
+
+
+def test_client_without_daemon(tmp_path):
+    assert client.request("pick", path=str(tmp_path / "none.sock")) is None
+    # A file left behind by a daemon that is gone.
+    (tmp_path / "stale.sock").write_text("")
+    assert client.request("pick", path=str(tmp_path / "stale.sock")) is None
+
+
+def test_daemon_serves_concurrent_clients(served):
+    _, path = served
+    picks = {client.request("pick", path=path) for _ in range(50)}
+    assert picks == {b"echo one\n", b"echo cols=$COLUMNS\n"}
+
+    def render(_):
+        return client.request("render", (77, 20), path=path)
+
+    with ThreadPoolExecutor(64) as ex:
+        outputs = list(ex.map(render, range(200)))
+    assert set(outputs) == {b"one\n", b"cols=77\n"}
+
+
+def test_daemon_reloads_replaced_set(served):
+    save_file, path = served
+    write_index(save_file, ["echo two"])
+    end = time.monotonic() + 5
+    while client.request("pick", path=path) != b"echo two\n":
+        assert time.monotonic() < end
+        time.sleep(0.05)
+    assert client.request("render", (80, 24), path=path) == b"two\n"
+
+
+def test_daemon_survives_failed_saves(served, monkeypatch):
+    from randofetch.cli.render import RenderCache
+
+    _, path = served
+
+    def full_disk(self, key, data):
+        raise OSError(28, "No space left on device")
+
+    with monkeypatch.context() as m:
+        m.setattr(RenderCache, "put", full_disk)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(5)
+            s.connect(path)
+            s.sendall(client.encode_request("render", (61, 20)))
+            assert s.makefile("rb").readline() == b"NO\n"
+    assert client.request("pick", path=path) is not None
+    assert client.request("render", (62, 20), path=path) is not None
+
+
+def test_second_daemon_is_refused(served):
+    _, path = served
+
+    async def start():
+        await start_server(lambda r, w: None, path)
+
+    with pytest.raises(FileExistsError):
+        asyncio.run(start())
+
+
+def test_shared_socket_folder_is_refused(tmp_path, served):
+    _, served_path = served
+    run = os.path.dirname(served_path)
+    assert client.request("pick", path=served_path) is not None
+    os.chmod(run, 0o755)
+    assert client.request("pick", path=served_path) is None
+    os.chmod(run, 0o700)
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    path = str(shared / "daemon.sock")
+
+    async def start():
+        await start_server(lambda r, w: None, path)
+
+    with pytest.raises(PermissionError):
+        asyncio.run(start())
+
+    shared.chmod(0o700)
+    assert client.private_dir(str(shared))
+    (tmp_path / "link").symlink_to(shared)
+    assert not client.private_dir(str(tmp_path / "link"))
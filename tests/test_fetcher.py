@@ -1 +1,156 @@
+import time
+
 import pytest
+
+from randofetch.cli.fetcher import Fetcher, FetcherSet, run_cmd
+
+
+def make_fetcher(tmp_path, name, body="exit 0"):
+    exe = tmp_path / name
+    exe.write_text(f"#!/bin/sh\n{body}\n")
+    exe.chmod(0o755)
+    return Fetcher(name=name, path=str(exe), args="")
+
+
+@pytest.fixture
+def fetchers(tmp_path):
+    return [
+        make_fetcher(tmp_path, "slow", "sleep 0.3"),
+        make_fetcher(tmp_path, "fast"),
+        make_fetcher(tmp_path, "broken", "exit 3"),
+        make_fetcher(tmp_path, "hung", "sleep 30"),
+        make_fetcher(tmp_path, "medium", "sleep 0.1"),
+    ]
+
+
+def test_scan_is_parallel_ordered_and_kills_hung_probes(tmp_path, fetchers):
+    start = time.perf_counter()
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=fetchers,
+        max_time=5.0,
+        workers=8,
+        probe_timeout=1.0,
+    )
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 5.0
+    assert [f.name for f in fs.fetchers] == ["slow", "fast", "medium"]
+    assert [c for c, _ in fs.timing] == [
+        fetchers[0].cmd,
+        fetchers[1].cmd,
+        "",
+        "",
+        fetchers[4].cmd,
+    ]
+    assert sorted(fs.index) == sorted(f.cmd for f in fs.fetchers)
+
+
+def test_scan_rejects_slow_fetchers(tmp_path, fetchers):
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=fetchers[:2],
+        max_time=0.2,
+        probe_timeout=1.0,
+    )
+    assert [f.name for f in fs.fetchers] == ["fast"]
+
+
+def test_clones_share_one_probe(tmp_path):
+    calls = tmp_path / "calls"
+    base = make_fetcher(tmp_path, "counted", f"echo x >> {calls}")
+    images = []
+    for i in range(20):
+        img = tmp_path / f"img{i}.png"
+        img.write_bytes(b"png")
+        images.append(img)
+    clones = []
+    for img in images:
+        fx = Fetcher.clone(base)
+        fx.image = img
+        fx.image_args = f" --chafa {img}"
+        clones.append(fx)
+    images[3].unlink()
+
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=clones,
+        max_time=5.0,
+        workers=8,
+    )
+    # One probe, then one warm-up and five timed runs of the command they share.
+    assert len(calls.read_text().splitlines()) == 1 + 6
+    assert len(fs.fetchers) == 19
+    assert clones[3] not in fs.fetchers
+
+
+def test_argv_runs_without_shell(tmp_path):
+    from randofetch.cli.fetcher import ImageMethod
+    from randofetch.cli.index import load_index
+
+    base = make_fetcher(tmp_path, "echoer", 'printf "%s|" "$@"')
+    base.args = ["--a 'b c'", "$HOME"]
+    img = tmp_path / "my pictures" / "a;b.png"
+    img.parent.mkdir()
+    img.write_bytes(b"png")
+    im = ImageMethod(caller="echoer", args=["--image", {}])
+    fx = Fetcher.clone(base)
+    fx.image = img
+    fx.image_argv = tuple(im.image_argv(img))
+
+    assert fx.argv[1:] == ["--image", str(img), "--a", "b c", fx.main_argv[-1]]
+    out = fx.run_silent().decode()
+    assert out.startswith(f"--image|{img}|--a|b c|")
+
+    FetcherSet(reset=True, save_file=tmp_path / "fetch.idx", fetcher_list=[fx])
+    index = load_index(tmp_path / "fetch.idx")
+    assert index.argv(0) == fx.argv
+
+
+def test_shell_mode_and_invalid_args(tmp_path):
+    sh = make_fetcher(tmp_path, "sh", 'echo "$1"')
+    sh.shell = True
+    sh.args = "$((1 + 2))"
+    assert sh.run_silent() == b"3\n"
+
+    bad = make_fetcher(tmp_path, "bad")
+    bad.args = "'unbalanced"
+    fs = FetcherSet(
+        reset=True, save_file=tmp_path / "fetch.idx", fetcher_list=[sh, bad]
+    )
+    assert [f.name for f in fs.fetchers] == ["sh"]
+    assert fs.index.argv(0) is None
+
+
+def test_image_fetchers_are_expanded_when_picked(tmp_path):
+    from randofetch.cli.fetcher import ImageMethod
+    from randofetch.cli.index import IMAGE_SLOT
+
+    base = make_fetcher(tmp_path, "logo", 'printf "%s" "$2"')
+    im = ImageMethod(caller="logo", args=["--image", {}])
+    fx = Fetcher.clone(base)
+    fx.image_method = im
+    fx.image_argv = tuple(im.image_argv(IMAGE_SLOT))
+    images = []
+    for i in range(50):
+        img = tmp_path / f"img {i}.png"
+        img.write_bytes(b"png")
+        images.append((img, img))
+    images[7][0].unlink()
+
+    fs = FetcherSet(
+        reset=True,
+        save_file=tmp_path / "fetch.idx",
+        fetcher_list=[fx, make_fetcher(tmp_path, "plain")],
+        images=images,
+    )
+    assert len(fs.index) == 49 + 1
+    assert fs.index.n_rows == 2
+    p = fs.pick()
+    assert p.image is None or p.argv == [base.path, "--image", p.image]
+    assert str(images[7][0]) not in (fs.index.get(i, "image") for i in range(49))
+    r = run_cmd(fs.index[3], silent=True, argv=fs.index.argv(3))
+    assert r.stdout.decode() == fs.index.get(3, "image")
@@ -0,0 +1,48 @@
+import json
+import time
+
+from randofetch.cli import gallery
+from randofetch.cli.index import load_index, write_index
+from randofetch.cli.render import RenderCache
+
+
+def test_render_all_reports_failures_and_warms_cache(tmp_path):
+    cmds = [
+        'printf "%s" "$COLUMNS"',
+        "sleep 0.3; printf slow",
+        "exit 2",
+        "sleep 30",
+        "printf ok",
+    ]
+    write_index(tmp_path / "fetch.idx", cmds)
+    index = load_index(tmp_path / "fetch.idx")
+    cache = RenderCache(tmp_path / "render")
+    out = tmp_path / "gallery"
+
+    start = time.perf_counter()
+    picks = gallery.entries(index)
+    results = gallery.render_all(
+        index, out, (123, 45), picks, workers=5, timeout=1.0, cache=cache
+    )
+    assert time.perf_counter() - start < 5
+    assert [r.returncode for r in results] == [0, 0, 2, None, 0]
+    assert (out / results[0].output).read_bytes() == b"123"
+    assert cache.get(cache.key(cmds[0], None, (123, 45))) == b"123"
+    assert cache.get(cache.key(cmds[2], None, (123, 45))) is None
+
+    report = json.loads((out / "report.json").read_text())
+    assert report["term_size"] == [123, 45]
+    assert [r["size"] for r in report["results"]] == [3, 4, 0, 0, 2]
+
+    lines = gallery.summary(results, slowest=1)
+    assert lines[0] == "3 of 5 rendered"
+    assert any("exit 2" in line for line in lines)
+    assert any("timed out" in line for line in lines)
+    assert "sleep 30" in lines[-1]
+
+
+def test_sample_and_size():
+    assert gallery.parse_size("80x24") == (80, 24)
+    assert gallery.entries(range(10), 3, seed=1) == gallery.entries(range(10), 3, 1)
+    assert len(set(gallery.entries(range(10), 3))) == 3
+    assert gallery.entries(range(4), 10) == [0, 1, 2, 3]
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from randofetch.cli import images
+from randofetch.cli.images import ImageIndex, ImageRoot
+
+
+def test_image_index_roots_and_recursion(tmp_path):
+    data = tmp_path / "data"
+    pics = tmp_path / "pics"
+    (data / "render").mkdir(parents=True)
+    (pics / "sub").mkdir(parents=True)
+    (pics / ".hidden").mkdir()
+    for p in ("a.png", "b.jpg", "notes.txt", "render/x.png"):
+        (data / p).write_bytes(p.encode())
+    for p in ("c.png", "sub/d.png", ".hidden/e.png"):
+        (pics / p).write_bytes(p.encode())
+
+    index = ImageIndex(
+        tmp_path / "images.idx",
+        [ImageRoot(data), ImageRoot(pics, recursive=True), ImageRoot(tmp_path / "no")],
+        ["*.png", "*.jpg"],
+        exclude=[data / "render"],
+    )
+    found = index.refresh()
+    names = sorted(e.path.relative_to(tmp_path).as_posix() for e in found)
+    assert names == ["data/a.png", "data/b.jpg", "pics/c.png", "pics/sub/d.png"]
+    assert all(len(e.digest) == 40 and e.size for e in found)
+    assert str(tmp_path / "no") in index.dirs
+
+
+def test_image_index_only_rehashes_changes(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    for i in range(5):
+        (data / f"{i}.png").write_bytes(bytes([i]) * 10)
+    hashed = []
+    real_hash = images.file_hash
+    monkeypatch.setattr(images, "file_hash", lambda p: hashed.append(p) or real_hash(p))
+    index = ImageIndex(tmp_path / "images.idx", [ImageRoot(data)], ["*.png"])
+
+    assert len(index.refresh()) == 5 and len(hashed) == 5
+    hashed.clear()
+    assert len(index.refresh()) == 5 and hashed == []  # folder unchanged
+    (data / "0.png").write_bytes(b"changed")
+    (data / "5.png").write_bytes(b"new")
+    found = index.refresh()
+    assert len(found) == 6
+    assert sorted(os.path.basename(p) for p in hashed) == ["0.png", "5.png"]
+    hashed.clear()
+    assert len(index.refresh(force=True)) == 6 and hashed == []
+
+
+def test_import_images_dedups_and_renames(tmp_path, monkeypatch):
+    src = tmp_path / "wallpapers"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.png").write_bytes(b"a" * 3000)
+    (src / "sub" / "a.png").write_bytes(b"other a")
+    (src / "sub" / "copy of a.png").write_bytes(b"a" * 3000)
+    (src / "old.png").write_bytes(b"in the library")
+    notes = tmp_path / "notes.txt"
+    notes.write_text("hi")
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (lib / "old.png").write_bytes(b"in the library")
+    index = ImageIndex(tmp_path / "i.idx", [ImageRoot(lib)], ["*.png"])
+    library = {e.digest for e in index.refresh()}
+
+    results = images.import_images(
+        [src, notes], lib, ["*.png"], library, recursive=True, workers=4
+    )
+    by_how = {}
+    for r in results:
+        by_how.setdefault(r.how, []).append(r.source.name)
+    assert by_how.pop("skipped") == ["notes.txt"]
+    assert sorted(by_how.pop("duplicate")) == ["copy of a.png", "old.png"]
+    placed = [r for r in results if r.placed]
+    assert len(placed) == 2 and set(by_how) <= {"reflink", "copy"}
+    assert sorted(p.name for p in lib.iterdir()) == sorted(
+        ["a.png", f"a-{placed[1].digest[:12]}.png", "old.png"]
+    )
+    assert (lib / "a.png").read_bytes() == b"a" * 3000
+    summary = images.import_summary(results)
+    assert summary[0].startswith("Imported 2 images (")
+    assert summary[0].endswith(", 2 already in the library, 1 not images")
+
+    # The index does not hash imported files again.
+    hashed = []
+    real_hash = images.file_hash
+    monkeypatch.setattr(images, "file_hash", lambda p: hashed.append(p) or real_hash(p))
+    known = []
+    for r in placed:
+        st = r.dest.stat()
+        known.append(images.ImageEntry(r.dest, st.st_size, st.st_mtime_ns, r.digest))
+    assert len(index.refresh(known=known)) == 3
+    assert hashed == []
+
+
+def test_import_images_links(tmp_path):
+    src = tmp_path / "a.png"
+    src.write_bytes(b"png")
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    [r] = images.import_images([src], lib, ["*.png"], link=True)
+    assert r.how == "link"
+    assert os.path.samefile(src, lib / "a.png")
+
+
+def test_import_never_replaces_library_files(tmp_path):
+    src = tmp_path / "a.png"
+    src.write_bytes(b"new")
+    digest = images.file_hash(src)
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (lib / "a.png").write_bytes(b"mine")
+    (lib / f"a-{digest[:12]}.png").write_bytes(b"also mine")
+
+    [r] = images.import_images([src], lib, ["*.png"])
+    assert r.dest.name == f"a-{digest[:12]}-2.png"
+    assert r.dest.read_bytes() == b"new"
+    assert (lib / "a.png").read_bytes() == b"mine"
+    assert (lib / f"a-{digest[:12]}.png").read_bytes() == b"also mine"
+
+    # A file that appears at dest after its name was chosen is kept too.
+    with pytest.raises(FileExistsError):
+        images.place(src, lib / "a.png")
+    assert (lib / "a.png").read_bytes() == b"mine"
+    assert len(list(lib.iterdir())) == 3
@@ -0,0 +1,108 @@
+import os
+import struct
+
+from randofetch.cli.index import INDEX_VERSION, load_index, write_index
+
+
+def test_index_roundtrip(tmp_path):
+    cmds = ["fastfetch --chafa '/tmp/a b.png'", "uwufetch", "hyfetch -m rgb"]
+    write_index(tmp_path / "fetch.idx", cmds)
+    index = load_index(tmp_path / "fetch.idx")
+    assert index is not None
+    assert list(index) == cmds
+    assert index.pick() in cmds
+
+
+def test_empty_index(tmp_path):
+    write_index(tmp_path / "fetch.idx", [])
+    index = load_index(tmp_path / "fetch.idx")
+    assert index is not None and len(index) == 0
+    assert index.pick() is None
+
+
+def test_stale_index(tmp_path):
+    cfg = tmp_path / "fetchers.yaml"
+    cfg.write_text("fetchers: []")
+    write_index(tmp_path / "fetch.idx", ["uwufetch"], sources=[cfg])
+    assert load_index(tmp_path / "fetch.idx") is not None
+    st = cfg.stat()
+    os.utime(cfg, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert load_index(tmp_path / "fetch.idx") is None
+    assert load_index(tmp_path / "fetch.idx", check_sources=False) is not None
+
+
+def test_rejects_other_versions_and_garbage(tmp_path):
+    idx = tmp_path / "fetch.idx"
+    write_index(idx, ["uwufetch"])
+    data = bytearray(idx.read_bytes())
+    struct.pack_into("<H", data, 4, INDEX_VERSION + 1)
+    idx.write_bytes(bytes(data))
+    assert load_index(idx) is None
+
+    idx.write_bytes(b"\x80\x04old pickle")
+    assert load_index(idx) is None
+    assert load_index(tmp_path / "missing.idx") is None
+
+    write_index(idx, ["uwufetch", "hyfetch"])
+    idx.write_bytes(idx.read_bytes()[:-3])
+    assert load_index(idx) is None
+
+
+def test_index_columns(tmp_path):
+    idx = tmp_path / "fetch.idx"
+    write_index(idx, ["a", "b"], image=["/x.png", None])
+    index = load_index(idx)
+    assert index.fields == ["cmd", "image"]
+    assert index.get(0, "image") == "/x.png"
+    assert index.get(1, "image") is None
+    assert index.get(1, "nope") is None
+
+
+def test_image_rows_expand_on_pick(tmp_path):
+    from randofetch.cli.index import IMAGE_SLOT
+
+    idx = tmp_path / "fetch.idx"
+    images = [
+        (f"/lib/img {i}.png", f"/thumbs/{i}.png" if i % 2 else None) for i in range(4)
+    ]
+    write_index(
+        idx,
+        ["uwufetch", f"fastfetch --chafa {IMAGE_SLOT}"],
+        images=images,
+        argv=["uwufetch", f"fastfetch\0--chafa\0{IMAGE_SLOT}"],
+        each_image=[None, "1"],
+    )
+    index = load_index(idx)
+    assert len(index) == 5
+    assert index.plain_entries() == [0]
+    assert index.get(0, "image") is None
+    assert index.get(1, "image") == "/lib/img 0.png"
+    assert index[1] == "fastfetch --chafa '/lib/img 0.png'"
+    assert index.argv(2) == ["fastfetch", "--chafa", "/thumbs/1.png"]
+    assert index[4] == "fastfetch --chafa /thumbs/3.png"
+    assert {index.random_entry() for _ in range(200)} == set(range(5))
+
+    write_index(idx, ["uwufetch", f"fastfetch {IMAGE_SLOT}"], each_image=[None, "1"])
+    assert list(load_index(idx)) == ["uwufetch"]
+
+
+def test_random_entry_draws_from_accepted_rows(tmp_path):
+    from randofetch.cli.index import IMAGE_SLOT
+
+    idx = tmp_path / "fetch.idx"
+    slow = [f"slowfetch{n}" for n in range(20)]
+    images = [(f"/img{k}.png", None) for k in range(3)]
+    cmds = [*slow, "uwufetch", f"fastfetch --chafa {IMAGE_SLOT}"]
+    write_index(idx, cmds, images=images, each_image=[*[None] * 21, "1"])
+    index = load_index(idx)
+
+    def accept(i):
+        return not index[i].startswith("slowfetch")
+
+    # Most rows are rejected, so the redraws usually run out.
+    picked = [index[index.random_entry(accept, tries=2)] for _ in range(400)]
+    assert not any(cmd.startswith("slowfetch") for cmd in picked)
+    fast = {f"fastfetch --chafa /img{k}.png" for k in range(3)}
+    assert set(picked) == {"uwufetch", *fast}
+    assert index.random_entry(lambda i: False) is None
+    assert index.random_entry(accept, rows=list(range(20))) is None
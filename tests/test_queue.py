@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from randofetch.cli.index import load_index, write_index
+from randofetch.cli.queue import RenderQueue
+from randofetch.cli.stats import LatencyStats
+
+
+def test_pop_hands_each_entry_out_once(tmp_path):
+    queue = RenderQueue(tmp_path / "queue", size=50, term_size=(80, 24))
+    for i in range(50):
+        queue.push(f"render {i}".encode())
+    assert len(queue) == 50
+
+    with ThreadPoolExecutor(16) as e:
+        got = list(e.map(lambda _: queue.pop(), range(60)))
+    outputs = [g for g in got if g is not None]
+    assert sorted(outputs) == sorted(f"render {i}".encode() for i in range(50))
+    assert len(queue) == 0
+    assert queue.pop() is None
+
+
+def test_queue_is_per_terminal_size(tmp_path):
+    RenderQueue(tmp_path / "queue", term_size=(80, 24)).push(b"small")
+    assert RenderQueue(tmp_path / "queue", term_size=(200, 60)).pop() is None
+    assert RenderQueue(tmp_path / "queue", term_size=(80, 24)).pop() == b"small"
+
+
+def test_refill(tmp_path):
+    write_index(tmp_path / "fetch.idx", ["printf one", "printf two", "exit 1"])
+    queue = RenderQueue(tmp_path / "queue", size=4, term_size=(80, 24))
+    queue.refill(load_index(tmp_path / "fetch.idx"), timeout=5)
+    assert 0 < len(queue) <= 4
+    assert queue.pop() in (b"one", b"two")
+    queue.clear()
+    assert len(queue) == 0
+
+
+def test_refill_records_hung_and_missing_fetchers_as_timeouts(tmp_path):
+    write_index(
+        tmp_path / "fetch.idx",
+        ["sleep 30", "/no/such/fetcher"],
+        argv=["sleep\0" "30", "/no/such/fetcher"],
+    )
+    stats = LatencyStats(tmp_path / "latency.bin")
+    queue = RenderQueue(tmp_path / "queue", size=1, term_size=(80, 24))
+    queue.refill(load_index(tmp_path / "fetch.idx"), timeout=0.1, stats=stats)
+    assert len(queue) == 0
+    samples = stats.samples("sleep 30") + stats.samples("/no/such/fetcher")
+    assert samples == [float("inf")] * 3
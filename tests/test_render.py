@@ -0,0 +1,161 @@
+import io
+import os
+import time
+
+from randofetch.cli.render import RenderCache, file_hash, show
+
+
+def test_render_cache_hit_skips_subprocess(tmp_path):
+    calls = tmp_path / "calls"
+    cache = RenderCache(tmp_path / "render")
+    cmd = f"echo x >> {calls}; printf '\\033[31mlogo\\033[0m'"
+    for _ in range(3):
+        out = io.BytesIO()
+        show(cmd, cache=cache, out=out)
+        assert out.getvalue() == b"\x1b[31mlogo\x1b[0m"
+    assert calls.read_text() == "x\n"
+
+
+def test_render_cache_key_tracks_image_content(tmp_path):
+    cache = RenderCache(tmp_path / "render")
+    img = tmp_path / "a.png"
+    img.write_bytes(b"one")
+    k1 = cache.key("fastfetch", img)
+    img.write_bytes(b"two")
+    assert cache.key("fastfetch", img) != k1
+    assert cache.key("fastfetch", img) != cache.key("uwufetch", img)
+
+
+def test_image_hash_memo_is_kept_per_path(tmp_path):
+    cache = RenderCache(tmp_path / "render")
+    img = tmp_path / "a.png"
+    for i in range(5):
+        img.write_bytes(b"x" * i)
+        os.utime(img, ns=(i, i))
+        cache.key("fastfetch", img)
+    memos = tmp_path / "render" / "images"
+    assert len(list(memos.iterdir())) == 1
+    assert cache.image_hash(img) == file_hash(img)
+    cache.clear()
+    assert not memos.exists()
+
+
+def test_render_cache_ttl_and_lru(tmp_path):
+    cache = RenderCache(tmp_path / "render", ttl=60, max_bytes=3000, compress=False)
+    cache.put("aa1", b"x" * 1000)
+    cache.put("aa2", b"y" * 1000)
+    time.sleep(0.01)
+    assert cache.get("aa1") == b"x" * 1000  # aa1 is now the most recently used
+    cache.put("aa3", b"z" * 1000)
+    assert cache.get("aa2") is None
+    assert cache.get("aa1") is not None and cache.get("aa3") is not None
+
+    expired = RenderCache(tmp_path / "render", ttl=-1)
+    assert expired.get("aa1") is None
+
+
+def test_render_cache_compression(tmp_path):
+    cache = RenderCache(tmp_path / "render", compress=True)
+    cache.put("bb1", b"\x1b[38;2;1;2;3m#" * 500)
+    assert cache.get("bb1") == b"\x1b[38;2;1;2;3m#" * 500
+    assert sum(st.st_size for _, st in cache.entries()) < 500
+
+
+def test_deadline_kills_and_falls_back(tmp_path):
+    from randofetch.cli.index import load_index, write_index
+    from randofetch.cli.render import fallbacks
+    from randofetch.cli.stats import LatencyStats
+
+    write_index(
+        tmp_path / "fetch.idx",
+        ["sleep 30; printf slow", "printf plain"],
+        image=[str(tmp_path / "a.png"), None],
+    )
+    index = load_index(tmp_path / "fetch.idx")
+    stats = LatencyStats(tmp_path / "latency.bin")
+    out = io.BytesIO()
+    start = time.perf_counter()
+    show(
+        index[0],
+        cache=None,
+        out=out,
+        stats=stats,
+        deadline=0.3,
+        fallback=fallbacks(index, None, 0.3, stats),
+    )
+    assert time.perf_counter() - start < 5
+    assert out.getvalue() == b"plain"
+    assert stats.summary(index[0])[2] == float("inf")
+
+
+def test_deadline_prefers_cached_render(tmp_path):
+    from randofetch.cli.render import fallbacks
+
+    cache = RenderCache(tmp_path / "render")
+    show("printf cached", cache=cache, out=io.BytesIO())
+    out = io.BytesIO()
+    fallback = fallbacks([], cache, 0.2)
+    show("sleep 30", cache=cache, out=out, deadline=0.2, fallback=fallback)
+    assert out.getvalue() == b"cached"
+
+
+def test_fallback_skips_renders_for_other_terminals(tmp_path, monkeypatch):
+    from randofetch.cli.index import load_index, write_index
+    from randofetch.cli.render import fallbacks
+
+    monkeypatch.setenv("TERM", "xterm-256color")
+    cache = RenderCache(tmp_path / "render")
+    cache.put(cache.key("wide", None, (200, 60)), b"\x1bPq#0;2;0;0;0~-\x1b\\")
+    assert cache.recent((200, 60)) is not None
+    assert cache.recent((80, 24)) is None
+    assert cache.recent((200, 60), {"TERM": "linux"}) is None
+
+    write_index(tmp_path / "fetch.idx", [])
+    monkeypatch.setattr("randofetch.cli.render.terminal_size", lambda: (80, 24))
+    out = io.BytesIO()
+    fallback = fallbacks(load_index(tmp_path / "fetch.idx"), cache, 0.2)
+    show("sleep 30", cache=cache, out=out, deadline=0.2, fallback=fallback)
+    assert out.getvalue() == b""
+
+
+class TimedWrites(io.BytesIO):
+    """Records when each write happened."""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+
+    def write(self, b):
+        self.times.append(time.perf_counter())
+        return super().write(b)
+
+
+def test_output_is_streamed_and_teed_to_cache(tmp_path):
+    from randofetch.cli import trace
+
+    cache = RenderCache(tmp_path / "render")
+    out = TimedWrites()
+    cmd = "printf '\\033Pq#0~'; sleep 0.5; printf '\\033\\\\'"
+    trace.enable()
+    try:
+        start = time.perf_counter()
+        show(cmd, cache=cache, out=out)
+        rec = trace.record([])
+    finally:
+        trace.enable(None)
+    assert out.times[0] - start < 0.4
+    assert out.getvalue() == b"\x1bPq#0~\x1b\\"
+    assert rec["phases"]["ttfb"] < 400
+    assert cache.get(cache.key(cmd)) == out.getvalue()
+
+
+def test_output_cut_off_at_deadline_is_not_cached(tmp_path):
+    cache = RenderCache(tmp_path / "render")
+    out = io.BytesIO()
+    called = []
+    fallback = [lambda: called.append(1) or b"fallback"]
+    cmd = "printf partial; sleep 30"
+    show(cmd, cache=cache, out=out, deadline=0.3, fallback=fallback)
+    assert out.getvalue().startswith(b"partial\x1b\\")
+    assert called == []
+    assert cache.entries() == []
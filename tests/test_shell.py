@@ -0,0 +1,106 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from randofetch.cli import shell
+from randofetch.cli.index import IMAGE_SLOT, load_index, write_index
+
+
+@pytest.fixture
+def saved(tmp_path):
+    source = tmp_path / "fetchers.yaml"
+    source.write_text("fetchers: []")
+    save_file = tmp_path / "fetch.idx"
+    write_index(
+        save_file,
+        ["uwufetch", f"fastfetch --chafa {IMAGE_SLOT}", f"fastfetch --sixel {IMAGE_SLOT}"],
+        [source],
+        images=[("/lib/it's a.png", None), ("/lib/b.png", "/thumbs/b.png")],
+        each_image=[None, "1", "1"],
+        requires=[None, None, "sixel"],
+    )
+    return save_file, source
+
+
+def fake_randofetch(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    exe = bin_dir / "randofetch"
+    exe.write_text("#!/bin/sh\necho FROM-PYTHON $*\n")
+    exe.chmod(0o755)
+    return dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}")
+
+
+def picks(sh: str, snippet_file, env, n=300) -> list[str]:
+    loop = {
+        "bash": f"for i in $(seq {n}); do randofetch_pick; done",
+        "zsh": f"for i in $(seq {n}); do randofetch_pick; done",
+        "fish": f"for i in (seq {n}); randofetch_pick; end",
+    }[sh]
+    r = subprocess.run(
+        [sh, "-c", f"source {snippet_file}; {loop}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return r.stdout.splitlines()
+
+
+@pytest.mark.parametrize("sh", shell.SHELLS)
+def test_snippet_picks_like_the_index(tmp_path, saved, sh):
+    if shutil.which(sh) is None:
+        pytest.skip(f"{sh} is not installed")
+    save_file, source = saved
+    index = load_index(save_file)
+    snippet_file = tmp_path / f"randofetch.{sh}"
+    shell.write_snippet(index, sh, save_file, snippet_file, features={"truecolor"})
+    env = fake_randofetch(tmp_path)
+
+    got = picks(sh, snippet_file, env)
+    expected = {index[i] for i in range(len(index))} - {
+        index[i] for i in range(len(index)) if "--sixel" in index[i]
+    }
+    assert set(got) == expected
+    assert "fastfetch --chafa '/lib/it'\"'\"'s a.png'" in got
+
+    # Editing a file the set was built from makes the snippet defer to randofetch.
+    st = os.stat(snippet_file)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+    assert set(picks(sh, snippet_file, env, n=3)) == {"FROM-PYTHON"}
+
+
+def test_snippet_runs_the_command(tmp_path):
+    save_file = tmp_path / "fetch.idx"
+    write_index(
+        save_file,
+        [f"echo {IMAGE_SLOT}"],
+        images=[("/lib/a&b.png", None)],
+        each_image=["1"],
+    )
+    snippet_file = tmp_path / "randofetch.bash"
+    shell.write_snippet(load_index(save_file), "bash", save_file, snippet_file)
+    r = subprocess.run(
+        ["bash", "-c", f"source {snippet_file}; randofetch_run"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert r.stdout == "/lib/a&b.png\n"
+
+
+def test_regenerate_keeps_features_and_skips_missing(tmp_path, saved):
+    save_file, _ = saved
+    index = load_index(save_file)
+    path_of = lambda sh: tmp_path / "shell" / f"randofetch.{sh}"
+    shell.write_snippet(index, "zsh", save_file, path_of("zsh"), features={"sixel"})
+    shell.write_snippet(index, "fish", save_file, path_of("fish"))
+    assert shell.regenerate(index, save_file, path_of) == [
+        path_of("zsh"),
+        path_of("fish"),
+    ]
+    assert shell.snippet_features(path_of("zsh")) == {"sixel"}
+    assert shell.snippet_features(path_of("fish")) is None
+    assert not path_of("bash").exists()
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from randofetch.cli.fetcher import Fetcher
+from randofetch.cli.index import write_index
+
+# Wall-clock budget for a fast-path pick, including interpreter start up.
+STARTUP_BUDGET = float(os.environ.get("RANDOFETCH_STARTUP_BUDGET", "0.5"))
+HEAVY_MODULES = ("click", "ruamel.yaml", "tqdm", "platformdirs")
+
+
+@pytest.fixture
+def xdg_env(tmp_path: Path):
+    env = dict(os.environ)
+    env["HOME"] = str(tmp_path)
+    env["XDG_CONFIG_HOME"] = str(tmp_path / "config")
+    env["XDG_DATA_HOME"] = str(tmp_path / "data")
+    return env
+
+
+@pytest.fixture
+def saved_set(xdg_env):
+    cfg = Path(xdg_env["XDG_CONFIG_HOME"]) / "randofetch"
+    cfg.mkdir(parents=True)
+    fetchers = [Fetcher(name=f"f{i}", path=f"echo{i}", args="--x") for i in range(3)]
+    write_index(cfg / "fetch.idx", [f.cmd for f in fetchers])
+    return [f.cmd for f in fetchers]
+
+
+def run_pick(env, code=None):
+    args = ["-m", "randofetch"] if code is None else ["-c", code]
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_config_dir_matches_platformdirs(xdg_env, monkeypatch):
+    from randofetch.cli.config import BaseConfig
+    from randofetch.cli.pick import config_dir
+
+    for k in ("HOME", "XDG_CONFIG_HOME", "XDG_DATA_HOME"):
+        monkeypatch.setenv(k, xdg_env[k])
+    assert config_dir() == str(BaseConfig.app_config_path())
+
+
+def test_fast_pick_prints_saved_cmd(xdg_env, saved_set):
+    r = run_pick(xdg_env)
+    assert r.stdout.rstrip("\n") in saved_set
+
+
+def test_fast_pick_skips_heavy_imports(xdg_env, saved_set):
+    code = (
+        "import sys\n"
+        "from randofetch.cli import main\n"
+        "main([])\n"
+        f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    r = run_pick(xdg_env, code)
+    assert r.stdout.splitlines()[-1] == "[]"
+
+
+def test_fast_pick_startup_budget(xdg_env, saved_set):
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        run_pick(xdg_env)
+        best = min(best, time.perf_counter() - start)
+    assert best < STARTUP_BUDGET
+
+
+def test_first_run_from_fresh_home(xdg_env):
+    # No config folder yet: the first run scans instead of failing on the scan lock.
+    r = run_pick(xdg_env)
+    assert "Traceback" not in r.stderr
+    assert (Path(xdg_env["XDG_CONFIG_HOME"]) / "randofetch" / "fetch.idx").exists()
+
+
+def test_implicit_rescan_keeps_stdout_for_the_pick(xdg_env):
+    # A missing set is scanned on the way to a pick; `$(randofetch)` must only get
+    # the picked command, not the scan report.
+    r = run_pick(xdg_env)
+    assert len(r.stdout.splitlines()) <= 1
+    assert "Found" not in r.stdout and "Found" in r.stderr
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from randofetch.cli.index import IMAGE_SLOT, load_index, write_index
+from randofetch.cli.stats import MAX_RECORDS, RING, LatencyStats
+
+
+def test_stats_roundtrip_and_ring(tmp_path):
+    stats = LatencyStats(tmp_path / "latency.bin")
+    for i in range(RING + 4):
+        stats.record("fastfetch", float(i))
+    stats.record("uwufetch", 0.1)
+    stats.save()
+
+    loaded = LatencyStats(tmp_path / "latency.bin")
+    assert len(loaded) == 2
+    n, mean, p95 = loaded.summary("fastfetch")
+    assert n == RING
+    assert min(loaded.samples("fastfetch")) == 4.0
+    assert p95 == RING + 3
+    assert loaded.summary("hyfetch") is None
+
+
+def test_slow_fetchers_drop_out_of_rotation(tmp_path):
+    write_index(tmp_path / "fetch.idx", ["fast", "slow"])
+    index = load_index(tmp_path / "fetch.idx")
+    stats = LatencyStats(tmp_path / "latency.bin")
+    for _ in range(3):
+        stats.record("fast", 0.05)
+        stats.record("slow", 5.0)
+    accept = stats.acceptor(index, budget=1.0, explore=0.0)
+    picks = {index[index.random_entry(accept, tries=64)] for _ in range(200)}
+    assert picks == {"fast"}
+
+    # Not enough samples yet to judge.
+    fresh = LatencyStats(tmp_path / "other.bin")
+    fresh.record("slow", 5.0)
+    assert fresh.within_budget("slow", 1.0)
+
+
+def test_image_rows_are_judged_across_images(tmp_path):
+    write_index(
+        tmp_path / "fetch.idx",
+        ["echo fast", f"slow {IMAGE_SLOT}"],
+        images=[(f"/img/{n}.png", None) for n in range(200)],
+        each_image=[None, "1"],
+    )
+    index = load_index(tmp_path / "fetch.idx")
+    stats = LatencyStats(tmp_path / "latency.bin")
+    # Timeouts of three different images demote the row for all of them.
+    for i in range(1, 4):
+        assert index[i] != index[i + 1]
+        stats.record(index.fetcher(i), float("inf"))
+    stats.save()
+    accept = stats.acceptor(index, budget=1.0, explore=0.0)
+    assert not any(accept(i) for i in range(1, len(index)))
+    assert accept(0)
+    assert len(LatencyStats(stats.path)) == 1
+
+
+def test_stats_file_is_bounded(tmp_path):
+    stats = LatencyStats(tmp_path / "latency.bin")
+    for n in range(MAX_RECORDS + 10):
+        stats.record(f"fetcher{n}", 0.1)
+    stats.save()
+    loaded = LatencyStats(stats.path)
+    assert len(loaded) == MAX_RECORDS
+    assert loaded.summary("fetcher0") is None
+    assert loaded.summary(f"fetcher{MAX_RECORDS + 9}") is not None
+
+    loaded.prune([f"fetcher{MAX_RECORDS}", "gone"])
+    assert len(LatencyStats(stats.path)) == len(loaded) == 1
+
+
+def test_saves_from_threads_keep_every_run(tmp_path):
+    stats = LatencyStats(tmp_path / "latency.bin")
+
+    def run(t):
+        for n in range(20):
+            stats.record(f"fetcher{t}-{n}", float("inf"))
+            stats.save()
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(run, range(8)))
+    loaded = LatencyStats(stats.path)
+    assert len(loaded) == 160
+    assert all(loaded.samples(f"fetcher{t}-19") == [float("inf")] for t in range(8))
@@ -0,0 +1,75 @@
+from randofetch.cli.thumbs import ThumbnailCache, edge_bucket
+
+
+def fake_resize(calls):
+    def resize(src, dst, edge):
+        calls.append((src.name, edge))
+        data = src.read_bytes()
+        if len(data) <= edge:
+            return False
+        dst.write_bytes(data[:edge])
+        return True
+
+    return resize
+
+
+def test_thumbnails_are_made_once_per_content_and_bucket(tmp_path):
+    calls = []
+    cache = ThumbnailCache(tmp_path / "thumbs", resize=fake_resize(calls))
+    big = tmp_path / "big.png"
+    big.write_bytes(b"x" * 1000)
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(b"x" * 1000)
+    small = tmp_path / "small.png"
+    small.write_bytes(b"y" * 10)
+
+    thumb = cache.get(big, 128)
+    assert thumb != big and thumb.read_bytes() == b"x" * 128
+    assert cache.get(big, 128) == thumb
+    assert cache.get(copy, 128) == thumb  # same content, same thumbnail
+    assert cache.get(big, 256) != thumb
+    assert cache.get(small, 128) == small
+    assert cache.get(small, 128) == small
+    assert calls == [("big.png", 128), ("big.png", 256), ("small.png", 128)]
+
+
+def test_thumbnail_eviction_keeps_referenced(tmp_path):
+    cache = ThumbnailCache(tmp_path / "thumbs", max_bytes=300, resize=fake_resize([]))
+    thumbs = []
+    for i in range(4):
+        img = tmp_path / f"{i}.png"
+        img.write_bytes(bytes([i]) * 1000)
+        thumbs.append(cache.get(img, 128))
+    cache.evict(keep=thumbs[:1])
+    assert thumbs[0].exists()
+    assert sum(st.st_size for _, st in cache.entries()) <= 300
+
+
+def test_without_resizer_originals_are_used(tmp_path):
+    img = tmp_path / "a.png"
+    img.write_bytes(b"x" * 1000)
+    assert ThumbnailCache(tmp_path / "thumbs").get(img, 128) == img
+    assert edge_bucket(1) == 128
+    assert edge_bucket(700) == 1024
+    assert edge_bucket(10**6) == 2048
+
+
+def test_prune_drops_images_no_longer_in_the_library(tmp_path):
+    cache = ThumbnailCache(tmp_path / "thumbs", resize=fake_resize([]))
+    big = tmp_path / "big.png"
+    big.write_bytes(b"x" * 1000)
+    gone = tmp_path / "gone.png"
+    gone.write_bytes(b"z" * 1000)
+    small = tmp_path / "small.png"
+    small.write_bytes(b"y" * 10)
+    kept = cache.get(big, 128, "a" * 40)
+    dropped = cache.get(gone, 128, "b" * 40)
+    cache.get(small, 128, "c" * 40)
+    marker = cache.root / "128" / f"{'c' * 40}.orig"
+    assert marker.exists()
+
+    cache.prune(["a" * 40])
+    assert kept.exists()
+    assert not dropped.exists() and not marker.exists()
+    cache.clear()
+    assert not cache.root.exists()
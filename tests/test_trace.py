@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+from randofetch.cli import trace
+
+
+def test_phases_are_noops_when_disabled():
+    trace.enable(None)
+    with trace.phase("select"):
+        pass
+    assert trace.record([])["phases"] == {}
+
+
+def test_trace_log_and_aggregate(tmp_path):
+    log = str(tmp_path / "trace.jsonl")
+    for i in range(20):
+        trace.enable("summary")
+        with trace.phase("index"):
+            pass
+        trace.append_log(log, trace.record(["pick"]))
+    trace.enable(None)
+    agg = trace.aggregate(trace.read_log(log))
+    assert agg["index"]["n"] == 20 and agg["total"]["n"] == 20
+    assert agg["index"]["p50"] <= agg["index"]["p95"]
+
+
+def test_trace_env_json_on_stderr(tmp_path):
+    env = {
+        "HOME": str(tmp_path),
+        "XDG_CONFIG_HOME": str(tmp_path / "config"),
+        "XDG_DATA_HOME": str(tmp_path / "data"),
+        "RANDOFETCH_TRACE": "json",
+        "PATH": "/usr/bin:/bin",
+    }
+    code = "from randofetch.cli import main; main(['--version'])"
+    r = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True)
+    rec = json.loads(r.stderr.decode().strip().splitlines()[-1])
+    assert rec["argv"] == ["--version"]
+    assert "imports" in rec["phases"]
+    assert (tmp_path / "config" / "randofetch" / "trace.jsonl").exists()
+
+
+def test_percentile_nearest_rank():
+    values = [3.0, 1.0, 2.0]
+    assert trace.percentile(values, 50) == 2.0
+    assert trace.percentile(values, 95) == 3.0
+    # A configured calibration_percentile may be a float.
+    assert trace.percentile(values, 95.0) == 3.0
+    assert trace.percentile(values, 99.5) == 3.0
+    assert trace.percentile(list(range(1, 201)), 99.5) == 199
+    assert trace.percentile(values, 0) == 1.0